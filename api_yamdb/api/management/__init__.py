@@ -0,0 +1 @@
+"""Инициализация."""
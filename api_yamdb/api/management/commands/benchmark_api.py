@@ -0,0 +1,395 @@
+"""Замер задержек эндпоинтов api v1."""
+
+import json
+import platform
+import time
+from collections import namedtuple
+from itertools import combinations
+
+from api.v1.filters import GENRE_ALL, GENRE_ANY
+from core.queries import record_queries
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import URLResolver, get_resolver, resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+from reviews.catalog_index import catalog_index
+from reviews.models import Category, Comment, Genre, Review, Title
+from users.models import User
+from users.tokens import UserRefreshToken
+
+BENCHMARK_USERNAME = 'benchmark_admin'
+BENCHMARK_SLUG = 'benchmark'
+PERCENTILES = (50, 95, 99)
+
+Scenario = namedtuple('Scenario', 'name method path data write')
+
+
+def percentile(values, rank):
+    """Перцентиль с линейной интерполяцией по отсортированным значениям."""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * rank / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower
+    )
+
+
+def api_routes(patterns=None, prefix=''):
+    """Имена всех маршрутов под `api/`."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from api_routes(pattern.url_patterns, route)
+        elif route.lstrip('^').startswith('api/'):
+            yield pattern.name or pattern.callback.__name__
+
+
+def route_name(path):
+    """Имя маршрута, который обрабатывает адрес."""
+    match = resolve(path.split('?')[0])
+    return match.url_name or match.func.__name__
+
+
+def title_filters(title, genre):
+    """Все сочетания параметров TitlesFilter для произведения."""
+    word = title.name.split()[0]
+    values = {
+        'name': word,
+        'name__startswith': title.name[:3],
+        'year': title.year,
+        'genre': genre.slug if genre else '',
+        'category': title.category.slug if title.category else '',
+        'search': word,
+    }
+    for size in range(len(values) + 1):
+        for names in combinations(values, size):
+            yield {name: values[name] for name in names}
+
+
+def title_filter_modes(title, genres):
+    """Пары (имя, параметры) TitlesFilter вне сочетаний `title_filters`.
+
+    Режим нескольких жанров и поиск подстроки в slug замеряются
+    отдельно: в сочетаниях они увеличили бы число сценариев в восемь раз.
+    """
+    slugs = ','.join(genre.slug for genre in genres)
+    genre_part = genres[0].slug[:3] if genres else ''
+    category_part = title.category.slug[:3] if title.category else ''
+    for mode in (GENRE_ANY, GENRE_ALL):
+        yield f'genre genre_mode={mode}', {'genre': slugs, 'genre_mode': mode}
+    yield 'genre__contains', {'genre__contains': genre_part}
+    yield 'category__contains', {'category__contains': category_part}
+    yield 'genre__contains category__contains', {
+        'genre__contains': genre_part, 'category__contains': category_part,
+    }
+
+
+def build_scenarios(user, empty_category):
+    """Сценарии для всех маршрутов на самых нагруженных записях.
+
+    Категорию с произведениями удалить нельзя, для удаления
+    используется пустая категория `empty_category`.
+    """
+    title = (
+        Title.objects.select_related('category')
+        .order_by('-score_count', 'id').first()
+    )
+    if title is None:
+        raise CommandError(
+            'В базе нет произведений, сначала запустите generate_data.'
+        )
+    genres = (
+        list(title.genre.order_by('id')[:2])
+        or list(Genre.objects.order_by('id')[:2])
+    )
+    genre = genres[0] if genres else None
+    category = title.category or Category.objects.first()
+    review = (
+        title.reviews.annotate(total=Count('comments'))
+        .order_by('-total', 'id').first()
+    )
+    comment = (
+        Comment.objects.filter(review=review).order_by('id').first()
+        if review else None
+    )
+    titles = f'/api/v1/titles/{title.id}'
+    scenarios = [Scenario('api root', 'get', '/api/v1/', None, False)]
+    title_lists = [
+        (' '.join(filters) or 'no filters', filters)
+        for filters in title_filters(title, genre)
+    ]
+    title_lists += title_filter_modes(title, genres)
+    for name, filters in title_lists:
+        query = '&'.join(f'{key}={value}' for key, value in filters.items())
+        scenarios.append(Scenario(
+            'titles list ' + name, 'get', f'/api/v1/titles/?{query}',
+            None, False,
+        ))
+    scenarios += [
+        Scenario(
+            'titles ordering -rating', 'get',
+            '/api/v1/titles/?ordering=-rating', None, False,
+        ),
+        Scenario(
+            'titles facets', 'get', '/api/v1/titles/facets/', None, False
+        ),
+        Scenario(
+            'titles facets genre', 'get',
+            f'/api/v1/titles/facets/?genre={genre.slug if genre else ""}',
+            None, False,
+        ),
+        Scenario('titles top', 'get', '/api/v1/titles/top/', None, False),
+        Scenario(
+            'titles top category', 'get',
+            '/api/v1/titles/top/?category='
+            + (category.slug if category else ''),
+            None, False,
+        ),
+        Scenario('title detail', 'get', f'{titles}/', None, False),
+        Scenario('title stats', 'get', f'{titles}/stats/', None, False),
+        Scenario('title create', 'post', '/api/v1/titles/', {
+            'name': 'Benchmark', 'year': 2000,
+            'genre': [genre.slug] if genre else [],
+            'category': category.slug if category else '',
+        }, True),
+        Scenario('reviews list', 'get', f'{titles}/reviews/', None, False),
+        Scenario(
+            'reviews list cursor', 'get', f'{titles}/reviews/?cursor=',
+            None, False,
+        ),
+        Scenario('review create', 'post', f'{titles}/reviews/', {
+            'text': 'Benchmark', 'score': 7,
+        }, True),
+        Scenario('genres list', 'get', '/api/v1/genres/', None, False),
+        Scenario(
+            'genres search', 'get',
+            f'/api/v1/genres/?search={genre.name if genre else ""}',
+            None, False,
+        ),
+        Scenario(
+            'categories list', 'get', '/api/v1/categories/', None, False
+        ),
+        Scenario(
+            'users search', 'get',
+            f'/api/v1/users/?search={user.username[:5]}', None, False,
+        ),
+        Scenario(
+            'user detail', 'get', f'/api/v1/users/{user.username}/',
+            None, False,
+        ),
+        Scenario('users me', 'get', '/api/v1/users/me/', None, False),
+        Scenario(
+            'users me update', 'patch', '/api/v1/users/me/',
+            {'bio': 'Benchmark'}, True,
+        ),
+        Scenario('auth signup', 'post', '/api/v1/auth/signup/', {
+            'username': 'benchmark_signup',
+            'email': 'benchmark_signup@example.com',
+        }, True),
+        Scenario('auth token', 'post', '/api/v1/auth/token/', {
+            'username': user.username,
+            'confirmation_code': default_token_generator.make_token(user),
+        }, False),
+    ]
+    if genre:
+        scenarios.append(Scenario(
+            'genre delete', 'delete', f'/api/v1/genres/{genre.slug}/',
+            None, True,
+        ))
+    scenarios.append(Scenario(
+        'category delete', 'delete',
+        f'/api/v1/categories/{empty_category.slug}/', None, True,
+    ))
+    if review:
+        reviews = f'{titles}/reviews/{review.id}'
+        scenarios += [
+            Scenario('review detail', 'get', f'{reviews}/', None, False),
+            Scenario('comments list', 'get', f'{reviews}/comments/', None,
+                     False),
+            Scenario('comment create', 'post', f'{reviews}/comments/', {
+                'text': 'Benchmark',
+            }, True),
+        ]
+    if comment:
+        scenarios.append(Scenario(
+            'comment detail', 'get',
+            f'{titles}/reviews/{review.id}/comments/{comment.id}/',
+            None, False,
+        ))
+    return scenarios
+
+
+class Command(BaseCommand):
+    """Замер p50/p95/p99, пропускной способности и числа запросов к базе.
+
+    Запросы выполняются тестовым клиентом в текущем процессе на текущей
+    базе, обычно заполненной командой generate_data. Изменяющие запросы
+    откатываются, данные после замера не меняются. Результат
+    сохраняется в JSON для сравнения командой compare_benchmarks.
+    """
+
+    help = 'Замер задержек всех эндпоинтов api v1.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help='Количество замеров на сценарий.',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Количество запросов до замеров.',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--filter', default='',
+            help='Замерять только сценарии, в имени которых есть строка.',
+        )
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Файл для результатов.',
+        )
+
+    @override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def handle(self, *args, **options):
+        """Обработчик."""
+        self.options = options
+        user, created = User.objects.get_or_create(
+            username=BENCHMARK_USERNAME,
+            defaults={
+                'email': f'{BENCHMARK_USERNAME}@example.com',
+                'role': User.ADMIN,
+            },
+        )
+        category, category_created = Category.objects.get_or_create(
+            slug=BENCHMARK_SLUG, defaults={'name': 'Benchmark'}
+        )
+        try:
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION='Bearer {}'.format(
+                    UserRefreshToken.for_user(user).access_token
+                )
+            )
+            scenarios = [
+                scenario for scenario in build_scenarios(user, category)
+                if options['filter'] in scenario.name
+            ]
+            if not options['filter']:
+                self.check_coverage(scenarios)
+            results = {}
+            for scenario in scenarios:
+                results[scenario.name] = self.measure(client, scenario)
+                self.stdout.write(self.format_result(
+                    scenario.name, results[scenario.name]
+                ))
+        finally:
+            if created:
+                user.delete()
+            if category_created:
+                category.delete()
+        report = {
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'cold': options['cold'],
+            'dataset': {
+                model._meta.model_name: model.objects.count()
+                for model in (User, Title, Review, Comment)
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {options["output"]}'
+        ))
+
+    def check_coverage(self, scenarios):
+        """Предупреждение о маршрутах без сценария."""
+        covered = {route_name(scenario.path) for scenario in scenarios}
+        missing = sorted(set(api_routes()) - covered)
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                'Нет сценариев для маршрутов: ' + ', '.join(missing)
+            ))
+
+    def prepare(self):
+        """Очистка кэша ответов перед запросом в режиме --cold.
+
+        После очистки кэша индекс каталога загружается заново. В работе
+        это происходит один раз при старте процесса, поэтому загрузка
+        выполняется до замера запроса.
+        """
+        if self.options['cold']:
+            cache.clear()
+            if settings.CATALOG_INDEX:
+                catalog_index.snapshot(wait=True)
+
+    def request(self, client, scenario):
+        """Один запрос сценария, изменения в базе откатываются."""
+        send = getattr(client, scenario.method)
+        if not scenario.write:
+            return send(scenario.path, scenario.data, format='json')
+        with transaction.atomic():
+            response = send(scenario.path, scenario.data, format='json')
+            transaction.set_rollback(True)
+        return response
+
+    def measure(self, client, scenario):
+        """Замер одного сценария.
+
+        Число запросов к базе считается отдельным прогоном, чтобы запись
+        запросов не влияла на время. Пропускная способность считается
+        по времени самих запросов, без подготовки `prepare`.
+        """
+        for _ in range(self.options['warmup']):
+            self.prepare()
+            self.request(client, scenario)
+        self.prepare()
+        with record_queries() as queries:
+            response = self.request(client, scenario)
+        timings = []
+        for _ in range(self.options['iterations']):
+            self.prepare()
+            request_started = time.perf_counter()
+            self.request(client, scenario)
+            timings.append((time.perf_counter() - request_started) * 1000)
+        elapsed = sum(timings) / 1000
+        timings.sort()
+        result = {
+            'method': scenario.method.upper(),
+            'path': scenario.path,
+            'status': response.status_code,
+            'queries': len(queries),
+            'mean_ms': sum(timings) / len(timings) if timings else 0.0,
+            'rps': len(timings) / elapsed if elapsed else 0.0,
+        }
+        for rank in PERCENTILES:
+            result[f'p{rank}_ms'] = percentile(timings, rank)
+        return result
+
+    def format_result(self, name, result):
+        """Строка отчёта по сценарию."""
+        return (
+            f'{name}: {result["status"]}, '
+            f'p50 {result["p50_ms"]:.1f} мс, p95 {result["p95_ms"]:.1f} мс, '
+            f'p99 {result["p99_ms"]:.1f} мс, {result["rps"]:.0f} запр/с, '
+            f'запросов к базе {result["queries"]}'
+        )
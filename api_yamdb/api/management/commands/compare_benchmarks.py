@@ -0,0 +1,90 @@
+"""Сравнение результатов benchmark_api с эталоном."""
+
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+
+def compare_results(baseline, current, metric, threshold, min_delta):
+    """Регрессии текущего замера относительно эталона.
+
+    Задержка считается регрессией, если выросла больше чем на
+    `threshold` (доля) и одновременно больше чем на `min_delta` мс:
+    второе условие отсекает шум на быстрых эндпоинтах. Рост числа
+    запросов к базе - регрессия всегда.
+    """
+    regressions = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+        old, new = before[metric], after[metric]
+        if new > old * (1 + threshold) and new - old > min_delta:
+            regressions.append(
+                f'{name}: {metric} {old:.1f} -> {new:.1f} мс'
+            )
+        if after['queries'] > before['queries']:
+            regressions.append(
+                f'{name}: запросов к базе {before["queries"]} -> '
+                f'{after["queries"]}'
+            )
+        if after['status'] != before['status']:
+            regressions.append(
+                f'{name}: статус {before["status"]} -> {after["status"]}'
+            )
+    return regressions
+
+
+class Command(BaseCommand):
+    """Поиск регрессий производительности перед выкладкой.
+
+    При найденных регрессиях команда завершается с ошибкой, поэтому
+    её можно использовать как шаг проверки в CI.
+    """
+
+    help = 'Сравнение результатов benchmark_api с эталонными.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('baseline', help='JSON с эталонным замером.')
+        parser.add_argument('current', help='JSON с текущим замером.')
+        parser.add_argument(
+            '--metric', default='p95_ms',
+            choices=('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'),
+            help='Сравниваемая задержка.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый относительный рост задержки.',
+        )
+        parser.add_argument(
+            '--min-delta', type=float, default=1.0,
+            help='Рост задержки в мс, который не считается регрессией.',
+        )
+
+    def handle(self, *args, **options):
+        """Обработчик."""
+        baseline = self.read(options['baseline'])
+        current = self.read(options['current'])
+        missing = sorted(set(baseline['results']) - set(current['results']))
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                'Нет в текущем замере: ' + ', '.join(missing)
+            ))
+        regressions = compare_results(
+            baseline, current, options['metric'], options['threshold'],
+            options['min_delta'],
+        )
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            raise CommandError(f'Найдено регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено'))
+
+    def read(self, path):
+        """Результаты замера из файла."""
+        try:
+            with open(path, 'r', encoding='utf-8') as results:
+                return json.load(results)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
@@ -0,0 +1,87 @@
+"""Версионированный кэш ответов каталога.
+
+У каждой модели каталога есть счётчик версии в кэше. Ключ ответа
+содержит версии всех моделей, от которых зависит список, поэтому
+запись увеличивает счётчик и старые ответы просто перестают читаться,
+без перебора и удаления ключей. Счётчики лежат в том же кэше, что и
+ответы, и с общим бэкендом (memcached, redis) видны всем узлам.
+
+Новый счётчик начинается со случайного значения: после вытеснения
+счётчика версия не вернётся к прежней и старые ответы не оживут.
+
+Счётчики живут CATALOG_CACHE_TIMEOUT секунд, как и ответы. Записи,
+не увеличившие счётчик этого процесса (другой процесс с LocMemCache,
+команды загрузки, QuerySet.update), становятся видны не позже чем
+через это время: новый счётчик меняет и ключи ответов, и ETag списков.
+"""
+
+import random
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'catalog:version:{}'
+RESPONSE_KEY = 'catalog:response:{}:{}:{}'
+
+
+def initial_version():
+    """Начальное значение счётчика версии."""
+    return random.getrandbits(48)
+
+
+def get_versions(names):
+    """Текущие версии данных моделей одним обращением к кэшу."""
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = initial_version()
+            cache.add(
+                key, version, timeout=settings.CATALOG_CACHE_TIMEOUT
+            )
+            versions[key] = cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def bump_version(*names):
+    """Инвалидация кэша ответов, зависящих от моделей `names`.
+
+    Версия меняется после фиксации транзакции, иначе параллельный
+    запрос успел бы сохранить старые данные под новой версией.
+    """
+    transaction.on_commit(lambda: increment_versions(names))
+
+
+def increment_versions(names):
+    """Увеличение счётчиков версий моделей."""
+    for name in names:
+        key = VERSION_KEY.format(name)
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+        cache.add(key, initial_version(), timeout=timeout)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), timeout=timeout)
+
+
+def response_key(request, names):
+    """Ключ ответа по адресу, запросу и версиям моделей."""
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    location = md5(
+        f'{request.get_host()}{request.path}?{query}'.encode('utf-8')
+    ).hexdigest()
+    versions = '.'.join(str(version) for version in get_versions(names))
+    return RESPONSE_KEY.format('-'.join(names), versions, location)
+
+
+def get_response(key):
+    """Данные закэшированного ответа или None."""
+    return cache.get(key)
+
+
+def set_response(key, data):
+    """Сохранение данных ответа."""
+    cache.set(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
@@ -0,0 +1,104 @@
+"""Количество произведений по жанрам, категориям и годам."""
+
+from django.db.models import Count
+from reviews.catalog_index import count_bits
+from reviews.models import Category, Genre
+
+# Счётчики измерения не учитывают его собственные фильтры: количество
+# по жанрам считается так, как если бы список запросили с каждым
+# жанром вместо выбранных.
+FACET_FILTERS = {
+    'genre': ('genre', 'genre_mode', 'genre__contains'),
+    'category': ('category', 'category__contains'),
+    'year': ('year',),
+}
+
+
+def sorted_buckets(buckets):
+    """Значения по убыванию количества произведений."""
+    return sorted(buckets, key=lambda bucket: (
+        -bucket['count'], str(bucket.get('slug', bucket.get('year')))
+    ))
+
+
+def named_buckets(model, counts):
+    """Жанры или категории с количеством произведений по id."""
+    return sorted_buckets(
+        {'slug': slug, 'name': name, 'count': counts[pk]}
+        for pk, slug, name in model.objects.filter(
+            id__in=list(counts)
+        ).values_list('id', 'slug', 'name')
+    )
+
+
+def index_facets(filterset, snapshot):
+    """Счётчики по маскам индекса каталога, без запросов к произведениям."""
+    masks = filterset.index_masks(snapshot)
+    counts = {}
+    for dimension, buckets in (
+        ('genre', snapshot.genres),
+        ('category', snapshot.categories),
+        ('year', snapshot.years),
+    ):
+        bits = snapshot.alive
+        for name, mask in masks.items():
+            if name != dimension:
+                bits &= mask
+        counts[dimension] = {}
+        for key, mask in buckets.items():
+            count = count_bits(bits & mask)
+            if count:
+                counts[dimension][key] = count
+    return {
+        'genre': named_buckets(Genre, counts['genre']),
+        'category': named_buckets(Category, counts['category']),
+        'year': sorted_buckets(
+            {'year': year, 'count': count}
+            for year, count in counts['year'].items()
+        ),
+    }
+
+
+def sql_facets(filterset):
+    """Счётчики группировкой: один запрос на измерение.
+
+    Фильтр по части названия жанра соединяет произведения с жанрами,
+    тогда произведения в группе считаются без повторов.
+    """
+    def grouped(dimension, *fields):
+        queryset = filterset.without(FACET_FILTERS[dimension]).qs
+        return (
+            queryset.order_by()
+            .values_list(*fields)
+            .annotate(count=Count('id', distinct=queryset.query.distinct))
+        )
+
+    return {
+        'genre': sorted_buckets(
+            {'slug': slug, 'name': name, 'count': count}
+            for slug, name, count in grouped(
+                'genre', 'genre__slug', 'genre__name'
+            )
+            if slug is not None
+        ),
+        'category': sorted_buckets(
+            {'slug': slug, 'name': name, 'count': count}
+            for slug, name, count in grouped(
+                'category', 'category__slug', 'category__name'
+            )
+            if slug is not None
+        ),
+        'year': sorted_buckets(
+            {'year': year, 'count': count}
+            for year, count in grouped('year', 'year')
+        ),
+    }
+
+
+def title_facets(filterset, index=None):
+    """Счётчики по индексу каталога, если он разрешает фильтры."""
+    if index is not None and filterset.indexable():
+        snapshot = index.snapshot()
+        if snapshot is not None:
+            return index_facets(filterset, snapshot)
+    return sql_facets(filterset)
@@ -1,28 +1,264 @@
 """Фильтр."""
 
+from django.core.validators import EMPTY_VALUES
+from django.db.models.constants import LOOKUP_SEP
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter, SearchFilter
 
-from reviews.models import Title
+from core.text import normalize_text
+from reviews.catalog_index import IndexedTitles
+from reviews.models import Category, Genre, GenreTitle, Title
+from reviews.search import search_titles
+
+
+class NormalizedSearchFilter(SearchFilter):
+    """Поиск по нормализованным полям `*_search`.
+
+    Термы запроса приводятся к тому же виду, что и значения в базе,
+    поэтому регистр и `ё` учитываются правильно и для кириллицы.
+    Префикс `^` в `search_fields` ищет по диапазону индекса.
+    """
+
+    lookup_prefixes = {
+        '^': 'prefix',
+        '=': 'exact',
+        '@': 'search',
+        '$': 'regex',
+    }
+
+    def get_search_terms(self, request):
+        """Нормализованные термы поиска."""
+        return [
+            normalize_text(term)
+            for term in super().get_search_terms(request)
+        ]
+
+    def construct_search(self, field_name):
+        """Регистр уже свёрнут, поэтому lookup регистрозависимые."""
+        lookup = self.lookup_prefixes.get(field_name[0])
+        if lookup:
+            field_name = field_name[1:]
+        else:
+            lookup = 'contains'
+        return LOOKUP_SEP.join([field_name, lookup])
+
+
+class NormalizedPrefixFilter(filters.CharFilter):
+    """Отбор по началу нормализованного поля `*_search`.
+
+    Значение нормализуется как поле, условие `prefix` - диапазон
+    по индексу поля, а не LIKE.
+    """
+
+    def filter(self, qs, value):
+        """Отбор по диапазону индекса."""
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.filter(**{
+            LOOKUP_SEP.join([self.field_name, 'prefix']):
+                normalize_text(value)
+        })
+
+
+class NameFilter(filters.FilterSet):
+    """Фильтр жанров и категорий по началу названия."""
+
+    name__startswith = NormalizedPrefixFilter(field_name='name_search')
+
+
+class UsersFilter(filters.FilterSet):
+    """Фильтр пользователей по началу имени."""
+
+    username__startswith = NormalizedPrefixFilter(
+        field_name='username_search'
+    )
+
+
+class IndexedOrderingFilter(OrderingFilter):
+    """Сортировка по одному полю с индексом.
+
+    `ordering_fields` представления - словарь из значений параметра
+    `ordering` в поля модели. Учитывается первое известное значение,
+    порядок дополняется id в том же направлении: индекс по полю хранит
+    rowid, поэтому страница читается по индексу в любую сторону без
+    сортировки. Без параметра порядок queryset не меняется.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        """Пара (поле, id) с направлением или None."""
+        fields = getattr(view, 'ordering_fields', {})
+        params = request.query_params.get(self.ordering_param, '')
+        for term in params.split(','):
+            term = term.strip()
+            field = fields.get(term.lstrip('-'))
+            if field is not None:
+                prefix = '-' if term.startswith('-') else ''
+                return (prefix + field, prefix + 'id')
+        return None
+
+
+GENRE_ANY = 'any'
+GENRE_ALL = 'all'
+GENRE_MODES = (
+    (GENRE_ANY, 'Любой из жанров'),
+    (GENRE_ALL, 'Все жанры'),
+)
+
+
+def split_slugs(value):
+    """Список slug из значения через запятую."""
+    return list(dict.fromkeys(
+        slug.strip() for slug in value.split(',') if slug.strip()
+    ))
+
+
+def resolve_slugs(model, slugs):
+    """id записей по slug одним запросом, неизвестные slug пропускаются."""
+    return list(
+        model.objects.filter(slug__in=slugs).values_list('id', flat=True)
+    )
+
+
+# Фильтры, которые разрешаются индексом каталога в памяти.
+INDEXED_FILTERS = ('genre', 'genre_mode', 'category', 'year')
+# Фильтры списка titles/top/.
+TOP_FILTERS = ('genre', 'genre_mode', 'category', 'year')
 
 
 class TitlesFilter(filters.FilterSet):
-    """Фильтр произведения."""
+    """Фильтр произведения.
 
-    genre = filters.CharFilter(
+    `genre` и `category` принимают точные slug через запятую.
+    `genre_mode=all` оставляет произведения со всеми указанными жанрами,
+    по умолчанию достаточно любого. Поиск подстроки в slug - параметры
+    `genre__contains` и `category__contains`.
+    """
+
+    genre = filters.CharFilter(method='filter_genre')
+    genre_mode = filters.ChoiceFilter(
+        choices=GENRE_MODES, method='filter_genre_mode'
+    )
+    genre__contains = filters.CharFilter(
         field_name='genre__slug',
         lookup_expr='icontains',
+        distinct=True,
     )
-    category = filters.CharFilter(
+    category = filters.CharFilter(method='filter_category')
+    category__contains = filters.CharFilter(
         field_name='category__slug',
         lookup_expr='icontains',
     )
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='icontains',
-    )
+    name = filters.CharFilter(method='filter_name')
+    name__startswith = NormalizedPrefixFilter(field_name='name_search')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         """Мета класс фильтра."""
 
-        fields = ('name', 'year', 'genre', 'category')
+        fields = (
+            'name', 'name__startswith', 'year', 'genre', 'genre_mode',
+            'genre__contains', 'category', 'category__contains', 'search',
+        )
         model = Title
+
+    def filter_genre(self, queryset, name, value):
+        """Отбор по точным slug жанров.
+
+        Slug переводятся в id одним запросом, затем каждый жанр
+        отбирается подзапросом по индексу (genre, title) GenreTitle:
+        подзапрос не размножает произведения, как соединение.
+        """
+        slugs = split_slugs(value)
+        if not slugs:
+            return queryset
+        genre_ids = resolve_slugs(Genre, slugs)
+        if self.form.cleaned_data.get('genre_mode') == GENRE_ALL:
+            if len(genre_ids) < len(slugs):
+                return queryset.none()
+            for genre_id in genre_ids:
+                queryset = queryset.filter(id__in=GenreTitle.objects.filter(
+                    genre_id=genre_id
+                ).values('title_id'))
+            return queryset
+        return queryset.filter(id__in=GenreTitle.objects.filter(
+            genre_id__in=genre_ids
+        ).values('title_id'))
+
+    def filter_genre_mode(self, queryset, name, value):
+        """Режим учитывается в `filter_genre`."""
+        return queryset
+
+    def filter_category(self, queryset, name, value):
+        """Отбор по точным slug категорий через индекс category_id."""
+        slugs = split_slugs(value)
+        if not slugs:
+            return queryset
+        return queryset.filter(
+            category_id__in=resolve_slugs(Category, slugs)
+        )
+
+    def filter_name(self, queryset, name, value):
+        """Отбор по подстроке нормализованного названия."""
+        return queryset.filter(name_search__contains=normalize_text(value))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск с сортировкой по релевантности."""
+        return search_titles(queryset, value)
+
+    def without(self, names):
+        """Тот же фильтр без параметров `names`."""
+        data = self.data.copy()
+        for name in names:
+            data.pop(name, None)
+        return type(self)(data, queryset=self.queryset, request=self.request)
+
+    def only(self, names):
+        """Тот же фильтр только с параметрами `names`."""
+        return self.without(set(self.data) - set(names))
+
+    def has_filters(self):
+        """Задан ли хотя бы один параметр фильтра."""
+        return any(self.data.get(name) for name in self.filters)
+
+    def indexable(self):
+        """Разрешаются ли параметры индексом каталога в памяти."""
+        if not self.is_valid():
+            return False
+        data = self.form.cleaned_data
+        return all(
+            data.get(name) in (None, '')
+            for name in self.filters if name not in INDEXED_FILTERS
+        )
+
+    def index_masks(self, snapshot):
+        """Маски заданных фильтров по снимку индекса: жанр, категория, год."""
+        data = self.form.cleaned_data
+        masks = {}
+        genres = split_slugs(data.get('genre') or '')
+        if genres:
+            masks['genre'] = snapshot.genre_bits(
+                genres, data.get('genre_mode') == GENRE_ALL
+            )
+        categories = split_slugs(data.get('category') or '')
+        if categories:
+            masks['category'] = snapshot.category_bits(categories)
+        if data.get('year') is not None:
+            masks['year'] = snapshot.year_bits(data['year'])
+        return masks
+
+    def filter_index(self, index, queryset):
+        """Отбор через индекс каталога в памяти.
+
+        None, если параметры неверны, среди них есть фильтры,
+        которые индекс не разрешает, или индекс загружается: тогда
+        список строится запросом.
+        """
+        if not self.indexable():
+            return None
+        snapshot = index.snapshot()
+        if snapshot is None:
+            return None
+        bits = snapshot.alive
+        for mask in self.index_masks(snapshot).values():
+            bits &= mask
+        return IndexedTitles(snapshot, bits, queryset)
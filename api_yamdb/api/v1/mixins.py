@@ -1,11 +1,150 @@
 """Миксины."""
 
-from rest_framework import filters, mixins, viewsets
+from hashlib import md5
 
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import mixins, viewsets
+from rest_framework.response import Response
+
+from . import cache
+from .filters import NameFilter, NormalizedSearchFilter
 from .permissions import IsAdminOrReadOnly
 
 
+def conditional_response(request, validators, build_response):
+    """Ответ 304 по валидаторам или полный ответ с заголовками.
+
+    `validators` - пара (ETag, время изменения в секундах) или None,
+    `build_response` вызывается, только если ответ нужно строить.
+    """
+    if validators is None:
+        return build_response()
+    etag, last_modified = validators
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return not_modified
+    response = build_response()
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """Условные GET запросы для list и retrieve.
+
+    Валидаторы списка строятся из версий моделей `cache_models` в кэше,
+    а у списков, ограниченных родителем, - из `updated` родителя: атрибут
+    `list_parent` называет свойство представления с родительским объектом,
+    его `updated` меняется при каждой записи в список, изменении
+    количества комментариев отзывов и смене имени авторов. Валидаторы
+    объекта - по его `updated`. Неизменившийся ресурс отдаётся ответом 304
+    без выборки и сериализации.
+    """
+
+    list_parent = None
+
+    def get_list_validators(self, request):
+        """ETag и время изменения для списка с учётом фильтров.
+
+        Версии в кэше меняются при каждой записи в модели списка
+        и живут не дольше CATALOG_CACHE_TIMEOUT, ETag из них не требует
+        запроса: агрегат по всему списку без фильтров просматривал бы
+        всю таблицу. Родитель списка уже загружен представлением
+        для проверки адреса, поэтому валидаторы списков отзывов
+        и комментариев тоже не требуют запроса, а не перебирают
+        все строки родителя на каждой странице курсора.
+        """
+        cache_models = getattr(self, 'cache_models', ())
+        if cache_models:
+            return self.make_validators(
+                request, None, None, cache.get_versions(cache_models)
+            )
+        parent = getattr(self, self.list_parent)
+        return self.make_validators(request, None, parent.updated)
+
+    def get_object_validators(self, request):
+        """ETag и время изменения объекта или None, если его нет."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        updated = (
+            self.get_queryset()
+            .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            .values_list('updated', flat=True)
+            .first()
+        )
+        if updated is None:
+            return None
+        return self.make_validators(request, 1, updated)
+
+    def make_validators(self, request, count, updated, versions=()):
+        """Пара (ETag, время изменения в секундах).
+
+        `versions` - версии данных из кэша, если `updated` неизвестно.
+        """
+        last_modified = int(updated.timestamp()) if updated else None
+        state = f'{request.get_full_path()}:{count}:{updated}:{versions}'
+        etag = md5(state.encode('utf-8')).hexdigest()
+        return quote_etag(etag), last_modified
+
+    def list(self, request, *args, **kwargs):
+        """Список с поддержкой условного запроса."""
+        self.validators = self.get_list_validators(request)
+        return conditional_response(
+            request,
+            self.validators,
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Объект с поддержкой условного запроса."""
+        self.validators = self.get_object_validators(request)
+        return conditional_response(
+            request,
+            self.validators,
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
+
+class CachedListMixin:
+    """Кэширование ответа list по версиям моделей из `cache_models`.
+
+    Попадание в кэш возвращает готовые данные без запросов к базе
+    и сериализации. Изменяющие действия должны увеличивать версию
+    своей модели через `cache.bump_version`. Вместе с данными хранятся
+    валидаторы ConditionalGetMixin, если он подключён после этого
+    миксина, так что условный запрос при попадании в кэш тоже
+    не обращается к базе.
+    """
+
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        """Список из кэша или из базы с сохранением в кэш."""
+        key = cache.response_key(request, self.cache_models)
+        cached = cache.get_response(key)
+        if cached is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set_response(
+                    key, (response.data, getattr(self, 'validators', None))
+                )
+            return response
+        data, validators = cached
+        return conditional_response(
+            request, validators, lambda: Response(data)
+        )
+
+
 class CreateListDestroyViewset(
+    CachedListMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
@@ -15,6 +154,17 @@ class CreateListDestroyViewset(
 
     serializer_class = None
     permission_classes = (IsAdminOrReadOnly,)
-    search_fields = ('name',)
+    search_fields = ('name_search',)
     lookup_field = 'slug'
-    filter_backends = (filters.SearchFilter,)
+    filter_backends = (NormalizedSearchFilter, DjangoFilterBackend)
+    filterset_class = NameFilter
+
+    def perform_create(self, serializer):
+        """Создание со сбросом кэша списка."""
+        super().perform_create(serializer)
+        cache.bump_version(*self.cache_models)
+
+    def perform_destroy(self, instance):
+        """Удаление со сбросом кэша списка."""
+        super().perform_destroy(instance)
+        cache.bump_version(*self.cache_models)
@@ -0,0 +1,137 @@
+"""Пагинация."""
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class PubDateCursorPagination(BasePagination):
+    """Keyset пагинация по паре (pub_date, id) от новых к старым.
+
+    Страница выбирается условием по ключу последней записи, а не OFFSET,
+    и без COUNT(*), поэтому любая страница стоит столько же, сколько первая.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Выборка страницы после или перед записью из курсора."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_cursor(request)
+        self.reverse = position is not None and position[2]
+        if position is not None:
+            pub_date, pk, _ = position
+            if self.reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gte=pub_date)
+                    & (Q(pub_date__gt=pub_date) | Q(id__gt=pk))
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lte=pub_date)
+                    & (Q(pub_date__lt=pub_date) | Q(id__lt=pk))
+                )
+        if self.reverse:
+            queryset = queryset.order_by('pub_date', 'id')
+        else:
+            queryset = queryset.order_by('-pub_date', '-id')
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if self.reverse:
+            page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data):
+        """Ответ со ссылками на соседние страницы."""
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        """Ссылка на следующую страницу."""
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        """Ссылка на предыдущую страницу."""
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(
+                self.base_url, self.cursor_query_param, ''
+            )
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        """Разбор курсора вида `pub_date|id|направление`."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = urlsafe_b64decode(encoded.encode('ascii'))
+            pub_date, pk, reverse = position.decode('ascii').split('|')
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk, reverse == 'r'
+
+    def encode_cursor(self, obj, reverse):
+        """Ссылка с курсором на запись `obj`."""
+        position = '|'.join(
+            (obj.pub_date.isoformat(), str(obj.pk), 'r' if reverse else 'f')
+        )
+        encoded = urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """Постраничная пагинация с переключением на курсорную.
+
+    Курсорный режим включается параметром `cursor` в запросе,
+    первая страница запрашивается с пустым значением: `?cursor=`.
+    """
+
+    cursor_pagination_class = PubDateCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Выбор режима пагинации по параметрам запроса."""
+        self.cursor_paginator = None
+        cursor_pagination = self.cursor_pagination_class()
+        if cursor_pagination.cursor_query_param in request.query_params:
+            self.cursor_paginator = cursor_pagination
+            return cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """Ответ в формате выбранного режима."""
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,4 +1,9 @@
-"""Модуль проверки разрешений."""
+"""Модуль проверки разрешений.
+
+Проверки читают только роль, флаги и id пользователя, поэтому работают
+и с пользователем модели, и с пользователем из утверждений токена
+(users.tokens.RoleTokenUser).
+"""
 
 from rest_framework import permissions
 
@@ -12,7 +17,7 @@ class IsAdminModeratorOwnerOrReadOnly(permissions.BasePermission):
             request.method in permissions.SAFE_METHODS
             or request.user.is_admin
             or request.user.is_moderator
-            or obj.author == request.user
+            or obj.author_id == request.user.id
         )
 
     def has_permission(self, request, view):
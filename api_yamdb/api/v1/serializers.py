@@ -2,7 +2,6 @@
 from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from rest_framework.generics import get_object_or_404
 
 from reviews.models import Category, Comment, Genre, Review, Title
 
@@ -29,21 +28,54 @@ class CategorySerializer(serializers.ModelSerializer):
         lookup_field = 'slug'
 
 
-class TitleReadonlySerializer(serializers.ModelSerializer):
-    """Сериализатор произведений для List и Retrieve."""
+class TitleStatsSerializer(serializers.ModelSerializer):
+    """Сериализатор статистики отзывов произведения."""
 
-    rating = serializers.IntegerField(
-        source='reviews__score__avg', read_only=True
+    reviews_count = serializers.IntegerField(
+        source='score_count', read_only=True
+    )
+    scores = serializers.DictField(
+        source='score_histogram', child=serializers.IntegerField(),
+        read_only=True,
     )
+
+    class Meta:
+        """Мета класс статистики."""
+
+        fields = ('reviews_count', 'rating', 'scores')
+        model = Title
+
+
+class TitleReadonlySerializer(serializers.ModelSerializer):
+    """Сериализатор произведений для List и Retrieve.
+
+    Статистика отзывов выводится по параметру запроса `stats=true`.
+    """
+
+    rating = serializers.IntegerField(read_only=True)
     category = CategorySerializer(read_only=True)
     genre = GenreSerializer(read_only=True, many=True)
+    stats = TitleStatsSerializer(source='*', read_only=True)
 
     class Meta:
         """Мета класс произведения."""
 
-        fields = '__all__'
+        fields = (
+            'id', 'name', 'year', 'rating', 'reviews_count', 'description',
+            'genre', 'category', 'stats',
+        )
         model = Title
 
+    def get_fields(self):
+        """Поля произведения, статистика - только по запросу."""
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.query_params.get('stats') not in (
+            '1', 'true'
+        ):
+            del fields['stats']
+        return fields
+
     def validate_title_year(self, value):
         """Валидация года произведения."""
         if value > timezone.now().year:
@@ -53,6 +85,20 @@ class TitleReadonlySerializer(serializers.ModelSerializer):
             )
 
 
+class TopTitleSerializer(TitleReadonlySerializer):
+    """Сериализатор произведений titles/top/ с взвешенным рейтингом."""
+
+    ranking_score = serializers.DecimalField(
+        max_digits=4, decimal_places=2, coerce_to_string=False,
+        read_only=True,
+    )
+
+    class Meta(TitleReadonlySerializer.Meta):
+        """Мета класс произведения."""
+
+        fields = TitleReadonlySerializer.Meta.fields + ('ranking_score',)
+
+
 class TitleSerializer(serializers.ModelSerializer):
     """Сериализатор произведений для Create, Partial_Update и Delete."""
 
@@ -66,7 +112,11 @@ class TitleSerializer(serializers.ModelSerializer):
     class Meta:
         """Мета класс произведения."""
 
-        fields = '__all__'
+        fields = (
+            'id', 'name', 'year', 'rating', 'reviews_count', 'description',
+            'genre', 'category',
+        )
+        read_only_fields = ('rating',)
         model = Title
 
 
@@ -83,8 +133,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         """Валидация отзыва."""
         request = self.context['request']
         author = request.user
-        title_id = self.context.get('view').kwargs.get('title_id')
-        title = get_object_or_404(Title, pk=title_id)
+        title = self.context['view'].title
         if (
             request.method == 'POST'
             and Review.objects.filter(title=title, author=author).exists()
@@ -96,8 +145,10 @@ class ReviewSerializer(serializers.ModelSerializer):
         """Мета класс для ReviewsSerializer."""
 
         model = Review
-        fields = ('id', 'text', 'author', 'score', 'pub_date')
-        read_only_fields = ['title']
+        fields = (
+            'id', 'text', 'author', 'score', 'pub_date', 'comments_count'
+        )
+        read_only_fields = ['title', 'comments_count']
 
 
 class CommentSerializer(serializers.ModelSerializer):
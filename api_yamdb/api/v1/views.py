@@ -1,62 +1,133 @@
 """Классы представления приложения api."""
 
-from django.db.models import Avg
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import exceptions, viewsets
-from rest_framework import filters, viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from reviews.models import Category, Genre, Title
+from reviews.catalog_index import catalog_index
+from reviews.models import Category, Genre, Review, Title, TitleRanking
 
-from .filters import TitlesFilter
-from .mixins import CreateListDestroyViewset
+from . import cache
+from .facets import title_facets
+from .filters import (TOP_FILTERS, IndexedOrderingFilter,
+                      NormalizedSearchFilter, TitlesFilter)
+from .mixins import (CachedListMixin, ConditionalGetMixin,
+                     CreateListDestroyViewset, conditional_response)
+from .pagination import OptionalCursorPagination
 from .permissions import (IsAdminModeratorOwnerOrReadOnly,
                           IsAdminOrReadOnly)
 from .serializers import (CategorySerializer, CommentSerializer,
                           GenreSerializer, ReviewSerializer,
-                          TitleReadonlySerializer, TitleSerializer)
+                          TitleReadonlySerializer, TitleSerializer,
+                          TitleStatsSerializer, TopTitleSerializer)
 
+TOP_LIMIT = 10
+TOP_MAX_LIMIT = 100
 
-class ReviewViewSet(viewsets.ModelViewSet):
+
+class ReviewViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Класс представления Review."""
 
     serializer_class = ReviewSerializer
     permission_classes = (IsAdminModeratorOwnerOrReadOnly,)
+    pagination_class = OptionalCursorPagination
+    list_parent = 'title'
+
+    @cached_property
+    def title(self):
+        """Произведение из url, загружается один раз за запрос."""
+        return get_object_or_404(Title, id=self.kwargs.get('title_id'))
 
     def get_queryset(self):
         """Переопределение получения класса ReviewViewSet."""
-        title = get_object_or_404(Title, id=self.kwargs.get('title_id'))
-        return title.reviews.all()
+        return self.title.reviews.select_related('author')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         """Переопределение создания класса ReviewViewSet."""
-        title = get_object_or_404(Title, id=self.kwargs.get('title_id'))
-        serializer.save(author=self.request.user, title=title)
+        review = serializer.save(author=self.request.user, title=self.title)
+        Title.change_score(self.title.id, added=review.score)
+        cache.bump_version('title')
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Обновление отзыва с пересчётом рейтинга произведения.
+
+        `updated` произведения меняется при любом изменении отзыва:
+        по нему строится ETag списка отзывов.
+        """
+        old_score = (
+            Review.objects.select_for_update()
+            .values_list('score', flat=True)
+            .get(pk=serializer.instance.pk)
+        )
+        review = serializer.save()
+        if review.score != old_score:
+            Title.change_score(
+                review.title_id, added=review.score, removed=old_score
+            )
+            cache.bump_version('title')
+        else:
+            Title.objects.filter(pk=review.title_id).update(
+                updated=timezone.now()
+            )
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Удаление отзыва с пересчётом рейтинга произведения."""
+        instance.delete()
+        Title.change_score(instance.title_id, removed=instance.score)
+        cache.bump_version('title')
 
-class CommentViewSet(viewsets.ModelViewSet):
+
+class CommentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Класс представления Comment."""
 
     serializer_class = CommentSerializer
     permission_classes = (IsAdminModeratorOwnerOrReadOnly,)
+    pagination_class = OptionalCursorPagination
+    list_parent = 'review'
+
+    @cached_property
+    def review(self):
+        """Отзыв из url вместе с проверкой произведения одним запросом."""
+        return get_object_or_404(
+            Review,
+            id=self.kwargs.get('review_id'),
+            title_id=self.kwargs.get('title_id'),
+        )
 
     def get_queryset(self):
         """Переопределение получения класса CommentViewSet."""
-        title = get_object_or_404(Title, id=self.kwargs.get('title_id'))
-        try:
-            review = title.reviews.get(id=self.kwargs.get('review_id'))
-            return review.comments.all()
-        except TypeError:
-            TypeError('У произведения нет такого отзыва!')
+        return self.review.comments.select_related('author')
 
+    @transaction.atomic
     def perform_create(self, serializer):
         """Переопределение создания класса CommentViewSet."""
-        title = get_object_or_404(Title, id=self.kwargs.get('title_id'))
-        try:
-            review = title.reviews.get(id=self.kwargs.get('review_id'))
-            serializer.save(author=self.request.user, review=review)
-        except TypeError:
-            TypeError('У произведения нет такого отзыва!')
+        serializer.save(author=self.request.user, review=self.review)
+        Review.change_comments(self.review.id, 1)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Изменение комментария с отметкой об изменении отзыва.
+
+        По `updated` отзыва строится ETag списка комментариев.
+        """
+        serializer.save()
+        Review.objects.filter(pk=self.review.id).update(
+            updated=timezone.now()
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Удаление комментария с пересчётом количества у отзыва."""
+        instance.delete()
+        Review.change_comments(instance.review_id, -1)
 
 
 class GenreViewSet(CreateListDestroyViewset):
@@ -64,31 +135,51 @@ class GenreViewSet(CreateListDestroyViewset):
 
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('name',)
+    cache_models = ('genre',)
+    filter_backends = (NormalizedSearchFilter, DjangoFilterBackend)
+    search_fields = ('name_search',)
     lookup_field = 'slug'
 
+    def perform_destroy(self, instance):
+        """Удаление жанра с отметкой об изменении его произведений."""
+        Title.objects.filter(genre=instance).update(updated=timezone.now())
+        super().perform_destroy(instance)
+        cache.bump_version('title')
+
 
 class CategoryViewSet(CreateListDestroyViewset):
     """Вью-класс для категорий."""
 
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('name',)
+    cache_models = ('category',)
+    filter_backends = (NormalizedSearchFilter, DjangoFilterBackend)
+    search_fields = ('name_search',)
     lookup_field = "slug"
 
 
-class TitleViewSet(viewsets.ModelViewSet):
+class TitleViewSet(
+    CachedListMixin, ConditionalGetMixin, viewsets.ModelViewSet
+):
     """Вью-класс для произведений."""
 
     queryset = (
-        Title.objects.all().annotate(Avg('reviews__score')).order_by('name')
+        Title.objects.select_related('category')
+        .prefetch_related('genre')
+        .order_by('name', 'id')
     )
     serializer_class = TitleSerializer
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, IndexedOrderingFilter)
     filterset_class = TitlesFilter
+    # Для каждого ключа есть индекс: name, year, rating, score_count.
+    ordering_fields = {
+        'name': 'name',
+        'year': 'year',
+        'rating': 'rating',
+        'reviews_count': 'score_count',
+    }
     permission_classes = (IsAdminOrReadOnly,)
+    cache_models = ('title', 'genre', 'category')
 
     def get_serializer_class(self):
         """Получение произведений."""
@@ -96,6 +187,148 @@ class TitleViewSet(viewsets.ModelViewSet):
             return TitleReadonlySerializer
         return TitleSerializer
 
+    @cached_property
+    def requested_ordering(self):
+        """Сортировка из параметра `ordering` или None."""
+        return IndexedOrderingFilter().get_ordering(self.request, None, self)
+
+    @cached_property
+    def indexed_titles(self):
+        """Список из индекса каталога или None, если нужен запрос.
+
+        Индекс разрешает отбор по жанру, категории и году без
+        соединений, из базы читается только страница. Порядок в индексе -
+        по названию, другая сортировка строится запросом.
+        """
+        if self.action != 'list' or not settings.CATALOG_INDEX:
+            return None
+        if self.requested_ordering not in (None, ('name', 'id')):
+            return None
+        return self.filterset_class(
+            self.request.query_params, request=self.request
+        ).filter_index(catalog_index, self.get_queryset())
+
+    def filter_queryset(self, queryset):
+        """Отбор через индекс каталога, если фильтры им разрешаются."""
+        if self.indexed_titles is not None:
+            return self.indexed_titles
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.requested_ordering is not None:
+            # С соединением SQLite выбирает внешним циклом категории
+            # и сортирует все произведения. Категории страницы читаются
+            # отдельным запросом, а страница - по индексу сортировки.
+            queryset = queryset.select_related(None).prefetch_related(
+                'category'
+            )
+        return queryset
+
+    @action(methods=['GET', ], detail=False)
+    def facets(self, request):
+        """Количество произведений по жанрам, категориям и годам.
+
+        Счётчики учитывают параметры списка, кроме фильтров своего
+        измерения. Ответ кэшируется по версиям моделей каталога.
+        """
+        key = cache.response_key(request, self.cache_models)
+        data = cache.get_response(key)
+        if data is None:
+            filterset = self.filterset_class(
+                request.query_params, queryset=Title.objects.all(),
+                request=request,
+            )
+            if not filterset.is_valid():
+                raise exceptions.ValidationError(filterset.errors)
+            data = title_facets(
+                filterset, catalog_index if settings.CATALOG_INDEX else None
+            )
+            cache.set_response(key, data)
+        return Response(data)
+
+    @action(methods=['GET', ], detail=False)
+    def top(self, request):
+        """Лучшие произведения по взвешенному рейтингу.
+
+        Принимает фильтры по жанру, категории и году и `limit` - размер
+        списка. Порядок берётся из таблицы TitleRanking по индексу,
+        ответ кэшируется по версиям моделей каталога.
+        """
+        key = cache.response_key(request, self.cache_models)
+        data = cache.get_response(key)
+        if data is None:
+            data = TopTitleSerializer(
+                self.top_titles(request), many=True,
+                context=self.get_serializer_context(),
+            ).data
+            cache.set_response(key, data)
+        return Response(data)
+
+    def top_titles(self, request):
+        """Произведения для `top` с взвешенным рейтингом в `ranking_score`."""
+        try:
+            limit = int(request.query_params.get('limit', TOP_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= TOP_MAX_LIMIT:
+            raise exceptions.ValidationError({
+                'limit': [f'Укажите число от 1 до {TOP_MAX_LIMIT}.']
+            })
+        filterset = self.filterset_class(
+            request.query_params, queryset=Title.objects.all(),
+            request=request,
+        ).only(TOP_FILTERS)
+        if not filterset.is_valid():
+            raise exceptions.ValidationError(filterset.errors)
+        ranking = TitleRanking.objects.order_by('-score', 'title_id')
+        if filterset.has_filters():
+            ranking = ranking.filter(
+                title__in=filterset.qs.order_by().values('id')
+            )
+        scores = dict(ranking.values_list('title_id', 'score')[:limit])
+        titles = self.get_queryset().in_bulk(list(scores))
+        # Произведение могли удалить между двумя запросами.
+        top = []
+        for title_id, score in scores.items():
+            title = titles.get(title_id)
+            if title is not None:
+                title.ranking_score = score
+                top.append(title)
+        return top
+
+    @action(methods=['GET', ], detail=True)
+    def stats(self, request, pk=None):
+        """Количество отзывов и распределение оценок произведения.
+
+        Счётчики хранятся в строке произведения и меняются при записи
+        отзывов, ответ читает одну строку и поддерживает условный запрос.
+        """
+        title = get_object_or_404(Title, pk=pk)
+        return conditional_response(
+            request,
+            self.make_validators(request, 1, title.updated),
+            lambda: Response(TitleStatsSerializer(title).data),
+        )
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        """Создание произведения со сбросом кэша списка.
+
+        Жанры сохраняются в той же транзакции, поэтому индекс каталога
+        после фиксации видит их вместе с произведением.
+        """
+        super().perform_create(serializer)
+        cache.bump_version('title')
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Изменение произведения со сбросом кэша списка."""
+        super().perform_update(serializer)
+        cache.bump_version('title')
+
+    def perform_destroy(self, instance):
+        """Удаление произведения со сбросом кэша списка."""
+        super().perform_destroy(instance)
+        cache.bump_version('title')
+
     def update(self, request, *args, **kwargs):
         """Обновление произведения."""
         raise exceptions.MethodNotAllowed(request.method)
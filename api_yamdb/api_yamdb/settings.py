@@ -73,6 +73,49 @@ DATABASES = {
 }
 
 
+# Cache
+# Для нескольких узлов здесь указывается общий бэкенд (memcached, redis),
+# в нём же хранятся счётчики версий кэша каталога.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Время жизни ответов каталога и счётчиков их версий: изменения, которые
+# не увеличили счётчик этого процесса, видны не позже чем через столько
+# секунд.
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Отбор произведений по жанру, категории и году через индекс каталога
+# в памяти процесса (reviews/catalog_index.py). Индекс перезагружается
+# при смене версии в кэше и не реже чем раз в CATALOG_INDEX_MAX_AGE
+# секунд: с LocMemCache только так до процесса доходят изменения других
+# процессов и команд загрузки. С CATALOG_INDEX_BACKGROUND перезагрузка
+# идёт в фоновом потоке, а не в запросе.
+CATALOG_INDEX = True
+CATALOG_INDEX_MAX_AGE = 60
+CATALOG_INDEX_BACKGROUND = True
+
+# Взвешенный рейтинг titles/top/: средняя оценка произведения
+# сдвигается к RANKING_PRIOR_MEAN с весом RANKING_PRIOR_WEIGHT отзывов.
+# После изменения нужно выполнить rebuild_ranking.
+RANKING_PRIOR_MEAN = 5.5
+RANKING_PRIOR_WEIGHT = 10
+
+# Снимки пользователей для аутентификации по JWT (users/authentication.py):
+# до USER_SNAPSHOT_SIZE снимков в памяти процесса живут
+# USER_SNAPSHOT_LOCAL_TIMEOUT секунд, в кэше USER_SNAPSHOT_CACHE -
+# USER_SNAPSHOT_TIMEOUT секунд. Общий кэш задаётся только с общим
+# бэкендом (memcached, redis): в LocMemCache удаление снимка не дошло бы
+# до других процессов.
+USER_SNAPSHOT_SIZE = 1024
+USER_SNAPSHOT_LOCAL_TIMEOUT = 5
+USER_SNAPSHOT_CACHE = None
+USER_SNAPSHOT_TIMEOUT = 60 * 15
+
+
 # Password validation
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -115,7 +158,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
@@ -124,6 +167,7 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(weeks=5),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_USER_CLASS': 'users.tokens.RoleTokenUser',
 }
 
 # Настройки для почты
@@ -0,0 +1 @@
+"""Общие инструменты проекта."""
@@ -0,0 +1,26 @@
+"""Дополнительные lookup для полей моделей."""
+
+from django.db.models import CharField, Lookup
+
+# Символ с наибольшим кодом, верхняя граница диапазона для префикса.
+MAX_CHAR = '\U0010ffff'
+
+
+@CharField.register_lookup
+class Prefix(Lookup):
+    """Поиск по префиксу диапазоном `>= value AND < value + MAX_CHAR`.
+
+    В отличие от `startswith`, который в SQLite превращается в
+    `LIKE ... ESCAPE`, диапазонное условие использует B-tree индекс.
+    """
+
+    lookup_name = 'prefix'
+
+    def as_sql(self, compiler, connection):
+        """SQL условия по диапазону."""
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        params = lhs_params + rhs_params + lhs_params + [
+            param + MAX_CHAR for param in rhs_params
+        ]
+        return f'({lhs} >= {rhs} AND {lhs} < {rhs})', params
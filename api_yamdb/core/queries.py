@@ -0,0 +1,27 @@
+"""Запись запросов к базе для тестов и замеров."""
+
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import connection
+
+Query = namedtuple('Query', 'sql params label')
+
+
+@contextmanager
+def record_queries(label=None):
+    """Запросы к базе, выполненные внутри блока, в порядке выполнения.
+
+    `CaptureQueriesContext` не подходит: с DEBUG в журнал попадают все
+    запросы, а начало каждого запроса к api очищает журнал, и срез
+    от запомненной длины оказывается пустым. `label` - функция без
+    аргументов, её значение в момент запроса сохраняется вместе с ним.
+    """
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        queries.append(Query(sql, params, label() if label else None))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        yield queries
@@ -0,0 +1,10 @@
+"""Нормализация текста для поиска."""
+
+
+def normalize_text(value):
+    """Строка без учёта регистра и различия `ё` и `е`.
+
+    `casefold` корректно сворачивает регистр для кириллицы,
+    в отличие от LIKE в SQLite, который работает только с ASCII.
+    """
+    return (value or '').casefold().replace('ё', 'е')
@@ -1 +1,3 @@
 """Инициализация приложения reviews."""
+
+default_app_config = 'reviews.apps.ReviewsConfig'
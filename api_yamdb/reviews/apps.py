@@ -7,3 +7,9 @@ class ReviewsConfig(AppConfig):
     """Класс конфига приложения reviews."""
 
     name = 'reviews'
+
+    def ready(self):
+        """Подключение сигналов и lookup."""
+        from core import lookups  # noqa: F401
+
+        from . import signals  # noqa: F401
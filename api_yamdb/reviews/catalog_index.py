@@ -0,0 +1,496 @@
+"""Индекс каталога в памяти процесса.
+
+Для каждого жанра, категории и года хранится битовая маска
+произведений. Номер бита - позиция произведения в порядке сортировки
+по названию, поэтому отбор по сочетанию фильтров сводится к операциям
+над целыми числами, а страница списка - к номерам установленных бит.
+Из базы читаются только произведения страницы.
+
+Индекс загружается при старте (wsgi) и обновляется сигналами после
+фиксации транзакции. Согласованность между процессами держится
+на счётчике версии в кэше: процесс, записавший изменение, увеличивает
+счётчик, остальные при расхождении перезагружают индекс целиком.
+С общим бэкендом кэша это работает между узлами, с LocMemCache -
+в пределах процесса, поэтому индекс старше `CATALOG_INDEX_MAX_AGE`
+секунд тоже перезагружается. Массовые загрузки вызывают `invalidate`.
+
+Перезагрузка идёт в фоновом потоке, а не в запросе: пока она идёт,
+устаревший по версии индекс не используется и списки строятся
+запросами к базе, устаревший по возрасту - используется. Так же,
+в фоне и вне блокировки, строится снимок после добавления
+или переименования произведения.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+
+from .models import Category, Genre, GenreTitle, Title
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version:index'
+# Размер куска маски при поиске страницы: сдвиг длинного целого
+# стоит дорого, поэтому маска просматривается кусками.
+CHUNK_BITS = 4096
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+TitleRow = namedtuple('TitleRow', 'name year category_id genre_ids')
+
+
+def current_version():
+    """Текущая версия индекса из кэша.
+
+    Новый счётчик начинается со случайного значения: после очистки
+    кэша версия не совпадёт со старой и индекс перезагрузится.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, random.getrandbits(48), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def increment_version():
+    """Увеличение версии индекса, возвращает новое значение."""
+    current_version()
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return current_version()
+
+
+def to_bits(positions, size):
+    """Битовая маска из номеров бит."""
+    buffer = bytearray(size // 8 + 1)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def count_bits(bits):
+    """Количество установленных бит."""
+    return bin(bits).count('1')
+
+
+class Snapshot:
+    """Неизменяемый снимок индекса для одного запроса.
+
+    Изменения создают новый снимок, поэтому маски, полученные
+    из снимка, всегда согласованы с его порядком произведений.
+    Порядок не меняется после построения и общий у копий снимка:
+    позиция удалённого произведения исключается из масок.
+    """
+
+    def __init__(self, order, alive, genres, categories, years,
+                 genre_slugs, category_slugs):
+        """Инициализация."""
+        self.order = order
+        self.alive = alive
+        self.genres = genres
+        self.categories = categories
+        self.years = years
+        self.genre_slugs = genre_slugs
+        self.category_slugs = category_slugs
+
+    def copy(self):
+        """Копия снимка для изменения масок."""
+        return Snapshot(
+            self.order, self.alive, dict(self.genres),
+            dict(self.categories), dict(self.years), self.genre_slugs,
+            self.category_slugs,
+        )
+
+    def genre_bits(self, slugs, match_all=False):
+        """Произведения с любым или со всеми жанрами из `slugs`."""
+        masks = [
+            self.genres.get(self.genre_slugs.get(slug), 0) for slug in slugs
+        ]
+        bits = self.alive if match_all else 0
+        for mask in masks:
+            bits = bits & mask if match_all else bits | mask
+        return bits
+
+    def category_bits(self, slugs):
+        """Произведения любой из категорий `slugs`."""
+        bits = 0
+        for slug in slugs:
+            bits |= self.categories.get(self.category_slugs.get(slug), 0)
+        return bits
+
+    def year_bits(self, year):
+        """Произведения года `year`."""
+        return self.years.get(year, 0)
+
+    def page(self, bits, start, stop):
+        """id произведений с `start` по `stop` в порядке индекса."""
+        positions = []
+        seen = 0
+        base = 0
+        while bits and len(positions) < stop - start:
+            chunk = bits & CHUNK_MASK
+            size = count_bits(chunk)
+            if seen + size <= start:
+                seen += size
+            else:
+                while chunk and len(positions) < stop - start:
+                    lowest = chunk & -chunk
+                    if seen >= start:
+                        positions.append(base + lowest.bit_length() - 1)
+                    seen += 1
+                    chunk ^= lowest
+            bits >>= CHUNK_BITS
+            base += CHUNK_BITS
+        return [self.order[position] for position in positions]
+
+
+def build_snapshot(titles, genre_slugs, category_slugs):
+    """Снимок по строкам произведений: позиции по названию и маски."""
+    order = sorted(titles, key=lambda title_id: (
+        titles[title_id].name, title_id
+    ))
+    known_genres = set(genre_slugs.values())
+    genres = defaultdict(list)
+    categories = defaultdict(list)
+    years = defaultdict(list)
+    for position, title_id in enumerate(order):
+        row = titles[title_id]
+        for genre_id in row.genre_ids:
+            if genre_id in known_genres:
+                genres[genre_id].append(position)
+        categories[row.category_id].append(position)
+        years[row.year].append(position)
+    size = len(order)
+    return Snapshot(
+        order,
+        (1 << size) - 1,
+        {key: to_bits(value, size) for key, value in genres.items()},
+        {key: to_bits(value, size) for key, value in categories.items()},
+        {key: to_bits(value, size) for key, value in years.items()},
+        genre_slugs,
+        category_slugs,
+    )
+
+
+def positions_of(order):
+    """Позиции произведений в порядке снимка."""
+    return {title_id: position for position, title_id in enumerate(order)}
+
+
+def read_titles(title_ids=None):
+    """Строки произведений из базы, все или с id из `title_ids`."""
+    titles = Title.objects.order_by()
+    links = GenreTitle.objects.order_by()
+    if title_ids is not None:
+        titles = titles.filter(id__in=title_ids)
+        links = links.filter(title_id__in=title_ids)
+    genre_ids = defaultdict(set)
+    for title_id, genre_id in links.values_list('title_id', 'genre_id'):
+        genre_ids[title_id].add(genre_id)
+    return {
+        title_id: TitleRow(
+            name, year, category_id, frozenset(genre_ids[title_id])
+        )
+        for title_id, name, year, category_id in titles.values_list(
+            'id', 'name', 'year', 'category_id'
+        )
+    }
+
+
+def read_slugs(model):
+    """Соответствие slug и id жанров или категорий."""
+    return dict(model.objects.values_list('slug', 'id'))
+
+
+class CatalogIndex:
+    """Индекс каталога процесса: строки произведений и текущий снимок."""
+
+    def __init__(self):
+        """Инициализация."""
+        self.lock = threading.RLock()
+        self.version = None
+        self.loaded_at = None
+        self.titles = {}
+        self.positions = {}
+        self.current = None
+        self.loader = None
+        # Номер изменения строк в памяти и признак того, что снимок
+        # не отражает новые или переименованные произведения.
+        self.generation = 0
+        self.rebuild_pending = False
+
+    def snapshot(self, wait=False):
+        """Актуальный снимок или None, если индекс загружается.
+
+        С `wait` или без CATALOG_INDEX_BACKGROUND индекс загружается
+        сразу, иначе загрузка запускается в фоне.
+        """
+        version = current_version()
+        with self.lock:
+            fresh = version == self.version and not self.rebuild_pending
+            if fresh and not self.expired():
+                return self.current
+            if wait or not settings.CATALOG_INDEX_BACKGROUND:
+                self.load(version)
+                return self.current
+            self.schedule_load()
+            return self.current if fresh else None
+
+    def expired(self):
+        """Старше ли индекс CATALOG_INDEX_MAX_AGE секунд."""
+        return (
+            self.loaded_at is None
+            or time.monotonic() - self.loaded_at
+            > settings.CATALOG_INDEX_MAX_AGE
+        )
+
+    def load(self, version):
+        """Полная загрузка индекса из базы.
+
+        Строки читаются без блокировки. Если за это время индекс
+        изменился, версия не совпадёт и он загрузится ещё раз.
+        """
+        titles = read_titles()
+        snapshot = build_snapshot(
+            titles, read_slugs(Genre), read_slugs(Category)
+        )
+        positions = positions_of(snapshot.order)
+        with self.lock:
+            self.titles = titles
+            self.set_snapshot(snapshot, positions)
+            self.version = version
+            self.loaded_at = time.monotonic()
+
+    def schedule_load(self):
+        """Запуск загрузки в фоновом потоке, если она ещё не идёт."""
+        self.start_loader(self.load_in_background)
+
+    def start_loader(self, target):
+        """Запуск `target` в фоновом потоке, если поток ещё не работает.
+
+        Работающий поток загрузки или перестройки сам увидит изменения,
+        сделанные до его завершения: загрузка - по версии, перестройка -
+        по номеру изменения.
+        """
+        with self.lock:
+            if self.loader is not None and self.loader.is_alive():
+                return
+            self.loader = threading.Thread(
+                target=target, name='catalog-index', daemon=True,
+            )
+            self.loader.start()
+
+    def load_in_background(self):
+        """Загрузка индекса в фоновом потоке со своим соединением."""
+        try:
+            self.load(current_version())
+        except DatabaseError as error:
+            logger.warning('Индекс каталога не загружен: %s', error)
+        finally:
+            connection.close()
+
+    def set_snapshot(self, snapshot, positions):
+        """Замена снимка, построенного заново, и позиций произведений."""
+        self.current = snapshot
+        self.positions = positions
+        self.generation += 1
+        self.rebuild_pending = False
+
+    def schedule_titles(self, title_ids):
+        """Обновление произведений после фиксации транзакции."""
+        if not settings.CATALOG_INDEX:
+            return
+        title_ids = list(title_ids)
+        transaction.on_commit(lambda: self.refresh_titles(title_ids))
+
+    def schedule_catalog(self):
+        """Обновление жанров и категорий после фиксации транзакции."""
+        if not settings.CATALOG_INDEX:
+            return
+        transaction.on_commit(self.refresh_catalog)
+
+    def invalidate(self):
+        """Перезагрузка индекса во всех процессах после фиксации."""
+        transaction.on_commit(increment_version)
+
+    def refresh_titles(self, title_ids):
+        """Перечитывание произведений из базы и правка масок.
+
+        Изменение жанров, категории и года правит биты на месте.
+        Новое или переименованное произведение сдвигает позиции,
+        поэтому снимок строится заново из строк в памяти без блокировки
+        индекса, с CATALOG_INDEX_BACKGROUND - в фоновом потоке, а не
+        в записавшем запросе. Пока он строится, списки строятся
+        запросами к базе.
+        """
+        rows = read_titles(title_ids)
+        with self.lock:
+            if self.current is None:
+                return self.committed()
+            snapshot = self.current.copy()
+            rebuild = False
+            for title_id in title_ids:
+                old = self.titles.get(title_id)
+                new = rows.get(title_id)
+                if new is None:
+                    if old is not None:
+                        self.remove(snapshot, title_id, old)
+                elif (old is None or old.name != new.name
+                      or title_id not in self.positions):
+                    self.titles[title_id] = new
+                    rebuild = True
+                elif old != new:
+                    self.titles[title_id] = new
+                    self.move(snapshot, self.positions[title_id], old, new)
+            self.current = snapshot
+            self.generation += 1
+            self.rebuild_pending = self.rebuild_pending or rebuild
+            self.committed()
+        if rebuild:
+            if settings.CATALOG_INDEX_BACKGROUND:
+                self.start_loader(self.rebuild)
+            else:
+                self.rebuild()
+
+    def rebuild(self):
+        """Построение снимка по строкам в памяти вне блокировки.
+
+        Под блокировкой копируются только строки. Готовый снимок
+        заменяет текущий, если строки за это время не менялись,
+        иначе строится заново по новым строкам.
+        """
+        while True:
+            with self.lock:
+                if not self.rebuild_pending:
+                    return
+                generation = self.generation
+                titles = dict(self.titles)
+                genre_slugs = self.current.genre_slugs
+                category_slugs = self.current.category_slugs
+            snapshot = build_snapshot(titles, genre_slugs, category_slugs)
+            positions = positions_of(snapshot.order)
+            with self.lock:
+                if generation == self.generation:
+                    self.set_snapshot(snapshot, positions)
+                    return
+
+    def refresh_catalog(self):
+        """Перечитывание slug жанров и категорий, удаление жанров."""
+        genre_slugs = read_slugs(Genre)
+        category_slugs = read_slugs(Category)
+        with self.lock:
+            if self.current is None:
+                return self.committed()
+            snapshot = self.current.copy()
+            known_genres = set(genre_slugs.values())
+            snapshot.genres = {
+                genre_id: bits for genre_id, bits in snapshot.genres.items()
+                if genre_id in known_genres
+            }
+            snapshot.genre_slugs = genre_slugs
+            snapshot.category_slugs = category_slugs
+            self.current = snapshot
+            self.generation += 1
+            self.committed()
+
+    def remove(self, snapshot, title_id, row):
+        """Удаление произведения: позиция остаётся пустой.
+
+        У произведения, ещё не попавшего в снимок, позиции нет.
+        """
+        del self.titles[title_id]
+        position = self.positions.pop(title_id, None)
+        if position is None:
+            return
+        self.move(snapshot, position, row, TitleRow(None, None, None, ()))
+        snapshot.alive &= ~(1 << position)
+
+    def move(self, snapshot, position, old, new):
+        """Перенос бита позиции из масок старой строки в маски новой."""
+        bit = 1 << position
+        for masks, old_keys, new_keys in (
+            (snapshot.genres, old.genre_ids, new.genre_ids),
+            (snapshot.categories, {old.category_id}, {new.category_id}),
+            (snapshot.years, {old.year}, {new.year}),
+        ):
+            for key in set(old_keys) - set(new_keys):
+                masks[key] = masks.get(key, 0) & ~bit
+            for key in set(new_keys) - set(old_keys):
+                if key is not None:
+                    masks[key] = masks.get(key, 0) | bit
+
+    def committed(self):
+        """Увеличение версии после локального изменения.
+
+        Если до этого индекс совпадал с версией в кэше, он остаётся
+        актуальным, иначе другой процесс успел записать свои изменения
+        и индекс загружается заново, с CATALOG_INDEX_BACKGROUND - в фоне.
+        """
+        version = increment_version()
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+        elif settings.CATALOG_INDEX_BACKGROUND:
+            self.version = None
+            self.schedule_load()
+        else:
+            self.load(version)
+
+
+class IndexedTitles:
+    """Отобранные по индексу произведения для пагинатора.
+
+    Длина берётся из маски, срез читает из базы только произведения
+    среза и возвращает их в порядке индекса.
+    """
+
+    def __init__(self, snapshot, bits, queryset):
+        """Инициализация."""
+        self.snapshot = snapshot
+        self.bits = bits
+        self.queryset = queryset
+        self.count = count_bits(bits)
+
+    def __len__(self):
+        """Количество произведений."""
+        return self.count
+
+    def __getitem__(self, index):
+        """Произведения среза или одно произведение."""
+        if not isinstance(index, slice):
+            titles = self[index:index + 1]
+            if not titles:
+                raise IndexError(index)
+            return titles[0]
+        start, stop, _ = index.indices(self.count)
+        title_ids = self.snapshot.page(self.bits, start, stop)
+        titles = self.queryset.in_bulk(title_ids)
+        return [
+            titles[title_id] for title_id in title_ids if title_id in titles
+        ]
+
+    def __iter__(self):
+        """Все отобранные произведения."""
+        return iter(self[:self.count])
+
+
+catalog_index = CatalogIndex()
+
+
+def warm_up():
+    """Загрузка индекса при старте процесса.
+
+    До применения миграций таблиц нет, тогда индекс загрузится
+    при первом запросе.
+    """
+    if not settings.CATALOG_INDEX:
+        return
+    try:
+        catalog_index.snapshot(wait=True)
+    except DatabaseError as error:
+        logger.warning('Индекс каталога не загружен: %s', error)
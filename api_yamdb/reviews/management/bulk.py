@@ -0,0 +1,114 @@
+"""Общие функции массовой загрузки данных в базу."""
+
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
+
+from api.v1.cache import bump_version
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from reviews.catalog_index import catalog_index
+from reviews.models import Review, Title, TitleRanking
+from reviews.search import rebuild_index, reindex_titles
+
+# Размер пачки id в условии IN при загрузке и пересчёте после неё:
+# id передаются параметрами запроса, а SQLite до 3.32 принимает
+# не больше 999 параметров.
+RECOUNT_CHUNK = 500
+
+# Изменения дозагрузки: id добавленных и изменённых произведений,
+# произведений с изменёнными отзывами, отзывов с изменёнными
+# комментариями и признак изменения каталога (жанры, категории,
+# произведения, связи с жанрами).
+ImportChanges = namedtuple(
+    'ImportChanges', 'titles scored_titles commented_reviews catalog'
+)
+
+
+def build_object(model, data):
+    """Объект модели из словаря полей с заполненными полями для поиска."""
+    obj = model(**data)
+    if hasattr(obj, 'fill_search_fields'):
+        obj.fill_search_fields()
+    return obj
+
+
+def read_batches(reader, size):
+    """Элементы итератора пачками по `size` штук."""
+    while True:
+        batch = list(islice(reader, size))
+        if not batch:
+            return
+        yield batch
+
+
+def id_chunks(ids, width=1):
+    """id пачками по RECOUNT_CHUNK параметров для условия IN.
+
+    `width` - число параметров на один элемент, например колонок ключа.
+    """
+    return read_batches(iter(ids), RECOUNT_CHUNK // width)
+
+
+@contextmanager
+def keep_auto_now_add(model, columns):
+    """Сохранение переданных дат вместо текущего времени.
+
+    `bulk_create` заполняет поля с `auto_now_add` текущим временем,
+    на время загрузки это отключается для полей из `columns`.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False) and field.name in columns
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def finish_import(models, changes=None):
+    """Пересчёт производных данных после массовой загрузки.
+
+    Сбрасывает последовательности id после вставки с явными id,
+    пересчитывает оценки, комментарии отзывов и взвешенный рейтинг,
+    перестраивает поисковый индекс и сбрасывает кэш и индекс каталога.
+    С `changes` (ImportChanges) пересчитывается только затронутое.
+    """
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+    with transaction.atomic():
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+        if changes is not None:
+            return finish_changes(changes)
+        Title.recount_scores()
+        Review.recount_comments()
+        TitleRanking.rebuild()
+        rebuild_index()
+        bump_version('title', 'genre', 'category')
+        catalog_index.invalidate()
+
+
+def finish_changes(changes):
+    """Пересчёт производных данных только для изменений дозагрузки.
+
+    Неизменные произведения и отзывы не трогаются, их `updated`
+    и валидаторы условных запросов остаются прежними.
+    """
+    for title_ids in id_chunks(sorted(changes.scored_titles)):
+        Title.recount_scores(title_ids)
+        for title_id in title_ids:
+            TitleRanking.refresh(title_id)
+    for review_ids in id_chunks(sorted(changes.commented_reviews)):
+        Review.recount_comments(review_ids)
+    for title_ids in id_chunks(sorted(changes.titles)):
+        reindex_titles(title_ids)
+    if changes.catalog or changes.scored_titles:
+        bump_version('title', 'genre', 'category')
+    if changes.catalog:
+        catalog_index.invalidate()
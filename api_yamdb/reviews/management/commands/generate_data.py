@@ -0,0 +1,261 @@
+"""Генерация синтетических данных для нагрузочных тестов."""
+
+import random
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate, count
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from reviews.management.bulk import (build_object, finish_import,
+                                     keep_auto_now_add, read_batches)
+from reviews.models import Category, Comment, Genre, GenreTitle, Review, Title
+from users.models import User
+
+# Даты отсчитываются от фиксированного момента, чтобы при одном seed
+# данные совпадали независимо от дня запуска.
+PERIOD_END = datetime(2023, 1, 1, tzinfo=timezone.utc)
+PERIOD_DAYS = 5 * 365
+CATEGORY_NAMES = ('Фильм', 'Книга', 'Музыка', 'Сериал', 'Игра', 'Спектакль')
+GENRE_NAMES = (
+    'Драма', 'Комедия', 'Вестерн', 'Фэнтези', 'Фантастика', 'Детектив',
+    'Триллер', 'Сказка', 'Гонзо', 'Ужасы', 'Роман', 'Баллада', 'Рок',
+    'Классика', 'Шансон', 'Мелодрама', 'Приключения', 'Документальный',
+)
+WORDS = (
+    'ёжик', 'туман', 'побег', 'шоушенк', 'крёстный', 'отец', 'звёздные',
+    'войны', 'мастер', 'маргарита', 'тёмная', 'башня', 'ночь', 'город',
+    'последний', 'герой', 'зелёная', 'миля', 'белое', 'солнце', 'пустыни',
+    'весна', 'осень', 'дорога', 'море', 'остров', 'тайна', 'времени',
+    'большой', 'куш', 'красный', 'дракон', 'песня', 'льда', 'пламени',
+)
+ROLES = (User.USER, User.MODERATOR, User.ADMIN)
+ROLE_WEIGHTS = (0.98, 0.015, 0.005)
+
+
+def zipf_cum_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для `size` элементов."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    """Массовая генерация пользователей, каталога, отзывов и комментариев.
+
+    Популярность произведений, категорий, жанров и отзывов распределена
+    по закону Ципфа: немногие записи получают большую часть отзывов
+    и комментариев, как в реальной базе. Результат определяется
+    `--seed`, id выдаются после уже существующих записей.
+    """
+
+    help = 'Генерация синтетических данных заданного объёма.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        for name, default in (
+            ('users', 10000), ('categories', 10), ('genres', 30),
+            ('titles', 5000), ('reviews', 100000), ('comments', 200000),
+        ):
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Количество записей ({default} по умолчанию).',
+            )
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help='Множитель для количества всех записей.',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed генератора случайных чисел.',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа, больше - сильнее перекос.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество записей в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        """Обработчик."""
+        self.random = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+        counts = {
+            name: max(int(options[name] * options['scale']), 1)
+            for name in (
+                'users', 'categories', 'genres', 'titles', 'reviews',
+                'comments',
+            )
+        }
+        users = self.insert(User, self.users, counts['users'])
+        categories = self.insert(
+            Category, self.catalog, CATEGORY_NAMES, counts['categories']
+        )
+        genres = self.insert(
+            Genre, self.catalog, GENRE_NAMES, counts['genres']
+        )
+        titles = self.insert(
+            Title, self.titles, counts['titles'], categories
+        )
+        self.insert(GenreTitle, self.genre_titles, titles, genres)
+        review_dates = array('d')
+        reviews = self.insert(
+            Review, self.reviews, counts['reviews'], titles, users,
+            review_dates,
+        )
+        self.insert(
+            Comment, self.comments, counts['comments'], reviews, users,
+            review_dates,
+        )
+        finish_import([User, Category, Genre, Title, GenreTitle, Review,
+                       Comment])
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы'))
+
+    def insert(self, model, generate, *args):
+        """Вставка пачками, возвращает диапазон id созданных записей.
+
+        id выдаются подряд после последней записи, генератор строк
+        получает первый из них.
+        """
+        start = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        started = time.monotonic()
+        ids = count(start)
+        with keep_auto_now_add(model, ('pub_date',)):
+            for batch in read_batches(generate(start, *args), self.batch_size):
+                with transaction.atomic():
+                    model.objects.bulk_create(
+                        build_object(model, dict(data, id=next(ids)))
+                        for data in batch
+                    )
+        created = next(ids) - start
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {created}, '
+            f'{created / elapsed:.0f} записей/с'
+        )
+        return range(start, start + created)
+
+    def popular(self, ids):
+        """Накопленные веса и id в порядке убывания популярности."""
+        ranked = list(ids)
+        self.random.shuffle(ranked)
+        return ranked, zipf_cum_weights(len(ranked), self.skew)
+
+    def pub_date(self, after=None):
+        """Случайная дата публикации, не раньше `after`."""
+        if after is None:
+            return PERIOD_END - timedelta(
+                seconds=self.random.uniform(0, PERIOD_DAYS * 86400)
+            )
+        return after + timedelta(
+            seconds=self.random.expovariate(1 / 86400)
+        )
+
+    def words(self, low, high):
+        """Случайный текст из `low`-`high` слов."""
+        return ' '.join(
+            self.random.choices(WORDS, k=self.random.randint(low, high))
+        )
+
+    def users(self, start, size):
+        """Пользователи, почти все с ролью user."""
+        roles = self.random.choices(ROLES, ROLE_WEIGHTS, k=size)
+        for user_id, role in enumerate(roles, start):
+            username = f'user{user_id}'
+            yield {
+                'username': username,
+                'email': f'{username}@example.com',
+                'role': role,
+                'password': '!',
+            }
+
+    def catalog(self, start, names, size):
+        """Категории или жанры с уникальными slug."""
+        for number in range(size):
+            name = names[number % len(names)]
+            suffix = number // len(names)
+            yield {
+                'name': f'{name} {suffix}' if suffix else name,
+                'slug': f'synthetic-{start + number}',
+            }
+
+    def titles(self, start, size, categories):
+        """Произведения: свежие годы и популярные категории чаще."""
+        ranked, weights = self.popular(categories)
+        picked = self.random.choices(ranked, cum_weights=weights, k=size)
+        for category_id in picked:
+            age = min(int(self.random.expovariate(1 / 12)), 120)
+            yield {
+                'name': self.words(1, 4).capitalize(),
+                'year': PERIOD_END.year - age,
+                'category_id': category_id,
+                'description': self.words(5, 20),
+            }
+
+    def genre_titles(self, start, titles, genres):
+        """От одного до трёх жанров, популярные жанры чаще."""
+        ranked, weights = self.popular(genres)
+        for title_id in titles:
+            size = min(self.random.randint(1, 3), len(ranked))
+            picked = set()
+            while len(picked) < size:
+                picked.update(
+                    self.random.choices(ranked, cum_weights=weights)
+                )
+            for genre_id in sorted(picked):
+                yield {'title_id': title_id, 'genre_id': genre_id}
+
+    def reviews(self, start, size, titles, users, dates):
+        """Отзывы: большая часть приходится на популярные произведения.
+
+        У произведения не больше одного отзыва от автора, поэтому число
+        отзывов на произведение ограничено числом пользователей.
+        Даты отзывов сохраняются в `dates` для комментариев.
+        """
+        ranked, weights = self.popular(titles)
+        per_title = Counter(
+            self.random.choices(ranked, cum_weights=weights, k=size)
+        )
+        for title_id in titles:
+            quality = self.random.gauss(7, 1.5)
+            authors = self.random.sample(
+                users, min(per_title[title_id], len(users))
+            )
+            for author_id in authors:
+                score = round(self.random.gauss(quality, 1.8))
+                pub_date = self.pub_date()
+                dates.append(pub_date.timestamp())
+                yield {
+                    'title_id': title_id,
+                    'author_id': author_id,
+                    'score': min(max(score, 1), 10),
+                    'text': self.words(5, 40),
+                    'pub_date': pub_date,
+                }
+
+    def comments(self, start, size, reviews, users, dates):
+        """Комментарии: популярные отзывы обсуждают больше."""
+        if not reviews:
+            return
+        ranked, weights = self.popular(range(len(reviews)))
+        per_review = Counter(
+            self.random.choices(ranked, cum_weights=weights, k=size)
+        )
+        for index in sorted(per_review):
+            review_date = datetime.fromtimestamp(
+                dates[index], tz=timezone.utc
+            )
+            for _ in range(per_review[index]):
+                yield {
+                    'review_id': reviews[index],
+                    'author_id': self.random.choice(users),
+                    'text': self.words(3, 25),
+                    'pub_date': self.pub_date(after=review_date),
+                }
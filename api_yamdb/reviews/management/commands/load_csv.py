@@ -1,34 +1,483 @@
 """Импорт данных из csv файлов."""
 
 import csv
+import json
+import os
+import time
+from collections import defaultdict, deque
+from hashlib import md5
+from itertools import islice
+from multiprocessing import Pool
 
 from django.conf import settings
 from django.core.management import BaseCommand
-from reviews.models import Category, Comment, Genre, Review, Title
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from reviews.management.bulk import (ImportChanges, build_object,
+                                     finish_import, id_chunks,
+                                     keep_auto_now_add, read_batches)
+from reviews.management.validators import validate_chunk
+from reviews.models import (Category, Comment, Genre, GenreTitle,
+                            ImportFingerprint, Review, Title, touch_authors)
+from users.authentication import revoke_tokens, user_snapshots
 from users.models import User
 
-TABLES = {
-    User: 'users.csv',
-    Category: 'category.csv',
-    Genre: 'genre.csv',
-    Title: 'titles.csv',
-    Review: 'review.csv',
-    Comment: 'comments.csv',
+# Порядок важен: связанные таблицы загружаются после тех, на которые
+# ссылаются, внешние ключи задаются по id из колонок `*_id`.
+TABLES = (
+    ('users.csv', User),
+    ('category.csv', Category),
+    ('genre.csv', Genre),
+    ('titles.csv', Title),
+    ('genre_title.csv', GenreTitle),
+    ('review.csv', Review),
+    ('comments.csv', Comment),
+)
+# Уникальность по нескольким колонкам проверяется при записи: строки
+# с одинаковым ключом могут попасть в разные пачки и процессы.
+UNIQUE_TOGETHER = {
+    'genre_title.csv': ('title_id', 'genre_id'),
+    'review.csv': ('author_id', 'title_id'),
 }
+DONE = 'done'
+# Родительские строки, производные данные которых зависят от строк
+# таблицы: количество отзывов произведения и комментариев отзыва.
+PARENTS = {
+    Review: 'title_id',
+    Comment: 'review_id',
+}
+CATALOG_MODELS = (Category, Genre, Title, GenreTitle)
+
+
+def row_digest(data):
+    """Отпечаток строки csv."""
+    return md5(
+        '\x1f'.join(str(value) for value in data.values()).encode('utf-8')
+    ).hexdigest()
+
+
+def update_fields(model, columns):
+    """Поля, которые перезаписываются при обновлении строки из csv.
+
+    Кроме колонок файла это поля для поиска, заполняемые
+    `fill_search_fields`, и дата изменения.
+    """
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if not field.primary_key and (
+            field.attname in columns
+            or field.attname.endswith('_search')
+            or getattr(field, 'auto_now', False)
+        )
+    ]
+
+
+def token_changes(users, fields):
+    """id пользователей, у которых обновление меняет поля токена."""
+    fields = [name for name in User.TOKEN_FIELDS if name in fields]
+    if not fields:
+        return []
+    current = {}
+    for ids in id_chunks([user.pk for user in users]):
+        current.update(
+            (row[0], row[1:]) for row in User.objects.filter(
+                pk__in=ids
+            ).values_list('pk', *fields)
+        )
+    return [
+        user.pk for user in users
+        if tuple(getattr(user, name) for name in fields) != current[user.pk]
+    ]
+
+
+def existing_keys(model, columns, keys):
+    """id строк базы по значениям уникального ключа из `keys`.
+
+    Условие - OR равенств всех колонок, каждое ищется по уникальному
+    индексу. Ключи передаются кусками: у каждого несколько параметров.
+    """
+    found = {}
+    for chunk in id_chunks(set(keys), len(columns)):
+        condition = Q()
+        for key in chunk:
+            condition |= Q(**dict(zip(columns, key)))
+        found.update(
+            (row[:-1], row[-1])
+            for row in model.objects.filter(condition)
+            .order_by().values_list(*columns, 'pk')
+        )
+    return found
+
+
+def drop_loaded(model, valid):
+    """Строки пачки, id которых ещё нет в базе."""
+    loaded = set()
+    for ids in id_chunks([data['id'] for _, data in valid]):
+        loaded.update(
+            model.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+    return [(line, data) for line, data in valid if data['id'] not in loaded]
+
+
+def read_records(reader):
+    """Строки csv вместе с номером первой строки записи в файле."""
+    line = reader.line_num + 1
+    for values in reader:
+        yield line, values
+        line = reader.line_num + 1
 
 
 class Command(BaseCommand):
-    """Команда."""
+    """Потоковая загрузка csv пачками в транзакциях.
+
+    Каждая пачка фиксируется отдельной транзакцией, прогресс пишется
+    в файл состояния. После сбоя повторный запуск пропускает
+    загруженные файлы и уже зафиксированные строки текущего файла.
+    Файл состояния пишется после фиксации пачки, поэтому первая пачка
+    продолженной загрузки могла быть уже записана: из неё отбрасываются
+    строки с существующим id. С `--delta` такие строки совпадают
+    с отпечатками, записанными в той же транзакции, и пропускаются.
+
+    Пачки проверяются функцией `validate_chunk`, с `--workers` больше
+    одного - параллельно в пуле процессов. Записывает в базу только
+    основной процесс и строго в порядке строк файла. Строки с ошибками
+    пропускаются и сохраняются в файл отклонённых строк с номерами.
+
+    С `--delta` строки с уже существующим id сравниваются по отпечатку
+    прошлой загрузки: неизменные пропускаются, изменённые обновляются
+    пачкой, новые добавляются. Отпечатки записываются только с `--delta`
+    или `--fingerprints`: полную загрузку, за которой последуют
+    дозагрузки, запускают с `--fingerprints`. Иначе первая дозагрузка
+    считает изменёнными все существующие строки и только сохраняет
+    их отпечатки.
+    """
 
-    def handle(self, *args, **kwargs):
+    help = 'Загрузка данных из csv файлов в базу.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной транзакции.',
+        )
+        parser.add_argument(
+            '--data-dir',
+            default=os.path.join(settings.BASE_DIR, 'static', 'data'),
+            help='Папка с csv файлами.',
+        )
+        parser.add_argument(
+            '--state-file',
+            default=os.path.join(settings.BASE_DIR, '.load_csv_state.json'),
+            help='Файл с прогрессом загрузки для продолжения после сбоя.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать загрузку заново, не учитывая файл состояния.',
+        )
+        parser.add_argument(
+            '--delta', action='store_true',
+            help='Обновить изменённые и добавить новые строки в '
+                 'заполненную базу.',
+        )
+        parser.add_argument(
+            '--fingerprints', action='store_true',
+            help='Сохранить отпечатки строк для последующих запусков '
+                 'с --delta.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Количество процессов для разбора и проверки строк.',
+        )
+        parser.add_argument(
+            '--reject-file',
+            default=os.path.join(settings.BASE_DIR, 'load_csv_rejects.csv'),
+            help='Файл для строк, не прошедших проверку.',
+        )
+
+    def handle(self, *args, **options):
         """Обработчик."""
-        for model, csv_f in TABLES.items():
-            with open(
-                f'{settings.BASE_DIR}/static/data/{csv_f}',
-                'r',
-                encoding='utf-8'
-            ) as csv_file:
-                reader = csv.DictReader(csv_file)
-                model.objects.bulk_create(
-                    model(**data) for data in reader)
+        self.state_file = options['state_file']
+        if options['restart'] and os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        self.resumed = os.path.exists(self.state_file)
+        state = self.read_state()
+        # Файл состояния есть всё время загрузки: сбой после первой
+        # пачки тоже считается прерванной загрузкой.
+        self.write_state(state)
+        # Дозагрузка, продолженная после сбоя, пересчитывает всё:
+        # изменения прерванного запуска не известны.
+        scoped = options['delta'] and not self.resumed
+        self.changed = defaultdict(set)
+        self.parents = defaultdict(set)
+        self.reject_path = options['reject_file']
+        self.reject_file = None
+        self.rejected = 0
+        self.delta = options['delta']
+        self.fingerprints = self.delta or options['fingerprints']
+        workers = options['workers']
+        self.pool = Pool(workers) if workers > 1 else None
+        # Не больше двух пачек на процесс в очереди, чтобы файл
+        # не читался в память целиком, пока запись отстаёт.
+        self.max_pending = max(workers, 1) * 2
+        try:
+            for csv_f, model in TABLES:
+                if state.get(csv_f) == DONE:
+                    self.stdout.write(f'{csv_f}: уже загружен, пропуск')
+                    continue
+                self.load_file(
+                    os.path.join(options['data_dir'], csv_f),
+                    model,
+                    state,
+                    csv_f,
+                    options['batch_size'],
+                )
+        finally:
+            if self.pool is not None:
+                self.pool.terminate()
+            if self.reject_file is not None:
+                self.reject_file.close()
+        finish_import(
+            [model for _, model in TABLES],
+            self.import_changes() if scoped else None,
+        )
+        os.remove(self.state_file)
+        if self.rejected:
+            self.stdout.write(self.style.WARNING(
+                f'Отклонено строк: {self.rejected}, см. {self.reject_path}'
+            ))
         self.stdout.write(self.style.SUCCESS('Все данные загружены'))
+
+    def load_file(self, path, model, state, csv_f, batch_size):
+        """Загрузка одного файла пачками."""
+        loaded = state.get(csv_f, 0)
+        started = time.monotonic()
+        count = 0
+        totals = dict.fromkeys(('inserted', 'updated', 'unchanged'), 0)
+        unique = UNIQUE_TOGETHER.get(csv_f)
+        with open(path, 'r', encoding='utf-8', newline='') as csv_file:
+            reader = csv.reader(csv_file)
+            header = next(reader, [])
+            records = islice(read_records(reader), loaded, None)
+            tasks = (
+                (csv_f, header, batch)
+                for batch in read_batches(records, batch_size)
+            )
+            with keep_auto_now_add(model, header):
+                for valid, rejected in self.validate(tasks):
+                    if unique:
+                        valid = self.drop_duplicates(
+                            model, valid, rejected, unique
+                        )
+                    with transaction.atomic():
+                        fresh = valid
+                        if self.resumed and not self.delta:
+                            fresh = drop_loaded(model, valid)
+                        written = self.write_batch(
+                            model, header, fresh, batch_size
+                        )
+                    self.resumed = False
+                    written['unchanged'] += len(valid) - len(fresh)
+                    for key, value in written.items():
+                        totals[key] += value
+                    self.reject(csv_f, rejected)
+                    count += len(valid) + len(rejected)
+                    state[csv_f] = loaded + count
+                    self.write_state(state)
+                    self.report(csv_f, loaded + count, count, started)
+        state[csv_f] = DONE
+        self.write_state(state)
+        self.stdout.write(
+            f'{csv_f}: добавлено {totals["inserted"]}, '
+            f'обновлено {totals["updated"]}, '
+            f'без изменений {totals["unchanged"]}'
+        )
+
+    def write_batch(self, model, header, valid, batch_size):
+        """Запись пачки проверенных строк и их отпечатков.
+
+        id пачки передаются в условия IN кусками по RECOUNT_CHUNK:
+        размер пачки может превышать ограничение SQLite на число
+        параметров запроса.
+        """
+        table = model._meta.label_lower
+        digests = {
+            data['id']: row_digest(data) for _, data in valid
+        } if self.fingerprints else {}
+        existing, known = set(), {}
+        if self.delta:
+            for ids in id_chunks(digests):
+                existing.update(
+                    model.objects.filter(pk__in=ids)
+                    .values_list('pk', flat=True)
+                )
+            for ids in id_chunks(existing):
+                known.update(
+                    ImportFingerprint.objects.filter(
+                        table=table, row_id__in=ids
+                    ).values_list('row_id', 'digest')
+                )
+        created, changed = [], []
+        for _, data in valid:
+            if data['id'] not in existing:
+                created.append(build_object(model, data))
+            elif known.get(data['id']) != digests[data['id']]:
+                changed.append(build_object(model, data))
+            else:
+                del digests[data['id']]
+        if self.delta:
+            self.track_changes(model, created, changed)
+        model.objects.bulk_create(created, batch_size=batch_size)
+        if changed:
+            self.update_changed(model, header, changed, batch_size)
+        if digests:
+            self.write_fingerprints(table, digests, batch_size)
+        return {
+            'inserted': len(created),
+            'updated': len(changed),
+            'unchanged': len(valid) - len(created) - len(changed),
+        }
+
+    def write_fingerprints(self, table, digests, batch_size):
+        """Замена отпечатков записанных строк."""
+        for ids in id_chunks(digests):
+            ImportFingerprint.objects.filter(
+                table=table, row_id__in=ids
+            ).delete()
+        ImportFingerprint.objects.bulk_create(
+            (
+                ImportFingerprint(table=table, row_id=row_id, digest=digest)
+                for row_id, digest in digests.items()
+            ),
+            batch_size=batch_size,
+        )
+
+    def track_changes(self, model, created, changed):
+        """Запоминание записываемых строк и их родителей до записи.
+
+        Для изменённых строк учитывается и прежний родитель.
+        """
+        self.changed[model].update(obj.pk for obj in created + changed)
+        parent = PARENTS.get(model)
+        if parent is None:
+            return
+        self.parents[model].update(
+            getattr(obj, parent) for obj in created + changed
+        )
+        for ids in id_chunks([obj.pk for obj in changed]):
+            self.parents[model].update(
+                model.objects.filter(pk__in=ids)
+                .values_list(parent, flat=True)
+            )
+
+    def import_changes(self):
+        """Изменения дозагрузки для пересчёта производных данных."""
+        return ImportChanges(
+            titles=self.changed[Title],
+            scored_titles=self.parents[Review],
+            commented_reviews=self.parents[Comment],
+            catalog=any(self.changed[model] for model in CATALOG_MODELS),
+        )
+
+    def update_changed(self, model, header, changed, batch_size):
+        """Обновление изменившихся строк.
+
+        У пользователей со сменой полей токена токены отзываются,
+        снимки всех обновлённых пользователей сбрасываются. При смене
+        имени отмечаются изменёнными их отзывы и комментарии.
+        """
+        fields = update_fields(model, header)
+        now = timezone.now()
+        for obj in changed:
+            for field in model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    setattr(obj, field.attname, now)
+        revoked = renamed = ()
+        if model is User:
+            revoked = token_changes(changed, fields)
+            renamed = token_changes(changed, {'username'} & set(fields))
+        model.objects.bulk_update(changed, fields, batch_size=batch_size)
+        if model is User:
+            revoke_tokens(revoked)
+            for ids in id_chunks(renamed):
+                touch_authors(ids)
+            for user in changed:
+                user_snapshots.invalidate(user.pk)
+
+    def validate(self, tasks):
+        """Проверенные пачки в исходном порядке."""
+        if self.pool is None:
+            yield from map(validate_chunk, tasks)
+            return
+        pending = deque()
+        for task in tasks:
+            pending.append(self.pool.apply_async(validate_chunk, (task,)))
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def drop_duplicates(self, model, valid, rejected, columns):
+        """Отсев строк с уже встречавшимся уникальным ключом.
+
+        Ключи пачки ищутся в базе по уникальному индексу, повторы
+        внутри пачки - по её же ключам: память не растёт с размером
+        файла. Прошлые пачки к этому времени зафиксированы и тоже
+        находятся в базе.
+        """
+        seen = existing_keys(model, columns, [
+            tuple(data[column] for column in columns) for _, data in valid
+        ])
+        unique = []
+        for line, data in valid:
+            key = tuple(data[column] for column in columns)
+            if seen.get(key, data['id']) != data['id']:
+                rejected.append((
+                    line,
+                    'повтор значений {}'.format(', '.join(columns)),
+                    list(data.values()),
+                ))
+                continue
+            seen[key] = data['id']
+            unique.append((line, data))
+        rejected.sort(key=lambda item: item[0])
+        return unique
+
+    def reject(self, csv_f, rejected):
+        """Запись отклонённых строк с номером строки и причиной."""
+        if not rejected:
+            return
+        if self.reject_file is None:
+            self.reject_file = open(
+                self.reject_path, 'a', encoding='utf-8', newline=''
+            )
+            self.reject_writer = csv.writer(self.reject_file)
+            if not self.reject_file.tell():
+                self.reject_writer.writerow(
+                    ('file', 'line', 'error', 'values')
+                )
+        for line, error, values in rejected:
+            self.reject_writer.writerow((csv_f, line, error, *values))
+        self.reject_file.flush()
+        self.rejected += len(rejected)
+
+    def report(self, csv_f, total, count, started):
+        """Вывод прогресса загрузки файла."""
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'{csv_f}: {total} строк, {count / elapsed:.0f} строк/с'
+        )
+
+    def read_state(self):
+        """Прогресс прошлой загрузки."""
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file, 'r', encoding='utf-8') as state_file:
+            return json.load(state_file)
+
+    def write_state(self, state):
+        """Атомарная запись прогресса загрузки."""
+        temp_file = f'{self.state_file}.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_file, self.state_file)
@@ -0,0 +1,35 @@
+"""Пересборка таблицы взвешенного рейтинга произведений."""
+
+import time
+
+from api.v1.cache import bump_version
+from django.core.management import BaseCommand
+from reviews.models import TitleRanking
+
+
+class Command(BaseCommand):
+    """Пересчёт TitleRanking по суммам и количествам оценок произведений.
+
+    Нужен после изменения RANKING_PRIOR_MEAN или RANKING_PRIOR_WEIGHT
+    и после правки оценок в обход API. Произведения читаются кусками
+    по `--chunk-size`, таблица заменяется одной транзакцией.
+    """
+
+    help = 'Пересборка таблицы взвешенного рейтинга для titles/top/.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Количество произведений в одном куске.',
+        )
+
+    def handle(self, *args, **options):
+        """Пересборка и сброс кэша ответов."""
+        started = time.monotonic()
+        total = TitleRanking.rebuild(options['chunk_size'])
+        bump_version('title')
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересобран: {total} произведений '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,96 @@
+"""Сверка и исправление счётчиков отзывов и комментариев."""
+
+from api.v1.cache import bump_version
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from reviews.models import Comment, Review, Title, TitleRanking
+
+
+def read_chunks(model, field, size):
+    """Словари {id: значение счётчика} по `size` записей в порядке id."""
+    last_id = 0
+    while True:
+        chunk = list(
+            model.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', field)[:size]
+        )
+        if not chunk:
+            return
+        yield dict(chunk)
+        last_id = chunk[-1][0]
+
+
+def find_mismatches(stored, related, key):
+    """id записей, у которых счётчик не совпадает с числом строк."""
+    actual = dict(
+        related.objects.filter(**{f'{key}__in': list(stored)})
+        .order_by()
+        .values_list(key)
+        .annotate(count=Count('id'))
+    )
+    return [pk for pk, count in stored.items() if actual.get(pk, 0) != count]
+
+
+def repair_titles(title_ids):
+    """Пересчёт оценок и места в рейтинге произведений."""
+    Title.recount_scores(title_ids)
+    for title_id in title_ids:
+        TitleRanking.refresh(title_id)
+    bump_version('title')
+
+
+# Модель, поле счётчика, связанная модель, ключ связи, исправление.
+COUNTERS = (
+    ('Произведения', Title, 'score_count', Review, 'title_id',
+     repair_titles),
+    ('Отзывы', Review, 'comments_count', Comment, 'review_id',
+     Review.recount_comments),
+)
+
+
+class Command(BaseCommand):
+    """Сверка Title.reviews_count и Review.comments_count с таблицами.
+
+    Счётчики меняются при записи через API, удаление в обход API,
+    например каскадом вместе с пользователем, оставляет их
+    завышенными. Записи читаются кусками по `--chunk-size`, каждый
+    кусок сверяется и исправляется в своей транзакции. С `--check`
+    команда только сообщает о расхождениях и завершается с ошибкой.
+    """
+
+    help = 'Сверка и исправление счётчиков отзывов и комментариев.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Количество записей в одном куске.',
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        """Сверка всех счётчиков."""
+        found = 0
+        for label, model, field, related, key, repair in COUNTERS:
+            checked = 0
+            mismatched = 0
+            for stored in read_chunks(model, field, options['chunk_size']):
+                with transaction.atomic():
+                    mismatches = find_mismatches(stored, related, key)
+                    if mismatches and not options['check']:
+                        repair(mismatches)
+                checked += len(stored)
+                mismatched += len(mismatches)
+            found += mismatched
+            action = 'найдено' if options['check'] else 'исправлено'
+            self.stdout.write(
+                f'{label}: проверено {checked}, {action} {mismatched}'
+            )
+        if options['check'] and found:
+            raise CommandError(f'Неверных счётчиков: {found}')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
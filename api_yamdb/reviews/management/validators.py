@@ -0,0 +1,125 @@
+"""Проверка строк csv перед загрузкой.
+
+Модуль не обращается к базе и к настройкам Django, поэтому функции
+можно выполнять в отдельных процессах пула.
+"""
+
+import re
+from datetime import date
+
+SLUG = re.compile(r'^[-a-zA-Z0-9_]+\Z')
+USERNAME = re.compile(r'^[\w.@+-]+\Z')
+EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+\Z')
+ROLES = ('user', 'moderator', 'admin')
+
+
+class RowError(ValueError):
+    """Ошибка в строке csv."""
+
+
+def integer(row, column, minimum=None, maximum=None):
+    """Целое значение колонки в заданных пределах."""
+    try:
+        value = int(row[column])
+    except (KeyError, TypeError, ValueError):
+        raise RowError(f'{column}: ожидается целое число')
+    if minimum is not None and value < minimum:
+        raise RowError(f'{column}: значение меньше {minimum}')
+    if maximum is not None and value > maximum:
+        raise RowError(f'{column}: значение больше {maximum}')
+    row[column] = value
+
+
+def text(row, column, max_length=None, pattern=None, required=True):
+    """Строковое значение колонки."""
+    value = row.get(column) or ''
+    if required and not value:
+        raise RowError(f'{column}: пустое значение')
+    if max_length is not None and len(value) > max_length:
+        raise RowError(f'{column}: длиннее {max_length} символов')
+    if pattern is not None and value and not pattern.match(value):
+        raise RowError(f'{column}: недопустимый формат')
+
+
+def validate_user(row):
+    """Пользователь."""
+    integer(row, 'id', 1)
+    text(row, 'username', 150, USERNAME)
+    text(row, 'email', 254, EMAIL)
+    if row.get('role') not in ROLES:
+        raise RowError('role: неизвестная роль')
+
+
+def validate_slugged(row):
+    """Категория или жанр."""
+    integer(row, 'id', 1)
+    text(row, 'name', 256)
+    text(row, 'slug', 50, SLUG)
+
+
+def validate_title(row):
+    """Произведение."""
+    integer(row, 'id', 1)
+    text(row, 'name', 500)
+    integer(row, 'year', maximum=date.today().year)
+    integer(row, 'category_id', 1)
+
+
+def validate_genre_title(row):
+    """Связь жанра и произведения."""
+    integer(row, 'id', 1)
+    integer(row, 'title_id', 1)
+    integer(row, 'genre_id', 1)
+
+
+def validate_review(row):
+    """Отзыв."""
+    integer(row, 'id', 1)
+    integer(row, 'title_id', 1)
+    integer(row, 'author_id', 1)
+    integer(row, 'score', 1, 10)
+    text(row, 'text')
+
+
+def validate_comment(row):
+    """Комментарий."""
+    integer(row, 'id', 1)
+    integer(row, 'review_id', 1)
+    integer(row, 'author_id', 1)
+    text(row, 'text')
+
+
+ROW_VALIDATORS = {
+    'users.csv': validate_user,
+    'category.csv': validate_slugged,
+    'genre.csv': validate_slugged,
+    'titles.csv': validate_title,
+    'genre_title.csv': validate_genre_title,
+    'review.csv': validate_review,
+    'comments.csv': validate_comment,
+}
+
+
+def validate_chunk(task):
+    """Проверка пачки строк одного файла.
+
+    `task` - кортеж (имя файла, заголовок, [(номер строки, значения)]).
+    Возвращает проверенные строки как словари с приведёнными типами
+    и отклонённые строки в виде (номер строки, ошибка, значения).
+    """
+    csv_f, header, records = task
+    validator = ROW_VALIDATORS.get(csv_f)
+    valid, rejected = [], []
+    for line, values in records:
+        if len(values) != len(header):
+            rejected.append((line, 'неверное количество колонок', values))
+            continue
+        row = dict(zip(header, values))
+        try:
+            if validator is not None:
+                validator(row)
+        except RowError as error:
+            rejected.append((line, str(error), values))
+            continue
+        valid.append((line, row))
+    return valid, rejected
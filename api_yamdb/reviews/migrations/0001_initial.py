@@ -1,12 +1,9 @@
-# Generated by Django 2.2.16 on 2022-11-24 06:06
+# Generated by Django 2.2.16 on 2026-10-18 17:41
 
 from django.conf import settings
-import django.contrib.auth.models
 import django.core.validators
 from django.db import migrations, models
 import django.db.models.deletion
-import django.utils.timezone
-import reviews.validators
 
 
 class Migration(migrations.Migration):
@@ -14,38 +11,10 @@ class Migration(migrations.Migration):
     initial = True
 
     dependencies = [
-        ('auth', '0011_update_proxy_permissions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
     ]
 
     operations = [
-        migrations.CreateModel(
-            name='User',
-            fields=[
-                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
-                ('password', models.CharField(max_length=128, verbose_name='password')),
-                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
-                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
-                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
-                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
-                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
-                ('username', models.CharField(max_length=150, unique=True, validators=[reviews.validators.validate_username, django.core.validators.RegexValidator(message='Недопустимый никнейм', regex='^[\\w.@+-]+$')])),
-                ('email', models.EmailField(max_length=254, unique=True, validators=[django.core.validators.EmailValidator], verbose_name='Электронная почта')),
-                ('first_name', models.TextField(blank=True, max_length=150, verbose_name='Имя')),
-                ('last_name', models.TextField(blank=True, max_length=150, verbose_name='Фамилия')),
-                ('bio', models.TextField(blank=True, verbose_name='Биография')),
-                ('role', models.CharField(choices=[('user', 'user'), ('admin', 'admin'), ('moderator', 'moderator')], default='user', max_length=30, verbose_name='Роль')),
-                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.Group', verbose_name='groups')),
-                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.Permission', verbose_name='user permissions')),
-            ],
-            options={
-                'verbose_name': 'Пользователь',
-                'verbose_name_plural': 'Пользователи',
-                'ordering': ('id',),
-            },
-            managers=[
-                ('objects', django.contrib.auth.models.UserManager()),
-            ],
-        ),
         migrations.CreateModel(
             name='Category',
             fields=[
@@ -105,7 +74,7 @@ class Migration(migrations.Migration):
             fields=[
                 ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
                 ('text', models.TextField(max_length=200)),
-                ('score', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1, 'Поставьте рейтинг от 1 до 10'), django.core.validators.MaxValueValidator(10, 'Поставьте рейтинг от 1 до 10')], verbose_name='Рейтинг')),
+                ('score', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1, 'Оценка не может быть меньше 1'), django.core.validators.MaxValueValidator(10, 'Оценка не может быть выше 10')], verbose_name='Рейтинг')),
                 ('pub_date', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата публикации')),
                 ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL)),
                 ('title', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='reviews.Title')),
@@ -113,7 +82,7 @@ class Migration(migrations.Migration):
             options={
                 'verbose_name': 'Отзыв',
                 'verbose_name_plural': 'Отзывы',
-                'ordering': ['-pub_date'],
+                'ordering': ('-pub_date',),
             },
         ),
         migrations.AddField(
@@ -133,14 +102,11 @@ class Migration(migrations.Migration):
             options={
                 'verbose_name': 'Комментарий',
                 'verbose_name_plural': 'Комментарии',
+                'ordering': ('-pub_date',),
             },
         ),
         migrations.AddConstraint(
             model_name='review',
             constraint=models.UniqueConstraint(fields=('author', 'title'), name='unique_review'),
         ),
-        migrations.AddConstraint(
-            model_name='user',
-            constraint=models.UniqueConstraint(fields=('username', 'email'), name='unique_username_email'),
-        ),
     ]
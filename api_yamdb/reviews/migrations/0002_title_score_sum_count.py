@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:41
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_scores(apps, schema_editor):
+    Title = apps.get_model('reviews', 'Title')
+    Review = apps.get_model('reviews', 'Review')
+    stats = (
+        Review.objects.order_by()
+        .values('title')
+        .annotate(score_sum=Sum('score'), score_count=Count('id'))
+    )
+    for row in stats.iterator():
+        Title.objects.filter(pk=row['title']).update(
+            score_sum=row['score_sum'],
+            score_count=row['score_count'],
+            rating=row['score_sum'] // row['score_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='title',
+            name='score_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='title',
+            name='score_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:02
+
+from django.db import migrations
+
+CREATE_FTS = (
+    """
+    CREATE VIRTUAL TABLE reviews_title_fts USING fts5(
+        name, description, tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO reviews_title_fts(rowid, name, description)
+    SELECT id, name, description FROM reviews_title
+    """,
+)
+
+DROP_FTS = ('DROP TABLE IF EXISTS reviews_title_fts',)
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_review_comment_pub_date_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_FTS), run_sqlite(DROP_FTS)),
+    ]
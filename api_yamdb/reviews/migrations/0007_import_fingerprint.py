@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0006_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportFingerprint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=64, verbose_name='Таблица')),
+                ('row_id', models.PositiveIntegerField(verbose_name='id строки')),
+                ('digest', models.CharField(max_length=32, verbose_name='Хэш строки')),
+            ],
+            options={
+                'verbose_name': 'Отпечаток строки импорта',
+                'verbose_name_plural': 'Отпечатки строк импорта',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='importfingerprint',
+            constraint=models.UniqueConstraint(fields=('table', 'row_id'), name='unique_import_fingerprint'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_ranking(apps, schema_editor):
+    Title = apps.get_model('reviews', 'Title')
+    TitleRanking = apps.get_model('reviews', 'TitleRanking')
+    weight = settings.RANKING_PRIOR_WEIGHT
+    prior = settings.RANKING_PRIOR_MEAN * weight
+    TitleRanking.objects.bulk_create(
+        TitleRanking(
+            title_id=title_id,
+            score=(prior + score_sum) / (weight + score_count),
+        )
+        for title_id, score_sum, score_count in Title.objects.filter(
+            score_count__gt=0
+        ).values_list('id', 'score_sum', 'score_count')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0009_title_score_histogram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TitleRanking',
+            fields=[
+                ('title', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='reviews.Title', verbose_name='Произведение')),
+                ('score', models.FloatField(verbose_name='Взвешенный рейтинг')),
+            ],
+            options={
+                'verbose_name': 'Взвешенный рейтинг',
+                'verbose_name_plural': 'Взвешенные рейтинги',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='titleranking',
+            index=models.Index(fields=['-score', 'title'], name='ranking_score_title_idx'),
+        ),
+        migrations.RunPython(fill_ranking, migrations.RunPython.noop),
+    ]
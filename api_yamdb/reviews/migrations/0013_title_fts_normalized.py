@@ -0,0 +1,50 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:05
+
+from django.db import migrations
+
+FTS_TABLE = 'reviews_title_fts'
+
+
+def normalize(value):
+    return (value or '').casefold().replace('ё', 'е')
+
+
+def fill_index(transform):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        Title = apps.get_model('reviews', 'Title')
+        schema_editor.execute(f'DELETE FROM {FTS_TABLE}')
+        last_id = 0
+        with schema_editor.connection.cursor() as cursor:
+            while True:
+                rows = list(
+                    Title.objects.filter(id__gt=last_id)
+                    .order_by('id')
+                    .values_list('id', 'name', 'description')[:5000]
+                )
+                if not rows:
+                    return
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                    'VALUES (%s, %s, %s)',
+                    [
+                        (pk, transform(name), transform(description))
+                        for pk, name, description in rows
+                    ],
+                )
+                last_id = rows[-1][0]
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0012_review_comments_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fill_index(normalize), fill_index(lambda value: value)
+        ),
+    ]
@@ -1,16 +1,27 @@
 """Модели приложения reviews."""
 
+from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Case, Count, F, OuterRef, Q, Subquery, Sum,
+                              Value, When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
+from core.text import normalize_text
 from users.models import User
 
+SCORES = range(1, 11)
+
 
 class Category(models.Model):
     """Категории (типы) произведений."""
 
     name = models.CharField('Категория', max_length=256)
     slug = models.SlugField(unique=True, max_length=50)
+    name_search = models.CharField(
+        'Название для поиска', max_length=256, db_index=True, editable=False
+    )
 
     class Meta:
         """Мета класс категории."""
@@ -23,12 +34,24 @@ class Category(models.Model):
         """Описание категории."""
         return self.name
 
+    def fill_search_fields(self):
+        """Заполнение нормализованного названия для поиска."""
+        self.name_search = normalize_text(self.name)
+
+    def save(self, *args, **kwargs):
+        """Сохранение с нормализованным названием для поиска."""
+        self.fill_search_fields()
+        super().save(*args, **kwargs)
+
 
 class Genre(models.Model):
     """Категории жанров."""
 
     name = models.CharField('Жанр', max_length=256)
     slug = models.SlugField(unique=True, max_length=50)
+    name_search = models.CharField(
+        'Название для поиска', max_length=256, db_index=True, editable=False
+    )
 
     class Meta:
         """Мета класс жанра."""
@@ -41,11 +64,23 @@ class Genre(models.Model):
         """Описание жанра."""
         return self.name
 
+    def fill_search_fields(self):
+        """Заполнение нормализованного названия для поиска."""
+        self.name_search = normalize_text(self.name)
+
+    def save(self, *args, **kwargs):
+        """Сохранение с нормализованным названием для поиска."""
+        self.fill_search_fields()
+        super().save(*args, **kwargs)
+
 
 class Title(models.Model):
     """Произведения, к которым пишут отзывы."""
 
     name = models.CharField('Произведение', max_length=500)
+    name_search = models.CharField(
+        'Название для поиска', max_length=500, db_index=True, editable=False
+    )
     year = models.SmallIntegerField('Год выпуска', db_index=True)
     description = models.TextField(blank=True, verbose_name='Описание')
     genre = models.ManyToManyField(
@@ -56,9 +91,23 @@ class Title(models.Model):
         related_name='titles',
         on_delete=models.PROTECT,
         blank=True,
+        db_index=False,
         verbose_name='Категория',
     )
     rating = models.IntegerField('Рейтинг', default=None, null=True)
+    score_sum = models.PositiveIntegerField('Сумма оценок', default=0)
+    score_count = models.PositiveIntegerField('Количество оценок', default=0)
+    score_1 = models.PositiveIntegerField('Оценок 1', default=0)
+    score_2 = models.PositiveIntegerField('Оценок 2', default=0)
+    score_3 = models.PositiveIntegerField('Оценок 3', default=0)
+    score_4 = models.PositiveIntegerField('Оценок 4', default=0)
+    score_5 = models.PositiveIntegerField('Оценок 5', default=0)
+    score_6 = models.PositiveIntegerField('Оценок 6', default=0)
+    score_7 = models.PositiveIntegerField('Оценок 7', default=0)
+    score_8 = models.PositiveIntegerField('Оценок 8', default=0)
+    score_9 = models.PositiveIntegerField('Оценок 9', default=0)
+    score_10 = models.PositiveIntegerField('Оценок 10', default=0)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         """Мета класс произведения."""
@@ -66,11 +115,203 @@ class Title(models.Model):
         ordering = ('name',)
         verbose_name = 'Произведение'
         verbose_name_plural = 'Произведения'
+        # Поиск по категории идёт по первому полю составного индекса,
+        # отдельный индекс на category не нужен. Индексы rating
+        # и score_count служат для сортировки списка.
+        indexes = [
+            models.Index(fields=['name'], name='title_name_idx'),
+            models.Index(fields=['rating'], name='title_rating_idx'),
+            models.Index(
+                fields=['score_count'], name='title_score_count_idx'
+            ),
+            models.Index(
+                fields=['category', 'name'], name='title_category_name_idx'
+            ),
+        ]
 
     def __str__(self):
         """Описание произведения."""
         return self.name
 
+    def fill_search_fields(self):
+        """Заполнение нормализованного названия для поиска."""
+        self.name_search = normalize_text(self.name)
+
+    def save(self, *args, **kwargs):
+        """Сохранение с нормализованным названием для поиска."""
+        self.fill_search_fields()
+        super().save(*args, **kwargs)
+
+    @property
+    def reviews_count(self):
+        """Количество отзывов: у каждого отзыва одна оценка."""
+        return self.score_count
+
+    @property
+    def score_histogram(self):
+        """Количество отзывов с каждой оценкой."""
+        return {score: getattr(self, f'score_{score}') for score in SCORES}
+
+    @classmethod
+    def change_score(cls, title_id, added=None, removed=None):
+        """Атомарное изменение оценок и рейтинга при записи отзыва.
+
+        `added` - оценка нового отзыва или новая оценка изменённого,
+        `removed` - оценка удалённого отзыва или прежняя оценка.
+        Все выражения считаются от старых значений строки в одном UPDATE,
+        поэтому параллельные отзывы не теряют обновления.
+        """
+        score_delta = (added or 0) - (removed or 0)
+        count_delta = (added is not None) - (removed is not None)
+        histogram = {}
+        for score, delta in ((added, 1), (removed, -1)):
+            if score is not None:
+                field = f'score_{score}'
+                histogram[field] = histogram.get(field, F(field)) + delta
+        updated = cls.objects.filter(pk=title_id).update(
+            updated=timezone.now(),
+            score_sum=F('score_sum') + score_delta,
+            score_count=F('score_count') + count_delta,
+            rating=Case(
+                When(score_count=-count_delta, then=Value(None)),
+                default=(
+                    (F('score_sum') + score_delta)
+                    / (F('score_count') + count_delta)
+                ),
+                output_field=models.IntegerField(),
+            ),
+            **histogram,
+        )
+        TitleRanking.refresh(title_id)
+        return updated
+
+    @classmethod
+    def recount_scores(cls, title_ids=None):
+        """Пересчёт оценок произведений по таблице отзывов.
+
+        Пересчитываются все произведения или с id из `title_ids`.
+        """
+        reviews = (
+            Review.objects.filter(title=OuterRef('pk'))
+            .order_by()
+            .values('title')
+        )
+        histogram = {
+            f'score_{score}': Coalesce(Subquery(
+                reviews.filter(score=score)
+                .annotate(c=Count('id')).values('c')
+            ), 0)
+            for score in SCORES
+        }
+        titles = cls.objects.all()
+        if title_ids is not None:
+            titles = titles.filter(id__in=title_ids)
+        return titles.update(
+            updated=timezone.now(),
+            score_sum=Coalesce(
+                Subquery(reviews.annotate(s=Sum('score')).values('s')), 0
+            ),
+            score_count=Coalesce(
+                Subquery(reviews.annotate(c=Count('id')).values('c')), 0
+            ),
+            rating=Subquery(
+                reviews.annotate(
+                    r=Sum('score') / Count('id')
+                ).values('r'),
+                output_field=models.IntegerField(),
+            ),
+            **histogram,
+        )
+
+
+def damped_score(score_sum, score_count):
+    """Средняя оценка, сдвинутая к априорной.
+
+    Как если бы у произведения было ещё RANKING_PRIOR_WEIGHT отзывов
+    с оценкой RANKING_PRIOR_MEAN: одна оценка 10 не обгоняет сотню
+    оценок 9.
+    """
+    weight = settings.RANKING_PRIOR_WEIGHT
+    return (
+        (settings.RANKING_PRIOR_MEAN * weight + score_sum)
+        / (weight + score_count)
+    )
+
+
+class TitleRanking(models.Model):
+    """Взвешенный рейтинг произведений с отзывами для titles/top/.
+
+    Строка меняется вместе с оценками произведения в `change_score`,
+    после массовой загрузки и смены априорной оценки таблица
+    пересобирается командой rebuild_ranking.
+    """
+
+    title = models.OneToOneField(
+        Title,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='ranking',
+        verbose_name='Произведение',
+    )
+    score = models.FloatField('Взвешенный рейтинг')
+
+    class Meta:
+        """Мета класс рейтинга."""
+
+        verbose_name = 'Взвешенный рейтинг'
+        verbose_name_plural = 'Взвешенные рейтинги'
+        indexes = [
+            models.Index(
+                fields=['-score', 'title'], name='ranking_score_title_idx'
+            ),
+        ]
+
+    def __str__(self):
+        """Описание рейтинга."""
+        return f'{self.title_id}: {self.score:.2f}'
+
+    @classmethod
+    def refresh(cls, title_id):
+        """Пересчёт строки произведения по его сумме и количеству оценок."""
+        scores = (
+            Title.objects.filter(pk=title_id)
+            .values_list('score_sum', 'score_count')
+            .first()
+        )
+        if scores is None or not scores[1]:
+            cls.objects.filter(title_id=title_id).delete()
+        else:
+            cls.objects.update_or_create(
+                title_id=title_id, defaults={'score': damped_score(*scores)}
+            )
+
+    @classmethod
+    def rebuild(cls, chunk_size=5000):
+        """Пересборка таблицы кусками по `chunk_size` произведений.
+
+        Выполняется в одной транзакции: читатели видят старую таблицу,
+        пока не зафиксирована новая. Возвращает количество строк.
+        """
+        total = 0
+        last_id = 0
+        with transaction.atomic():
+            cls.objects.all().delete()
+            while True:
+                chunk = list(
+                    Title.objects.filter(id__gt=last_id, score_count__gt=0)
+                    .order_by('id')
+                    .values_list('id', 'score_sum', 'score_count')
+                    [:chunk_size]
+                )
+                if not chunk:
+                    return total
+                cls.objects.bulk_create(
+                    cls(title_id=title_id, score=damped_score(*scores))
+                    for title_id, *scores in chunk
+                )
+                total += len(chunk)
+                last_id = chunk[-1][0]
+
 
 class GenreTitle(models.Model):
     """Вспомогательная модель жанров произведения."""
@@ -78,19 +319,35 @@ class GenreTitle(models.Model):
     title = models.ForeignKey(
         Title,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Произведение',
     )
     genre = models.ForeignKey(
         Genre,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Жанр',
     )
 
     class Meta:
-        """Мета класс жанров произведения."""
+        """Мета класс жанров произведения.
+
+        Уникальный индекс (title, genre) служит для выборки жанров
+        произведения, обратный (genre, title) - для фильтра по жанру.
+        """
 
         verbose_name = 'Жанр произведения'
         verbose_name_plural = 'Произведения и жанры'
+        indexes = [
+            models.Index(
+                fields=['genre', 'title'], name='genretitle_genre_title_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['title', 'genre'], name='unique_genre_title'
+            ),
+        ]
 
     def __str__(self):
         """Описание жанров произведения."""
@@ -111,8 +368,12 @@ class Review(models.Model):
     text = models.TextField(max_length=200)
     score = models.PositiveSmallIntegerField(
         validators=[
-            MinValueValidator(1, 'Оценка не может быть меньше 1'),
-            MaxValueValidator(10, 'Оценка не может быть выше 10'),
+            MinValueValidator(
+                SCORES[0], f'Оценка не может быть меньше {SCORES[0]}'
+            ),
+            MaxValueValidator(
+                SCORES[-1], f'Оценка не может быть выше {SCORES[-1]}'
+            ),
         ],
         verbose_name='Рейтинг',
     )
@@ -121,6 +382,10 @@ class Review(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев', default=0
+    )
 
     class Meta:
         """Мета класс отзыва."""
@@ -128,6 +393,12 @@ class Review(models.Model):
         ordering = ('-pub_date',)
         verbose_name = 'Отзыв'
         verbose_name_plural = 'Отзывы'
+        indexes = [
+            models.Index(
+                fields=['title', 'pub_date', 'id'],
+                name='review_title_pub_date_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["author", "title"], name="unique_review")]
@@ -136,6 +407,47 @@ class Review(models.Model):
         """Описание отзыва."""
         return self.text
 
+    @classmethod
+    def change_comments(cls, review_id, delta):
+        """Атомарное изменение количества комментариев отзыва.
+
+        Количество показано и в списке отзывов, поэтому `updated`
+        меняется и у произведения: по нему строится ETag этого списка.
+        """
+        now = timezone.now()
+        Title.objects.filter(reviews=review_id).update(updated=now)
+        return cls.objects.filter(pk=review_id).update(
+            updated=now,
+            comments_count=F('comments_count') + delta,
+        )
+
+    @classmethod
+    def recount_comments(cls, review_ids=None):
+        """Пересчёт количества комментариев по таблице комментариев.
+
+        Пересчитываются все отзывы или с id из `review_ids`,
+        `updated` меняется и у их произведений, как в `change_comments`.
+        """
+        reviews = cls.objects.all()
+        titles = Title.objects.all()
+        if review_ids is not None:
+            reviews = reviews.filter(id__in=review_ids)
+            titles = titles.filter(
+                id__in=reviews.order_by().values('title_id')
+            )
+        titles.update(updated=timezone.now())
+        comments = (
+            Comment.objects.filter(review=OuterRef('pk'))
+            .order_by()
+            .values('review')
+            .annotate(c=Count('id'))
+            .values('c')
+        )
+        return reviews.update(
+            updated=timezone.now(),
+            comments_count=Coalesce(Subquery(comments), 0),
+        )
+
 
 class Comment(models.Model):
     """Модель Comment."""
@@ -150,6 +462,7 @@ class Comment(models.Model):
     pub_date = models.DateTimeField(
         'Дата добавления', auto_now_add=True, db_index=True
     )
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         """Мета класс комментария."""
@@ -157,7 +470,59 @@ class Comment(models.Model):
         ordering = ('-pub_date',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['review', 'pub_date', 'id'],
+                name='comment_review_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         """Мета класс комментария."""
         return self.text
+
+
+def touch_authors(user_ids):
+    """Отметка об изменении строк, в которых показано имя авторов.
+
+    Имя автора выводится в отзывах и комментариях, а ETag объекта
+    строится по его `updated`, списка отзывов - по `updated`
+    произведения, списка комментариев - по `updated` отзыва.
+    """
+    now = timezone.now()
+    reviews = Review.objects.filter(author_id__in=user_ids).order_by()
+    comments = Comment.objects.filter(author_id__in=user_ids).order_by()
+    Title.objects.filter(
+        id__in=reviews.values('title_id')
+    ).update(updated=now)
+    Review.objects.filter(
+        Q(author_id__in=user_ids) | Q(id__in=comments.values('review_id'))
+    ).update(updated=now)
+    comments.update(updated=now)
+
+
+class ImportFingerprint(models.Model):
+    """Отпечаток строки csv, загруженной командой load_csv.
+
+    По отпечаткам повторная загрузка отличает изменённые строки
+    выгрузки от неизменных, не читая сами записи из базы.
+    """
+
+    table = models.CharField('Таблица', max_length=64)
+    row_id = models.PositiveIntegerField('id строки')
+    digest = models.CharField('Хэш строки', max_length=32)
+
+    class Meta:
+        """Мета класс отпечатка строки."""
+
+        verbose_name = 'Отпечаток строки импорта'
+        verbose_name_plural = 'Отпечатки строк импорта'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['table', 'row_id'], name='unique_import_fingerprint'
+            ),
+        ]
+
+    def __str__(self):
+        """Описание отпечатка."""
+        return f'{self.table}:{self.row_id}'
@@ -0,0 +1,143 @@
+"""Полнотекстовый поиск произведений.
+
+Индекс хранится в виртуальной таблице SQLite FTS5 `reviews_title_fts`
+(миграция 0004_title_fts), rowid строки индекса совпадает с id
+произведения. Индекс обновляется сигналами модели Title, массовые
+загрузки вызывают `rebuild_index`, дозагрузки - `reindex_titles`.
+На других СУБД поиск сводится к `icontains`.
+
+Название и описание хранятся в индексе после `normalize_text`, и слова
+запроса нормализуются так же: токенизатор unicode61 не сворачивает `ё`
+в `е`, а поиск должен совпадать с остальными фильтрами по названию.
+"""
+
+import re
+
+from core.text import normalize_text
+from django.db import connection
+from django.db.models import Q
+
+from .models import Title
+
+FTS_TABLE = 'reviews_title_fts'
+SEARCH_TOKEN = re.compile(r'\w+')
+# Количество произведений, читаемых за раз при перестройке индекса.
+INDEX_CHUNK = 5000
+
+
+def fts_available():
+    """Поддерживает ли текущая база FTS индекс."""
+    return connection.vendor == 'sqlite'
+
+
+def insert_rows(cursor, rows):
+    """Вставка строк (id, название, описание) в индекс.
+
+    Текст нормализуется в Python: SQL функции SQLite сворачивают
+    регистр только для ASCII.
+    """
+    table = connection.ops.quote_name(FTS_TABLE)
+    cursor.executemany(
+        f'INSERT INTO {table}(rowid, name, description) '
+        'VALUES (%s, %s, %s)',
+        [
+            (pk, normalize_text(name), normalize_text(description))
+            for pk, name, description in rows
+        ],
+    )
+
+
+def index_title(title):
+    """Добавление или обновление произведения в индексе."""
+    if not fts_available():
+        return
+    table = connection.ops.quote_name(FTS_TABLE)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', (title.pk,))
+        insert_rows(cursor, [(title.pk, title.name, title.description)])
+
+
+def unindex_title(title_id):
+    """Удаление произведения из индекса."""
+    if not fts_available():
+        return
+    table = connection.ops.quote_name(FTS_TABLE)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', (title_id,))
+
+
+def rebuild_index(chunk_size=INDEX_CHUNK):
+    """Полная перестройка индекса кусками по `chunk_size` произведений."""
+    if not fts_available():
+        return
+    table = connection.ops.quote_name(FTS_TABLE)
+    last_id = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        while True:
+            rows = list(
+                Title.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'name', 'description')[:chunk_size]
+            )
+            if not rows:
+                return
+            insert_rows(cursor, rows)
+            last_id = rows[-1][0]
+
+
+def reindex_titles(title_ids):
+    """Перестройка индекса для произведений с id из `title_ids`."""
+    if not fts_available() or not title_ids:
+        return
+    table = connection.ops.quote_name(FTS_TABLE)
+    title_ids = list(title_ids)
+    placeholders = ', '.join(['%s'] * len(title_ids))
+    rows = Title.objects.filter(id__in=title_ids).values_list(
+        'id', 'name', 'description'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE rowid IN ({placeholders})', title_ids
+        )
+        insert_rows(cursor, rows)
+
+
+def build_match_query(text):
+    """Запрос FTS5 из пользовательской строки.
+
+    Слова нормализуются как текст в индексе. Каждое слово берётся
+    в кавычки, чтобы спецсимволы FTS5 из запроса не ломали синтаксис,
+    и ищется по префиксу.
+    """
+    return ' '.join(
+        '"{}"*'.format(token)
+        for token in SEARCH_TOKEN.findall(normalize_text(text))
+    )
+
+
+def search_titles(queryset, text):
+    """Отбор произведений по тексту с сортировкой по релевантности.
+
+    Индекс присоединяется к выборке как таблица, а не подзапросом:
+    иначе ранг считался бы отдельным поиском для каждой найденной
+    строки, в том числе при подсчёте количества для пагинации.
+    `rowid + 0` не даёт планировщику искать по rowid в индексе: такой
+    поиск повторяет MATCH для каждого произведения из внешнего цикла,
+    например по индексу года, а не один раз на запрос.
+    """
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    if not fts_available():
+        return queryset.filter(
+            Q(name__icontains=text) | Q(description__icontains=text)
+        )
+    table = connection.ops.quote_name(FTS_TABLE)
+    title_table = connection.ops.quote_name(queryset.model._meta.db_table)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{table}.rowid + 0 = {title_table}.id', f'{table} MATCH %s'],
+        params=(match,),
+        select={'search_rank': f'{table}.rank'},
+    ).order_by('search_rank', 'name')
@@ -0,0 +1,104 @@
+"""Сигналы приложения reviews."""
+
+from api.v1.cache import bump_version
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import User
+
+from .catalog_index import catalog_index
+from .models import (Category, Comment, Genre, GenreTitle, Review, Title,
+                     TitleRanking, touch_authors)
+from .search import index_title, unindex_title
+
+
+@receiver(post_save, sender=Title)
+def title_saved(sender, instance, **kwargs):
+    """Обновление поискового индекса и индекса каталога."""
+    index_title(instance)
+    catalog_index.schedule_titles([instance.pk])
+
+
+@receiver(post_delete, sender=Title)
+def title_deleted(sender, instance, **kwargs):
+    """Удаление произведения из поискового индекса и индекса каталога."""
+    unindex_title(instance.pk)
+    catalog_index.schedule_titles([instance.pk])
+
+
+@receiver(post_save, sender=GenreTitle)
+def genre_title_saved(sender, instance, **kwargs):
+    """Обновление жанров произведения в индексе каталога.
+
+    Менеджер связей и удаление связей сигналов post_save/post_delete
+    не отправляют, а обработчик post_delete отключил бы быстрое
+    каскадное удаление связей при удалении жанра. Поэтому api меняет
+    жанры в одной транзакции с сохранением произведения, а индекс
+    перечитывает произведение после фиксации.
+    """
+    catalog_index.schedule_titles([instance.title_id])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    """Обновление slug жанров и категорий в индексе каталога."""
+    catalog_index.schedule_catalog()
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, created, **kwargs):
+    """Отметка об изменении отзывов и комментариев при смене имени.
+
+    Сигнал приходит до того, как `User.save` запоминает новые
+    значения полей токена, поэтому в них ещё прежнее имя.
+    """
+    loaded = getattr(instance, 'loaded_token_fields', {})
+    if created or loaded.get('username', instance.username) == (
+        instance.username
+    ):
+        return
+    touch_authors([instance.pk])
+
+
+@receiver(pre_delete, sender=User)
+def author_deleting(sender, instance, **kwargs):
+    """Запоминание произведений и отзывов удаляемого пользователя.
+
+    Отзывы и комментарии удаляются каскадом без сигналов, поэтому
+    оценки произведений и количество комментариев чужих отзывов
+    пересчитываются после удаления пользователя.
+    """
+    instance.reviewed_title_ids = list(
+        Review.objects.filter(author=instance)
+        .order_by()
+        .values_list('title_id', flat=True)
+        .distinct()
+    )
+    instance.commented_review_ids = list(
+        Comment.objects.filter(author=instance)
+        .exclude(review__author=instance)
+        .order_by()
+        .values_list('review_id', flat=True)
+        .distinct()
+    )
+
+
+@receiver(post_delete, sender=User)
+def author_deleted(sender, instance, **kwargs):
+    """Пересчёт счётчиков после каскадного удаления отзывов и комментариев.
+
+    Сигнал приходит внутри транзакции удаления, после удаления
+    зависимых строк.
+    """
+    review_ids = getattr(instance, 'commented_review_ids', [])
+    if review_ids:
+        Review.recount_comments(review_ids)
+    title_ids = getattr(instance, 'reviewed_title_ids', [])
+    if not title_ids:
+        return
+    Title.recount_scores(title_ids)
+    for title_id in title_ids:
+        TitleRanking.refresh(title_id)
+    bump_version('title')
@@ -0,0 +1,3 @@
+"""Инициализация приложения users."""
+
+default_app_config = 'users.apps.UsersConfig'
@@ -1,5 +1,13 @@
+"""Конфиг приложения users."""
+
 from django.apps import AppConfig
 
 
 class UsersConfig(AppConfig):
+    """Класс конфига приложения users."""
+
     name = 'users'
+
+    def ready(self):
+        """Подключение сигналов."""
+        from . import signals  # noqa: F401
@@ -0,0 +1,252 @@
+"""Аутентификация по JWT со снимками пользователей.
+
+После проверки токена разрешениям нужны только роль, флаги и id
+пользователя, поэтому вместо выборки из базы на каждый запрос
+пользователь собирается из снимка полей. Снимки лежат в ограниченном
+LRU в памяти процесса и, если задан `USER_SNAPSHOT_CACHE`, в общем
+кэше, откуда их берут другие процессы.
+
+Токены с утверждениями роли (users/tokens.py) в безопасных запросах
+дают пользователя из утверждений, после сверки версии токенов снимок
+не нужен. Изменяющим запросам нужен пользователь модели из снимка.
+
+Изменение пользователя удаляет снимок сразу и ещё раз после фиксации
+транзакции: запрос, прочитавший старые данные до фиксации, не оставит
+их в кэше. Другие процессы держат свой снимок в памяти не дольше
+`USER_SNAPSHOT_LOCAL_TIMEOUT` секунд.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken)
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tokens import (VERSION_CLAIM, current_token_version,
+                     forget_token_version, has_role_claims)
+
+SNAPSHOT_KEY = 'users:snapshot:{}'
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'bio', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'token_version',
+)
+
+
+def snapshot_user(values):
+    """Пользователь из значений снимка.
+
+    Остальные поля, например пароль, отложены и читаются из базы
+    при обращении. `from_db` ждёт значения в порядке полей модели.
+    """
+    fields = dict(zip(SNAPSHOT_FIELDS, values))
+    names = [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname in fields
+    ]
+    return User.from_db(
+        'default', names, [fields[name] for name in names]
+    )
+
+
+class UserSnapshots:
+    """Снимки пользователей в LRU процесса и в общем кэше."""
+
+    def __init__(self):
+        """Инициализация."""
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generation = 0
+
+    @property
+    def shared(self):
+        """Общий кэш снимков или None."""
+        alias = settings.USER_SNAPSHOT_CACHE
+        return caches[alias] if alias else None
+
+    def get(self, user_id):
+        """Пользователь из снимка, при промахе снимок читается из базы."""
+        values = self.get_local(user_id)
+        if values is None:
+            values = self.get_shared(user_id)
+        if values is None:
+            values = self.load(user_id)
+        if values is None:
+            return None
+        return snapshot_user(values)
+
+    def get_local(self, user_id):
+        """Снимок из памяти процесса, если он не устарел."""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            expires, values = entry
+            if expires < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return values
+
+    def get_shared(self, user_id):
+        """Снимок из общего кэша с сохранением в память процесса."""
+        if self.shared is None:
+            return None
+        generation = self.generation
+        values = self.shared.get(SNAPSHOT_KEY.format(user_id))
+        if values is not None:
+            self.set_local(user_id, values, generation)
+        return values
+
+    def load(self, user_id):
+        """Снимок из базы с сохранением в оба кэша."""
+        generation = self.generation
+        values = User.objects.filter(id=user_id).values_list(
+            *SNAPSHOT_FIELDS
+        ).first()
+        if values is None:
+            return None
+        if self.set_local(user_id, values, generation) and self.shared:
+            self.shared.set(
+                SNAPSHOT_KEY.format(user_id), values,
+                timeout=settings.USER_SNAPSHOT_TIMEOUT,
+            )
+        return values
+
+    def set_local(self, user_id, values, generation):
+        """Сохранение снимка в LRU процесса с вытеснением старых.
+
+        Если за время чтения снимки удалялись, снимок мог устареть
+        и не сохраняется.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return False
+            self.entries[user_id] = (
+                time.monotonic() + settings.USER_SNAPSHOT_LOCAL_TIMEOUT,
+                values,
+            )
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.USER_SNAPSHOT_SIZE:
+                self.entries.popitem(last=False)
+            return True
+
+    def invalidate(self, user_id):
+        """Удаление снимка сейчас и после фиксации транзакции."""
+        self.discard(user_id)
+        transaction.on_commit(lambda: self.discard(user_id))
+
+    def discard(self, user_id):
+        """Удаление снимка из обоих кэшей и версии токенов из кэша."""
+        forget_token_version(user_id)
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(user_id, None)
+        if self.shared is not None:
+            self.shared.delete(SNAPSHOT_KEY.format(user_id))
+
+    def clear(self):
+        """Очистка снимков процесса."""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+user_snapshots = UserSnapshots()
+
+
+def revoke_tokens(user_ids):
+    """Отзыв токенов пользователей, изменённых в обход `User.save`.
+
+    Массовые изменения (`bulk_update`, `QuerySet.update`) полей токена
+    должны вызывать эту функцию: она увеличивает версию токенов
+    и сбрасывает снимки пользователей.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    User.objects.filter(id__in=user_ids).update(
+        token_version=F('token_version') + 1
+    )
+    for user_id in user_ids:
+        user_snapshots.invalidate(user_id)
+
+
+def get_user_id(validated_token):
+    """id пользователя из токена."""
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(
+            _('Token contained no recognizable user identification')
+        )
+
+
+def check_token_version(validated_token, version):
+    """Отказ, если версия токена отстала от версии пользователя."""
+    if VERSION_CLAIM in validated_token and (
+        validated_token[VERSION_CLAIM] != version
+    ):
+        raise AuthenticationFailed(
+            'Токен отозван, получите новый', code='token_revoked'
+        )
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication с пользователем из снимка вместо выборки."""
+
+    def authenticate(self, request):
+        """Пользователь из утверждений токена или из снимка.
+
+        Токены без утверждений роли, выданные до их появления,
+        принимаются и всегда идут через снимок.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if request.method in SAFE_METHODS and has_role_claims(
+            validated_token
+        ):
+            return self.get_token_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_token_user(self, validated_token):
+        """Пользователь из утверждений токена после сверки версии."""
+        version = current_token_version(get_user_id(validated_token))
+        if version is None:
+            raise AuthenticationFailed(
+                _('User not found'), code='user_not_found'
+            )
+        check_token_version(validated_token, version)
+        if not validated_token.get('is_active', True):
+            raise AuthenticationFailed(
+                _('User is inactive'), code='user_inactive'
+            )
+        return api_settings.TOKEN_USER_CLASS(validated_token)
+
+    def get_user(self, validated_token):
+        """Пользователь токена из кэша снимков."""
+        user = user_snapshots.get(get_user_id(validated_token))
+        if user is None:
+            raise AuthenticationFailed(
+                _('User not found'), code='user_not_found'
+            )
+        if not user.is_active:
+            raise AuthenticationFailed(
+                _('User is inactive'), code='user_inactive'
+            )
+        check_token_version(validated_token, user.token_version)
+        return user
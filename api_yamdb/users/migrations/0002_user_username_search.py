@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+def fill_username_search(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    for user in User.objects.only('id', 'username').iterator():
+        User.objects.filter(pk=user.pk).update(
+            username_search=user.username.casefold().replace('ё', 'е')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='username_search',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150, verbose_name='Имя для поиска'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_username_search, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from core.text import normalize_text
+
 
 class User(AbstractUser):
     """Модель юзера."""
@@ -22,6 +24,9 @@ class User(AbstractUser):
         blank=False,
         null=False
     )
+    username_search = models.CharField(
+        'Имя для поиска', max_length=150, db_index=True, editable=False
+    )
     email = models.EmailField(
         'Электронная почта',
         max_length=254,
@@ -33,6 +38,12 @@ class User(AbstractUser):
     role = models.CharField(
         'Роль', max_length=30, choices=USER_ROLE, default='user'
     )
+    token_version = models.PositiveIntegerField(
+        'Версия токенов', default=0, editable=False
+    )
+
+    # Поля, которые копируются в утверждения токена (users/tokens.py).
+    TOKEN_FIELDS = ('username', 'role', 'is_superuser', 'is_active')
 
     @property
     def is_user(self):
@@ -49,6 +60,44 @@ class User(AbstractUser):
         """Проверка на модератора."""
         return self.role == self.MODERATOR
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминание загруженных полей токена."""
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_token_fields = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.TOKEN_FIELDS
+        }
+        return instance
+
+    def fill_search_fields(self):
+        """Заполнение нормализованного имени для поиска."""
+        self.username_search = normalize_text(self.username)
+
+    def token_fields_changed(self):
+        """Изменились ли поля токена с момента загрузки."""
+        loaded = getattr(self, 'loaded_token_fields', {})
+        return any(
+            getattr(self, name) != value for name, value in loaded.items()
+        )
+
+    def save(self, *args, **kwargs):
+        """Сохранение с нормализованным именем для поиска.
+
+        Изменение роли, имени или флагов увеличивает версию токенов,
+        и выданные раньше токены перестают приниматься.
+        """
+        self.fill_search_fields()
+        update_fields = kwargs.get('update_fields')
+        if self.token_fields_changed():
+            self.token_version += 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'token_version'}
+        super().save(*args, **kwargs)
+        self.loaded_token_fields = {
+            name: getattr(self, name) for name in self.TOKEN_FIELDS
+        }
+
     class Meta:
         """Мета класс пользователя."""
 
@@ -0,0 +1,18 @@
+"""Сигналы приложения users."""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import user_snapshots
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Удаление снимка пользователя для аутентификации.
+
+    Сохранение из UserViewSet, `me` и админки проходит через сигнал,
+    массовые изменения сбрасываются через `revoke_tokens`.
+    """
+    user_snapshots.invalidate(instance.pk)
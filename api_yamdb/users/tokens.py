@@ -0,0 +1,91 @@
+"""Токены с ролью пользователя.
+
+Токен несёт имя, роль и версию токенов пользователя, поэтому
+разрешениям на чтение хватает утверждений токена без выборки
+пользователя. Версия сверяется с текущей из кэша: изменение роли
+увеличивает версию (`User.save`), и старые токены отклоняются
+не по истечении срока жизни, а сразу в процессе, записавшем
+изменение, и не позже чем через `USER_SNAPSHOT_LOCAL_TIMEOUT` секунд
+в остальных: кэш по умолчанию у каждого процесса свой, поэтому версия
+хранится в нём недолго.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+
+VERSION_CLAIM = 'token_version'
+VERSION_KEY = 'users:token_version:{}'
+
+
+class UserRefreshToken(RefreshToken):
+    """Refresh токен с утверждениями роли и версии токенов.
+
+    Access токен копирует утверждения refresh токена.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        """Токен пользователя с полями токена из модели."""
+        token = super().for_user(user)
+        for name in User.TOKEN_FIELDS:
+            token[name] = getattr(user, name)
+        token[VERSION_CLAIM] = user.token_version
+        return token
+
+
+def has_role_claims(token):
+    """Выдан ли токен с утверждениями роли и версии."""
+    return VERSION_CLAIM in token and 'role' in token
+
+
+def current_token_version(user_id):
+    """Текущая версия токенов пользователя или None, если его нет."""
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.filter(id=user_id).values_list(
+            'token_version', flat=True
+        ).first()
+        if version is not None:
+            cache.set(
+                key, version, timeout=settings.USER_SNAPSHOT_LOCAL_TIMEOUT
+            )
+    return version
+
+
+def forget_token_version(user_id):
+    """Удаление версии токенов из кэша."""
+    cache.delete(VERSION_KEY.format(user_id))
+
+
+class RoleTokenUser(TokenUser):
+    """Пользователь из утверждений токена с проверками роли модели."""
+
+    @cached_property
+    def role(self):
+        """Роль из токена."""
+        return self.token['role']
+
+    @property
+    def is_user(self):
+        """Проверка на пользователя."""
+        return self.role == User.USER
+
+    @property
+    def is_admin(self):
+        """Проверка на админа."""
+        return self.role == User.ADMIN
+
+    @property
+    def is_moderator(self):
+        """Проверка на модератора."""
+        return self.role == User.MODERATOR
+
+    def __str__(self):
+        """Имя пользователя."""
+        return self.username
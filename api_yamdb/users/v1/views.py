@@ -4,15 +4,19 @@ from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
 from django.shortcuts import get_object_or_404
-from rest_framework import filters, status, viewsets
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework_simplejwt.tokens import AccessToken
 
+from api.v1.filters import NormalizedSearchFilter, UsersFilter
 from api.v1.permissions import IsAdmin
+from users.authentication import user_snapshots
 from users.models import User
+from users.tokens import UserRefreshToken
 from users.v1.serializers import (MeSerializer,
                                   TokenSerializer, UserSerializer)
 
@@ -59,7 +63,7 @@ def send_token(request):
     )
 
     confirmation_code = request.data.get('confirmation_code')
-    refresh = RefreshToken.for_user(user)
+    refresh = UserRefreshToken.for_user(user)
 
     anwser = {
         'refresh': str(refresh),
@@ -81,8 +85,9 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = PageNumberPagination
-    filter_backends = (filters.SearchFilter, )
-    search_fields = ('username', )
+    filter_backends = (NormalizedSearchFilter, DjangoFilterBackend)
+    filterset_class = UsersFilter
+    search_fields = ('username_search', )
     permission_classes = (IsAdmin,)
     lookup_field = 'username'
 
@@ -92,11 +97,15 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated, ]
     )
     def me(self, request):
-        """Получение или обновление пользователя."""
-        user = get_object_or_404(User, username=self.request.user)
-        serializer = MeSerializer(self.request.user)
+        """Получение или обновление пользователя.
+
+        При чтении пользователь запроса может быть собран из токена
+        без полей профиля, профиль берётся из снимка.
+        """
+        serializer = MeSerializer(user_snapshots.get(self.request.user.id))
 
         if request.method == 'PATCH':
+            user = get_object_or_404(User, id=self.request.user.id)
             serializer = MeSerializer(user, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             serializer.save()
@@ -1,6 +1,7 @@
 import os
 import sys
 
+import pytest
 from django.utils.version import get_version
 
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -34,3 +35,22 @@ assert get_version() < '3.0.0', 'Пожалуйста, используйте в
 pytest_plugins = [
     'tests.fixtures.fixture_user',
 ]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    from django.core.cache import cache
+
+    from users.authentication import user_snapshots
+    cache.clear()
+    user_snapshots.clear()
+    yield
+    cache.clear()
+    user_snapshots.clear()
+
+
+@pytest.fixture(autouse=True)
+def catalog_index_in_foreground(settings):
+    # Фоновая загрузка индекса каталога делает результаты тестов
+    # зависящими от времени, её проверяет отдельный тест.
+    settings.CATALOG_INDEX_BACKGROUND = False
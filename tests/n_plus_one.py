@@ -0,0 +1,114 @@
+"""Поиск N+1 запросов в списках api.
+
+Список запрашивается при нескольких объёмах данных. Каждый SQL запрос
+приписывается полю сериализатора, которое выполнялось в этот момент,
+поэтому при росте числа запросов видно, какое поле их добавляет.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from rest_framework.serializers import Serializer
+
+from core.queries import record_queries
+from users.authentication import user_snapshots
+
+# Размер страницы в проекте - 5: два размера внутри страницы ловят
+# рост с числом объектов на странице, третий - с размером таблицы.
+SIZES = (2, 5, 12)
+OUTSIDE = 'вне сериализатора'
+
+_active_fields = []
+
+
+class TrackedField:
+    """Поле сериализатора, отмечающее время своей работы."""
+
+    def __init__(self, field, label):
+        self._field = field
+        self._label = label
+
+    def __getattr__(self, name):
+        return getattr(self._field, name)
+
+    @contextmanager
+    def _active(self):
+        _active_fields.append(self._label)
+        try:
+            yield
+        finally:
+            _active_fields.pop()
+
+    def get_attribute(self, instance):
+        with self._active():
+            return self._field.get_attribute(instance)
+
+    def to_representation(self, value):
+        with self._active():
+            return self._field.to_representation(value)
+
+
+@contextmanager
+def tracked_serializers():
+    """Подмена полей всех сериализаторов на отслеживаемые."""
+    original = Serializer._readable_fields
+
+    def readable_fields(serializer):
+        for field in original.fget(serializer):
+            yield TrackedField(
+                field, f'{type(serializer).__name__}.{field.field_name}'
+            )
+
+    Serializer._readable_fields = property(readable_fields)
+    try:
+        yield
+    finally:
+        Serializer._readable_fields = original
+
+
+def active_field():
+    """Поле сериализатора, которое сейчас выполняется."""
+    return _active_fields[-1] if _active_fields else OUTSIDE
+
+
+def queries_by_field(client, url):
+    """Число запросов к базе по полям сериализатора и пример SQL."""
+    cache.clear()
+    user_snapshots.clear()
+    counts = Counter()
+    samples = {}
+    with tracked_serializers(), record_queries(active_field) as queries:
+        response = client.get(url)
+    assert response.status_code == 200, (
+        f'Запрос `{url}` вернул {response.status_code}'
+    )
+    for query in queries:
+        counts[query.label] += 1
+        samples.setdefault(query.label, query.sql)
+    return counts, samples
+
+
+def assert_no_n_plus_one(client, url, grow, sizes=SIZES):
+    """Проверка, что число запросов не зависит от объёма данных.
+
+    `grow(size)` доводит количество объектов списка до `size`.
+    """
+    measured = []
+    samples = {}
+    for size in sizes:
+        grow(size)
+        counts, size_samples = queries_by_field(client, url)
+        measured.append(counts)
+        samples.update(size_samples)
+    offenders = []
+    for label in sorted(set().union(*measured)):
+        series = [counts[label] for counts in measured]
+        if len(set(series)) > 1:
+            offenders.append(
+                f'{label}: {series} запросов при {list(sizes)} объектах, '
+                f'например: {samples[label]}'
+            )
+    assert not offenders, (
+        f'Число запросов `{url}` растёт с объёмом данных (N+1):\n'
+        + '\n'.join(offenders)
+    )
@@ -0,0 +1,95 @@
+"""Проверка планов SQLite для запросов api.
+
+Все SELECT запросы, выполненные при обращении к адресу, повторяются
+с `EXPLAIN QUERY PLAN`. Нарушения - полный просмотр большой таблицы
+без индекса (`SCAN table`) и временное B-дерево для сортировки или
+группировки, если внешний цикл плана идёт по большой таблице.
+Запросы prefetch_related выбирают строки для одной страницы, их
+сортировка во временном B-дереве не считается нарушением. Индекс
+каталога в памяти загружается до замера: его загрузка читает таблицы
+целиком один раз за процесс.
+"""
+import re
+
+from django.core.cache import cache
+from django.db import connection
+
+from core.queries import record_queries
+from reviews.catalog_index import catalog_index
+
+LARGE_TABLES = (
+    'reviews_title', 'reviews_genretitle', 'reviews_review',
+    'reviews_comment', 'users_user',
+)
+SCAN = 'scan'
+TEMP_B_TREE = 'temp b-tree'
+TABLE_ACCESS = re.compile(r'^(SCAN|SEARCH) (\w+)(.*)$')
+PREFETCH_MARK = '_prefetch_related_val_'
+
+
+def capture_selects(client, url):
+    """SELECT запросы, выполненные при GET запросе к адресу."""
+    cache.clear()
+    catalog_index.snapshot(wait=True)
+    with record_queries() as queries:
+        response = client.get(url)
+    assert response.status_code == 200, (
+        f'Запрос `{url}` вернул {response.status_code}'
+    )
+    return [
+        (query.sql, query.params) for query in queries
+        if query.sql.lstrip().upper().startswith('SELECT')
+    ]
+
+
+def explain(sql, params):
+    """Строки плана запроса."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_violations(plan, bounded=False, tables=LARGE_TABLES):
+    """Нарушения в плане: пары (вид, таблица).
+
+    `bounded` - запрос заведомо читает немного строк, `tables` -
+    таблицы, просмотр которых считается нарушением.
+    """
+    violations = set()
+    outer_table = None
+    for detail in plan:
+        access = TABLE_ACCESS.match(detail)
+        if access:
+            kind, table, rest = access.groups()
+            outer_table = outer_table or table
+            if kind == 'SCAN' and table in tables and 'INDEX' not in rest:
+                violations.add((SCAN, table))
+        elif (
+            detail.startswith('USE TEMP B-TREE')
+            and outer_table in tables
+            and not bounded
+        ):
+            violations.add((TEMP_B_TREE, outer_table))
+    return violations
+
+
+def assert_query_plans(client, url, allowed=(), tables=LARGE_TABLES):
+    """Проверка, что запросы адреса используют индексы.
+
+    `allowed` - допустимые нарушения (вид, таблица), например
+    неизбежный просмотр таблицы при поиске подстроки. `tables` -
+    проверяемые таблицы, по умолчанию большие.
+    """
+    errors = []
+    for sql, params in capture_selects(client, url):
+        plan = explain(sql, params)
+        unexpected = plan_violations(
+            plan, PREFETCH_MARK in sql, tables
+        ) - set(allowed)
+        if unexpected:
+            errors.append(
+                f'{sorted(unexpected)} в запросе {sql} с планом {plan}'
+            )
+    assert not errors, (
+        f'Запросы `{url}` не используют индексы:\n' + '\n'.join(errors)
+    )
@@ -116,6 +116,20 @@ class Test01UserAPI:
             'возвращается искомый пользователь со всеми необходимыми полями, включая `bio` и `role`'
         )
 
+    @pytest.mark.django_db(transaction=True)
+    def test_04_03_users_get_username_startswith(self, admin_client, admin):
+        create_users_api(admin_client)
+        response = admin_client.get('/api/v1/users/?username__startswith=testm')
+        assert [user['username'] for user in response.json()['results']] == ['TestModer'], (
+            'Проверьте, что при GET запросе `/api/v1/users/?username__startswith=` '
+            'отбираются пользователи, username которых начинается с параметра, без учёта регистра'
+        )
+        response = admin_client.get('/api/v1/users/?username__startswith=User')
+        assert response.json()['results'] == [], (
+            'Проверьте, что при GET запросе `/api/v1/users/?username__startswith=` '
+            'не отбираются пользователи, в username которых параметр встречается не в начале'
+        )
+
     @pytest.mark.django_db(transaction=True)
     def test_04_01_users_get_admin_only(self, user_client):
         url = '/api/v1/users/'
@@ -178,3 +178,17 @@ class Test02CategoryAPI:
             f'Проверьте, что при POST запросе на `{url}`, создание категорий недоступно для '
             f'пользователя с ролью moderator'
         )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_07_category_name_startswith(self, client, admin_client):
+        create_categories(admin_client)
+        response = client.get('/api/v1/categories/?name__startswith=фил')
+        assert [category['slug'] for category in response.json()['results']] == ['films'], (
+            'Проверьте, что при GET запросе `/api/v1/categories/?name__startswith=` '
+            'отбираются категории, название которых начинается с параметра'
+        )
+        response = client.get('/api/v1/categories/?name__startswith=ниги')
+        assert response.json()['results'] == [], (
+            'Проверьте, что при GET запросе `/api/v1/categories/?name__startswith=` '
+            'не отбираются категории, в названии которых параметр встречается не в начале'
+        )
@@ -166,3 +166,31 @@ class Test03GenreAPI:
             f'Проверьте, что при POST запросе на `{url}`, создание жанров недоступно для '
             f'пользователя с ролью moderator'
         )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_07_genre_search_case(self, client, admin_client):
+        create_genre(admin_client)
+        admin_client.post('/api/v1/genres/', data={'name': 'Ёлочная сказка', 'slug': 'fir-tale'})
+        response = client.get('/api/v1/genres/?search=ужасы')
+        assert [genre['slug'] for genre in response.json()['results']] == ['horror'], (
+            'Проверьте, что поиск жанров по кириллице не зависит от регистра'
+        )
+        response = client.get('/api/v1/genres/?search=ЕЛОЧНАЯ')
+        assert [genre['slug'] for genre in response.json()['results']] == ['fir-tale'], (
+            'Проверьте, что при поиске жанров буквы `ё` и `е` не различаются'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_08_genre_name_startswith(self, client, admin_client):
+        create_genre(admin_client)
+        admin_client.post('/api/v1/genres/', data={'name': 'Ёлочная сказка', 'slug': 'fir-tale'})
+        admin_client.post('/api/v1/genres/', data={'name': 'Мелодрама', 'slug': 'melodrama'})
+        response = client.get('/api/v1/genres/?name__startswith=др')
+        assert [genre['slug'] for genre in response.json()['results']] == ['drama'], (
+            'Проверьте, что при GET запросе `/api/v1/genres/?name__startswith=` '
+            'отбираются жанры, название которых начинается с параметра'
+        )
+        response = client.get('/api/v1/genres/?name__startswith=ЕЛ')
+        assert [genre['slug'] for genre in response.json()['results']] == ['fir-tale'], (
+            'Проверьте, что при отборе жанров по началу названия регистр и буквы `ё` и `е` не различаются'
+        )
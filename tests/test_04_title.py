@@ -1,4 +1,13 @@
+import time
+
 import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api.v1.cache import VERSION_KEY
+from core.queries import record_queries
+from reviews.models import Title
 
 from .common import (auth_client, create_categories, create_genre,
                      create_titles, create_users_api)
@@ -249,3 +258,231 @@ class Test04TitleAPI:
         user, moderator = create_users_api(admin_client)
         self.check_permissions(user, 'обычного пользователя', titles, categories, genres)
         self.check_permissions(moderator, 'модератора', titles, categories, genres)
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_05_titles_num_queries(self, client, admin_client):
+        titles, categories, genres = create_titles(admin_client)
+        list_queries = self.count_queries(client, '/api/v1/titles/')
+        detail_queries = self.count_queries(client, f'/api/v1/titles/{titles[0]["id"]}/')
+        for number in range(4):
+            data = {'name': f'Чудо юдо {number}', 'year': 1999,
+                    'genre': [genre['slug'] for genre in genres],
+                    'category': categories[number % 2]['slug'], 'description': 'Бум'}
+            admin_client.post('/api/v1/titles/', data=data)
+        assert self.count_queries(client, '/api/v1/titles/') == list_queries, (
+            'Проверьте, что число запросов к базе при GET запросе `/api/v1/titles/` '
+            'не зависит от количества произведений на странице'
+        )
+        assert self.count_queries(client, f'/api/v1/titles/{titles[0]["id"]}/') == detail_queries, (
+            'Проверьте, что число запросов к базе при GET запросе `/api/v1/titles/{title_id}/` не меняется'
+        )
+        assert list_queries <= 4, (
+            'Проверьте, что при GET запросе `/api/v1/titles/` категории и жанры '
+            'загружаются через `select_related` и `prefetch_related`'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_06_titles_search(self, client, admin_client):
+        titles, categories, genres = create_titles(admin_client)
+        response = client.get('/api/v1/titles/?search=драма')
+        data = response.json()
+        assert [title['id'] for title in data['results']] == [titles[1]['id']], (
+            'Проверьте, что при GET запросе `/api/v1/titles/?search=` ищется по названию и описанию произведения'
+        )
+        response = client.get('/api/v1/titles/?search=поворот туда')
+        assert [title['id'] for title in response.json()['results']] == [titles[0]['id']], (
+            'Проверьте, что поиск `search` учитывает все слова запроса без учёта регистра'
+        )
+        admin_client.patch(f'/api/v1/titles/{titles[0]["id"]}/', data={'name': 'Разворот'})
+        response = client.get('/api/v1/titles/?search=разворот')
+        assert [title['id'] for title in response.json()['results']] == [titles[0]['id']], (
+            'Проверьте, что поисковый индекс обновляется при изменении произведения'
+        )
+        response = client.get('/api/v1/titles/?search=пике&year=2020')
+        assert response.json()['results'] == [], (
+            'Проверьте, что поиск `search` сочетается с остальными фильтрами'
+        )
+        data = {'name': 'Ёжик в тумане', 'year': 1975, 'genre': [genres[0]['slug']], 'category': categories[0]['slug']}
+        hedgehog = admin_client.post('/api/v1/titles/', data=data).json()['id']
+        for query in ('ежик', 'ЁЖИК', 'ёжик туман'):
+            response = client.get(f'/api/v1/titles/?search={query}')
+            assert [title['id'] for title in response.json()['results']] == [hedgehog], (
+                'Проверьте, что поиск `search` не различает `ё` и `е`, как и фильтр `name`'
+            )
+        response = client.get('/api/v1/titles/?search="OR*')
+        assert response.status_code == 200, (
+            'Проверьте, что спецсимволы в `search` не приводят к ошибке'
+        )
+        admin_client.delete(f'/api/v1/titles/{titles[0]["id"]}/')
+        response = client.get('/api/v1/titles/?search=разворот')
+        assert response.json()['results'] == [], (
+            'Проверьте, что удалённое произведение исчезает из поиска'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_07_titles_name_case(self, client, admin_client):
+        titles, categories, genres = create_titles(admin_client)
+        response = client.get('/api/v1/titles/?name=ПОВОРОТ')
+        assert [title['id'] for title in response.json()['results']] == [titles[0]['id']], (
+            'Проверьте, что фильтр `name` по кириллице не зависит от регистра'
+        )
+        response = client.get('/api/v1/titles/?name__startswith=про')
+        assert [title['id'] for title in response.json()['results']] == [titles[1]['id']], (
+            'Проверьте, что фильтр `name__startswith` ищет по началу названия'
+        )
+        response = client.get('/api/v1/titles/?name__startswith=туда')
+        assert response.json()['results'] == [], (
+            'Проверьте, что фильтр `name__startswith` не ищет по середине названия'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_08_titles_list_cache(self, client, admin_client, admin):
+        titles, categories, genres = create_titles(admin_client)
+        client.get('/api/v1/titles/?year=2000&genre=horror')
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/v1/titles/?genre=horror&year=2000')
+        assert response.status_code == 200
+        assert len(context.captured_queries) == 0, (
+            'Проверьте, что повторный GET запрос `/api/v1/titles/` отдаётся из кэша без запросов к базе'
+        )
+        admin_client.post(f'/api/v1/titles/{titles[0]["id"]}/reviews/', data={'text': 'Класс', 'score': 8})
+        response = client.get('/api/v1/titles/?year=2000&genre=horror')
+        assert response.json()['results'][0]['rating'] == 8, (
+            'Проверьте, что отзыв, изменивший рейтинг, сбрасывает кэш списка произведений'
+        )
+        admin_client.delete(f'/api/v1/genres/{genres[0]["slug"]}/')
+        response = client.get('/api/v1/titles/?year=2000')
+        assert genres[0] not in response.json()['results'][0]['genre'], (
+            'Проверьте, что изменение жанров сбрасывает кэш списка произведений'
+        )
+        client.get('/api/v1/genres/')
+        admin_client.post('/api/v1/genres/', data={'name': 'Мюзикл', 'slug': 'musical'})
+        response = client.get('/api/v1/genres/')
+        assert {'name': 'Мюзикл', 'slug': 'musical'} in response.json()['results'], (
+            'Проверьте, что создание жанра сбрасывает кэш списка жанров'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_09_titles_genre_category_filters(self, client, admin_client):
+        titles, categories, genres = create_titles(admin_client)
+
+        def found(query):
+            response = client.get(f'/api/v1/titles/?{query}')
+            assert response.status_code == 200
+            return [title['id'] for title in response.json()['results']]
+
+        both = [titles[0]['id'], titles[1]['id']]
+        assert found('genre=horror,drama') == both, (
+            'Проверьте, что `genre` со списком slug отбирает произведения с любым из жанров'
+        )
+        assert found('genre=horror,unknown') == [titles[0]['id']], (
+            'Проверьте, что неизвестный slug в `genre` не мешает остальным'
+        )
+        assert found('genre=horror,comedy&genre_mode=all') == [titles[0]['id']], (
+            'Проверьте, что `genre_mode=all` отбирает произведения со всеми жанрами'
+        )
+        assert found('genre=horror,drama&genre_mode=all') == [], (
+            'Проверьте, что `genre_mode=all` не отбирает произведения с частью жанров'
+        )
+        assert found('genre=hor') == [], (
+            'Проверьте, что `genre` сравнивает slug целиком'
+        )
+        assert found('genre__contains=o') == [titles[0]['id']], (
+            'Проверьте, что `genre__contains` ищет подстроку slug без повторов произведений'
+        )
+        assert found('category=films,books') == both, (
+            'Проверьте, что `category` со списком slug отбирает произведения любой из категорий'
+        )
+        assert found('category=film') == [], (
+            'Проверьте, что `category` сравнивает slug целиком'
+        )
+        assert found('category__contains=film') == [titles[0]['id']], (
+            'Проверьте, что `category__contains` ищет подстроку slug'
+        )
+        response = client.get('/api/v1/titles/?genre=horror&genre_mode=some')
+        assert response.status_code == 400, (
+            'Проверьте, что неизвестный `genre_mode` возвращает статус 400'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_10_titles_ordering(self, client, admin_client):
+        titles, categories, genres = create_titles(admin_client)
+        data = {'name': 'Акт', 'year': 2010, 'genre': [genres[0]['slug']], 'category': categories[0]['slug']}
+        titles.append({**data, 'id': admin_client.post('/api/v1/titles/', data=data).json()['id']})
+        user, moderator = create_users_api(admin_client)
+        for author, title, score in ((user, titles[1], 8), (moderator, titles[1], 6), (user, titles[2], 9)):
+            auth_client(author).post(
+                f'/api/v1/titles/{title["id"]}/reviews/', data={'text': 'Отзыв', 'score': score}
+            )
+
+        def ordered(query):
+            response = client.get(f'/api/v1/titles/?{query}')
+            assert response.status_code == 200
+            return [title['id'] for title in response.json()['results']]
+
+        first, second, third = (title['id'] for title in titles)
+        assert ordered('') == [third, first, second], (
+            'Проверьте, что без `ordering` произведения отсортированы по названию'
+        )
+        for query, expected in (
+            ('ordering=-name', [second, first, third]),
+            ('ordering=year', [first, third, second]),
+            ('ordering=-year', [second, third, first]),
+            ('ordering=-rating', [third, second, first]),
+            ('ordering=reviews_count', [first, third, second]),
+            ('ordering=-reviews_count', [second, third, first]),
+            ('ordering=-reviews_count&category=films', [third, first]),
+            ('ordering=description', [third, first, second]),
+        ):
+            assert ordered(query) == expected, (
+                f'Проверьте, что `/api/v1/titles/?{query}` сортирует произведения по полю '
+                'с индексом, а неизвестное поле игнорирует'
+            )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_11_list_validators(self, client, admin_client):
+        titles, _, _ = create_titles(admin_client)
+        for query in ('', '?search=Поворот', '?ordering=-rating'):
+            with record_queries() as queries:
+                response = client.get(f'/api/v1/titles/{query}')
+            assert response.status_code == 200 and response.get('ETag')
+            assert not any('MAX(' in recorded.sql for recorded in queries), (
+                f'Проверьте, что `ETag` списка `/api/v1/titles/{query}` строится из версий кэша '
+                'без агрегата по всей таблице произведений'
+            )
+            etag = response.get('ETag')
+            assert client.get(f'/api/v1/titles/{query}', HTTP_IF_NONE_MATCH=etag).status_code == 304
+        admin_client.patch(f'/api/v1/titles/{titles[0]["id"]}/', data={'year': 1999})
+        assert client.get('/api/v1/titles/?ordering=-rating', HTTP_IF_NONE_MATCH=etag).status_code == 200, (
+            'Проверьте, что изменение произведения меняет `ETag` списка произведений'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_12_list_cache_version_evicted(self, client, admin_client):
+        client.get('/api/v1/genres/')
+        admin_client.post('/api/v1/genres/', data={'name': 'Мюзикл', 'slug': 'musical'})
+        cache.delete(VERSION_KEY.format('genre'))
+        response = client.get('/api/v1/genres/')
+        assert {'name': 'Мюзикл', 'slug': 'musical'} in response.json()['results'], (
+            'Проверьте, что после вытеснения счётчика версии старые ответы списка не читаются'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_13_list_validators_expire(self, client, admin_client):
+        create_titles(admin_client)
+        with override_settings(CATALOG_CACHE_TIMEOUT=1):
+            cache.clear()
+            etag = client.get('/api/v1/titles/?ordering=year').get('ETag')
+            Title.objects.update(year=1999)
+            time.sleep(1.1)
+            response = client.get('/api/v1/titles/?ordering=year', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200, (
+            'Проверьте, что счётчики версий живут не дольше `CATALOG_CACHE_TIMEOUT`: '
+            'запись без увеличения счётчика должна менять `ETag` списка после его истечения'
+        )
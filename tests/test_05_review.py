@@ -1,4 +1,8 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.queries import record_queries
 
 from .common import (auth_client, create_reviews, create_titles,
                      create_users_api)
@@ -334,3 +338,170 @@ class Test05ReviewAPI:
             'без токена авторизации возвращается статус 401'
         )
         self.check_permissions(user, 'обычного пользователя', reviews, titles)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_05_review_rating(self, admin_client, admin):
+        reviews, titles, user, moderator = create_reviews(admin_client, admin)
+        response = admin_client.get(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert response.json().get('rating') == 4, (
+            'Проверьте, что после создания отзывов `rating` произведения пересчитывается'
+        )
+        admin_client.patch(
+            f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[1]["id"]}/', data={'score': 9}
+        )
+        response = admin_client.get(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert response.json().get('rating') == 6, (
+            'Проверьте, что после изменения оценки `rating` произведения пересчитывается'
+        )
+        for review in reviews:
+            admin_client.delete(f'/api/v1/titles/{titles[0]["id"]}/reviews/{review["id"]}/')
+        response = admin_client.get(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert response.json().get('rating') is None, (
+            'Проверьте, что после удаления всех отзывов `rating` произведения равен `None`'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_06_reviews_num_queries(self, client, admin_client, admin):
+        reviews, titles, user, moderator = create_reviews(admin_client, admin)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f'/api/v1/titles/{titles[0]["id"]}/reviews/')
+        assert len(response.json()['results']) == len(reviews)
+        assert len(context.captured_queries) <= 4, (
+            'Проверьте, что при GET запросе `/api/v1/titles/{title_id}/reviews/` '
+            'авторы отзывов загружаются одним запросом вместе с отзывами'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_07_reviews_cursor_pagination(self, client, admin_client, django_user_model):
+        titles, _, _ = create_titles(admin_client)
+        url = f'/api/v1/titles/{titles[0]["id"]}/reviews/'
+        for number in range(7):
+            author = django_user_model.objects.create_user(
+                username=f'TestCursor{number}', email=f'cursor{number}@yamdb.fake'
+            )
+            self.create_review(auth_client(author), titles[0]['id'], f'text {number}', 5)
+        expected = [review['id'] for review in client.get(url).json()['results']]
+        expected += [review['id'] for review in client.get(f'{url}?page=2').json()['results']]
+
+        response = client.get(f'{url}?cursor=')
+        assert response.status_code == 200, (
+            'Проверьте, что при GET запросе `/api/v1/titles/{title_id}/reviews/?cursor=` возвращается статус 200'
+        )
+        first_page = response.json()
+        assert 'count' not in first_page and first_page['previous'] is None, (
+            'Проверьте, что курсорная пагинация не считает общее количество отзывов'
+        )
+        second_page = client.get(first_page['next']).json()
+        assert second_page['next'] is None
+        received = [review['id'] for review in first_page['results'] + second_page['results']]
+        assert received == expected, (
+            'Проверьте, что курсорная пагинация отдаёт отзывы в том же порядке, что и постраничная'
+        )
+        previous_page = client.get(second_page['previous']).json()
+        assert previous_page['results'] == first_page['results'], (
+            'Проверьте, что ссылка `previous` курсорной пагинации возвращает предыдущую страницу'
+        )
+        response = client.get(f'{url}?cursor=broken')
+        assert response.status_code == 404, (
+            'Проверьте, что при неверном курсоре возвращается статус 404'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_08_reviews_conditional_get(self, client, admin_client, admin):
+        reviews, titles, user, moderator = create_reviews(admin_client, admin)
+        url = f'/api/v1/titles/{titles[0]["id"]}/reviews/'
+        response = client.get(url)
+        etag = response.get('ETag')
+        assert etag and response.get('Last-Modified'), (
+            'Проверьте, что GET запрос `/api/v1/titles/{title_id}/reviews/` возвращает `ETag` и `Last-Modified`'
+        )
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304, (
+            'Проверьте, что неизменившийся список отзывов возвращает статус 304'
+        )
+        for query in ('', '?cursor='):
+            with CaptureQueriesContext(connection) as context:
+                client.get(f'{url}{query}', HTTP_IF_NONE_MATCH=etag)
+            assert not any('MAX(' in captured['sql'] for captured in context.captured_queries), (
+                'Проверьте, что `ETag` списка отзывов строится из `updated` произведения '
+                'без агрегата по всем отзывам'
+            )
+        admin_client.patch(f'{url}{reviews[1]["id"]}/', data={'text': 'Новый текст'})
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200, (
+            'Проверьте, что изменение отзыва меняет `ETag` списка отзывов'
+        )
+        detail_etag = client.get(f'{url}{reviews[0]["id"]}/').get('ETag')
+        response = client.get(f'{url}{reviews[0]["id"]}/', HTTP_IF_NONE_MATCH=detail_etag)
+        assert response.status_code == 304, (
+            'Проверьте, что неизменившийся отзыв возвращает статус 304'
+        )
+
+        title_url = f'/api/v1/titles/{titles[0]["id"]}/'
+        title_etag = client.get(title_url).get('ETag')
+        list_etag = client.get('/api/v1/titles/').get('ETag')
+        assert client.get(title_url, HTTP_IF_NONE_MATCH=title_etag).status_code == 304
+        assert client.get('/api/v1/titles/', HTTP_IF_NONE_MATCH=list_etag).status_code == 304
+        admin_client.delete(f'{url}{reviews[2]["id"]}/')
+        assert client.get(title_url, HTTP_IF_NONE_MATCH=title_etag).status_code == 200, (
+            'Проверьте, что изменение рейтинга меняет `ETag` произведения'
+        )
+        assert client.get('/api/v1/titles/', HTTP_IF_NONE_MATCH=list_etag).status_code == 200, (
+            'Проверьте, что изменение рейтинга меняет `ETag` списка произведений'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_09_review_stats(self, client, admin_client, admin):
+        reviews, titles, user, moderator = create_reviews(admin_client, admin)
+        url = f'/api/v1/titles/{titles[0]["id"]}/stats/'
+        response = client.get(url)
+        assert response.status_code == 200, (
+            'Проверьте, что GET запрос `/api/v1/titles/{title_id}/stats/` возвращает статус 200'
+        )
+        scores = {str(score): 0 for score in range(1, 11)}
+        assert response.json() == {
+            'reviews_count': 3, 'rating': 4, 'scores': {**scores, '3': 1, '4': 1, '5': 1},
+        }, (
+            'Проверьте, что `/api/v1/titles/{title_id}/stats/` возвращает количество отзывов, '
+            'рейтинг и количество отзывов с каждой оценкой'
+        )
+        admin_client.patch(
+            f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[1]["id"]}/', data={'score': 9}
+        )
+        admin_client.delete(f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[0]["id"]}/')
+        with record_queries() as queries:
+            response = client.get(url)
+        assert response.json()['scores'] == {**scores, '4': 1, '9': 1}, (
+            'Проверьте, что изменение и удаление отзывов обновляют распределение оценок'
+        )
+        assert len(queries) == 1, (
+            'Проверьте, что статистика читается из строки произведения, а не считается по отзывам'
+        )
+        response = client.get(f'/api/v1/titles/{titles[0]["id"]}/?stats=true')
+        assert response.json()['stats']['reviews_count'] == 2, (
+            'Проверьте, что параметр `stats=true` добавляет статистику отзывов к произведению'
+        )
+        response = client.get(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert 'stats' not in response.json(), (
+            'Проверьте, что без параметра `stats` статистика отзывов не выводится'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_10_author_deleted(self, client, admin_client, admin):
+        reviews, titles, user, moderator = create_reviews(admin_client, admin)
+        client.get('/api/v1/titles/top/')
+        response = admin_client.delete(f'/api/v1/users/{user.username}/')
+        assert response.status_code == 204
+        scores = {str(score): 0 for score in range(1, 11)}
+        assert client.get(f'/api/v1/titles/{titles[0]["id"]}/stats/').json() == {
+            'reviews_count': 2, 'rating': 4, 'scores': {**scores, '4': 1, '5': 1},
+        }, (
+            'Проверьте, что удаление пользователя пересчитывает оценки произведений с его отзывами'
+        )
+        admin_client.delete(f'/api/v1/users/{moderator.username}/')
+        response = client.get(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert (response.json()['rating'], response.json()['reviews_count']) == (5, 1)
+        top = [(title['id'], title['ranking_score']) for title in client.get('/api/v1/titles/top/').json()]
+        assert top == [(titles[0]['id'], 5.45)], (
+            'Проверьте, что удаление пользователя обновляет взвешенный рейтинг `/api/v1/titles/top/`'
+        )
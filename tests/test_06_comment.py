@@ -1,4 +1,11 @@
+from io import StringIO
+
 import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from reviews.models import Comment, Review
 
 from .common import auth_client, create_comments, create_reviews
 
@@ -246,3 +253,131 @@ class Test06CommentAPI:
             'без токена авторизации возвращается статус 401'
         )
         self.check_permissions(user, 'обычного пользователя', f'{pre_url}{comments[2]["id"]}/')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_05_comments_num_queries(self, client, admin_client, admin):
+        comments, reviews, titles, user, moderator = create_comments(admin_client, admin)
+        pre_url = f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[0]["id"]}/comments/'
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(pre_url)
+        assert len(response.json()['results']) == len(comments)
+        assert len(context.captured_queries) <= 4, (
+            'Проверьте, что при GET запросе `/api/v1/titles/{title_id}/reviews/{review_id}/comments/` '
+            'отзыв и произведение проверяются одним запросом, а авторы загружаются вместе с комментариями'
+        )
+        response = client.get(f'/api/v1/titles/{titles[1]["id"]}/reviews/{reviews[0]["id"]}/comments/')
+        assert response.status_code == 404, (
+            'Проверьте, что при GET запросе комментариев к отзыву другого произведения возвращается статус 404'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_06_comments_count(self, client, admin_client, admin):
+        comments, reviews, titles, user, moderator = create_comments(admin_client, admin)
+        url = f'/api/v1/titles/{titles[0]["id"]}/reviews/'
+        counts = {review['id']: review['comments_count'] for review in client.get(url).json()['results']}
+        assert counts == {reviews[0]['id']: 3, reviews[1]['id']: 0, reviews[2]['id']: 0}, (
+            'Проверьте, что отзывы возвращают количество комментариев `comments_count`'
+        )
+        admin_client.delete(f'{url}{reviews[0]["id"]}/comments/{comments[0]["id"]}/')
+        assert client.get(f'{url}{reviews[0]["id"]}/').json()['comments_count'] == 2, (
+            'Проверьте, что удаление комментария уменьшает `comments_count` отзыва'
+        )
+        response = client.get(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert response.json()['reviews_count'] == 3, (
+            'Проверьте, что произведение возвращает количество отзывов `reviews_count`'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_07_repair_counters(self, client, admin_client, admin):
+        comments, reviews, titles, user, moderator = create_comments(admin_client, admin)
+        Comment.objects.filter(author=user).delete()
+        Review.objects.filter(author=user).delete()
+        with pytest.raises(CommandError):
+            call_command('repair_counters', check=True, stdout=StringIO())
+        call_command('repair_counters', chunk_size=1, stdout=StringIO())
+        response = client.get(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert response.json()['reviews_count'] == 2, (
+            'Проверьте, что `repair_counters` исправляет количество отзывов после удаления в обход API'
+        )
+        review = client.get(f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[0]["id"]}/').json()
+        assert review['comments_count'] == 2, (
+            'Проверьте, что `repair_counters` исправляет количество комментариев после удаления в обход API'
+        )
+        call_command('repair_counters', check=True, stdout=StringIO())
+
+    @pytest.mark.django_db(transaction=True)
+    def test_08_author_deleted(self, client, admin_client, admin):
+        comments, reviews, titles, user, moderator = create_comments(admin_client, admin)
+        response = admin_client.delete(f'/api/v1/users/{user.username}/')
+        assert response.status_code == 204
+        review = client.get(f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[0]["id"]}/').json()
+        assert review['comments_count'] == 2, (
+            'Проверьте, что удаление пользователя пересчитывает `comments_count` отзывов '
+            'с его комментариями'
+        )
+        call_command('repair_counters', check=True, stdout=StringIO())
+
+    @pytest.mark.django_db(transaction=True)
+    def test_09_comments_conditional_get(self, client, admin_client, admin):
+        comments, reviews, titles, user, moderator = create_comments(admin_client, admin)
+        url = f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[0]["id"]}/comments/'
+        etag = client.get(url).get('ETag')
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304, (
+            'Проверьте, что неизменившийся список комментариев возвращает статус 304'
+        )
+        assert not any('MAX(' in captured['sql'] for captured in context.captured_queries), (
+            'Проверьте, что `ETag` списка комментариев строится из `updated` отзыва '
+            'без агрегата по всем комментариям'
+        )
+        admin_client.patch(f'{url}{comments[0]["id"]}/', data={'text': 'Новый текст'})
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200, (
+            'Проверьте, что изменение комментария меняет `ETag` списка комментариев'
+        )
+        etag = client.get(url).get('ETag')
+        admin_client.delete(f'{url}{comments[1]["id"]}/')
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200, (
+            'Проверьте, что удаление комментария меняет `ETag` списка комментариев'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_10_comment_changes_reviews_etag(self, client, admin_client, admin):
+        reviews, titles, user, moderator = create_reviews(admin_client, admin)
+        url = f'/api/v1/titles/{titles[0]["id"]}/reviews/'
+        comments_url = f'{url}{reviews[0]["id"]}/comments/'
+        etag = client.get(url).get('ETag')
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+        response = admin_client.post(comments_url, data={'text': 'Комментарий'})
+        assert response.status_code == 201
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200, (
+            'Проверьте, что добавление комментария меняет `ETag` списка отзывов: '
+            'в нём показано количество комментариев'
+        )
+        counts = {review['id']: review['comments_count'] for review in response.json()['results']}
+        assert counts[reviews[0]['id']] == 1
+        etag = response.get('ETag')
+        comment_id = client.get(comments_url).json()['results'][0]['id']
+        admin_client.delete(f'{comments_url}{comment_id}/')
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200, (
+            'Проверьте, что удаление комментария меняет `ETag` списка отзывов'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_11_author_renamed(self, client, admin_client, admin):
+        comments, reviews, titles, user, moderator = create_comments(admin_client, admin)
+        url = f'/api/v1/titles/{titles[0]["id"]}/reviews/'
+        urls = (
+            url,
+            f'{url}{reviews[2]["id"]}/',
+            f'{url}{reviews[0]["id"]}/comments/',
+            f'{url}{reviews[0]["id"]}/comments/{comments[2]["id"]}/',
+        )
+        etags = {address: client.get(address).get('ETag') for address in urls}
+        response = admin_client.patch(f'/api/v1/users/{moderator.username}/', data={'username': 'RenamedModer'})
+        assert response.status_code == 200
+        for address, etag in etags.items():
+            assert client.get(address, HTTP_IF_NONE_MATCH=etag).status_code == 200, (
+                f'Проверьте, что смена имени автора меняет `ETag` ответа `{address}`'
+            )
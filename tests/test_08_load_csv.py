@@ -0,0 +1,263 @@
+import csv
+import os
+import shutil
+from io import StringIO
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError
+
+from core.queries import record_queries
+from reviews.management import bulk
+from reviews.management.commands.load_csv import Command
+from reviews.models import (Comment, Genre, GenreTitle, ImportFingerprint,
+                            Review, Title)
+
+DATA_DIR = os.path.join(settings.BASE_DIR, 'static', 'data')
+
+
+def count_rows(path):
+    with open(path, encoding='utf-8') as csv_file:
+        return sum(1 for _ in csv.DictReader(csv_file))
+
+
+class Test08LoadCsv:
+
+    @pytest.mark.django_db(transaction=True)
+    def test_01_load_csv(self, tmp_path):
+        state_file = str(tmp_path / 'state.json')
+        call_command('load_csv', batch_size=7, state_file=state_file, stdout=StringIO())
+        assert GenreTitle.objects.count() == count_rows(os.path.join(DATA_DIR, 'genre_title.csv')), (
+            'Проверьте, что команда `load_csv` загружает связи жанров и произведений'
+        )
+        assert Review.objects.count() == count_rows(os.path.join(DATA_DIR, 'review.csv'))
+        assert Comment.objects.count() == count_rows(os.path.join(DATA_DIR, 'comments.csv'))
+        assert Review.objects.order_by('pub_date').first().pub_date.year == 2019, (
+            'Проверьте, что команда `load_csv` сохраняет даты публикации из файла'
+        )
+        assert Title.objects.filter(score_count__gt=0).exists(), (
+            'Проверьте, что после загрузки пересчитываются оценки произведений'
+        )
+        assert not os.path.exists(state_file)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_02_load_csv_resume(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(DATA_DIR, data_dir)
+        review_csv = data_dir / 'review.csv'
+        original = review_csv.read_text(encoding='utf-8')
+        with open(review_csv, encoding='utf-8') as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        rows[30]['id'] = rows[0]['id']
+        with open(review_csv, 'w', encoding='utf-8', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+        options = {
+            'batch_size': 10, 'data_dir': str(data_dir),
+            'state_file': str(tmp_path / 'state.json'), 'stdout': StringIO(),
+        }
+        with pytest.raises(IntegrityError):
+            call_command('load_csv', **options)
+        assert Review.objects.count() == 30, (
+            'Проверьте, что команда `load_csv` фиксирует строки пачками в отдельных транзакциях'
+        )
+        review_csv.write_text(original, encoding='utf-8')
+        call_command('load_csv', **options)
+        assert Review.objects.count() == len(rows), (
+            'Проверьте, что повторный запуск `load_csv` продолжает загрузку с места сбоя'
+        )
+        assert GenreTitle.objects.count() == count_rows(data_dir / 'genre_title.csv')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_03_load_csv_rejects(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(DATA_DIR, data_dir)
+        genre_rows = count_rows(data_dir / 'genre.csv')
+        with open(data_dir / 'genre.csv', 'a', encoding='utf-8', newline='') as csv_file:
+            csv_file.write('\n')
+            csv.writer(csv_file).writerow((1000, 'Плохой жанр', 'bad slug!'))
+        with open(data_dir / 'review.csv', encoding='utf-8') as csv_file:
+            reviews = list(csv.DictReader(csv_file))
+        duplicate = dict(reviews[0], id=1000)
+        out_of_range = dict(reviews[1], id=1001, author_id=reviews[0]['author_id'], score=11)
+        with open(data_dir / 'review.csv', 'a', encoding='utf-8', newline='') as csv_file:
+            csv_file.write('\n')
+            writer = csv.DictWriter(csv_file, fieldnames=reviews[0].keys())
+            writer.writerows((duplicate, out_of_range))
+        reject_file = tmp_path / 'rejects.csv'
+        with record_queries() as queries:
+            call_command(
+                'load_csv', batch_size=5, workers=2, data_dir=str(data_dir),
+                state_file=str(tmp_path / 'state.json'), reject_file=str(reject_file),
+                stdout=StringIO(),
+            )
+        key_reads = [
+            query.sql for query in queries
+            if query.sql.startswith('SELECT "reviews_review"."author_id", "reviews_review"."title_id"')
+        ]
+        assert key_reads and all(' WHERE ' in sql for sql in key_reads), (
+            'Проверьте, что `load_csv` ищет повторы ключей отзывов только для ключей пачки, '
+            'а не читает все ключи таблицы'
+        )
+        assert Genre.objects.count() == genre_rows, (
+            'Проверьте, что команда `load_csv` пропускает жанры с неверным slug'
+        )
+        assert Review.objects.count() == len(reviews), (
+            'Проверьте, что команда `load_csv` пропускает отзывы с неверной оценкой '
+            'и повторные отзывы автора на произведение'
+        )
+        assert list(Review.objects.order_by('id').values_list('id', flat=True)) == sorted(
+            int(review['id']) for review in reviews
+        )
+        with open(reject_file, encoding='utf-8') as csv_file:
+            rejected = list(csv.reader(csv_file))[1:]
+        assert [(row[0], row[3]) for row in rejected] == [
+            ('genre.csv', '1000'), ('review.csv', '1000'), ('review.csv', '1001'),
+        ], 'Проверьте, что отклонённые строки записываются в файл по порядку'
+        assert rejected[0][1] == str(genre_rows + 2), (
+            'Проверьте, что для отклонённой строки указан её номер в файле'
+        )
+        assert 'slug' in rejected[0][2]
+        assert 'author_id, title_id' in rejected[1][2]
+        assert 'score' in rejected[2][2]
+
+    @pytest.mark.django_db(transaction=True)
+    def test_04_load_csv_delta(self, tmp_path, client):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(DATA_DIR, data_dir)
+        options = {
+            'data_dir': str(data_dir), 'state_file': str(tmp_path / 'state.json'),
+            'reject_file': str(tmp_path / 'rejects.csv'),
+        }
+        call_command('load_csv', fingerprints=True, stdout=StringIO(), **options)
+        titles_csv = data_dir / 'titles.csv'
+        with open(titles_csv, encoding='utf-8') as csv_file:
+            titles = list(csv.DictReader(csv_file))
+        titles[0]['name'] = 'Новое Название'
+        titles.append(dict(titles[1], id=1000, name='Новое произведение'))
+        with open(titles_csv, 'w', encoding='utf-8', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=titles[0].keys())
+            writer.writeheader()
+            writer.writerows(titles)
+        out = StringIO()
+        call_command('load_csv', delta=True, stdout=out, **options)
+        assert f'titles.csv: добавлено 1, обновлено 1, без изменений {len(titles) - 2}' in out.getvalue(), (
+            'Проверьте, что команда `load_csv --delta` считает добавленные, '
+            'обновлённые и неизменные строки'
+        )
+        title = Title.objects.get(id=titles[0]['id'])
+        assert title.name == 'Новое Название'
+        assert title.name_search == 'новое название', (
+            'Проверьте, что при обновлении строки пересчитываются поля для поиска'
+        )
+        assert Title.objects.filter(id=1000).exists()
+        found = [title['id'] for title in client.get('/api/v1/titles/?search=Новое').json()['results']]
+        assert sorted(found) == sorted([int(titles[0]['id']), 1000]), (
+            'Проверьте, что `load_csv --delta` обновляет поисковый индекс изменённых произведений'
+        )
+        assert Review.objects.count() == count_rows(data_dir / 'review.csv')
+        out = StringIO()
+        call_command('load_csv', delta=True, stdout=out, **options)
+        assert 'обновлено 0' in out.getvalue() and 'добавлено 0' in out.getvalue()
+        assert f'review.csv: добавлено 0, обновлено 0, без изменений {Review.objects.count()}' in out.getvalue(), (
+            'Проверьте, что команда `load_csv --delta` пропускает неизменные строки'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_05_load_csv_delta_scoped(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(DATA_DIR, data_dir)
+        options = {
+            'data_dir': str(data_dir), 'state_file': str(tmp_path / 'state.json'),
+            'reject_file': str(tmp_path / 'rejects.csv'),
+        }
+        call_command('load_csv', fingerprints=True, stdout=StringIO(), **options)
+        titles_before = dict(Title.objects.values_list('id', 'updated'))
+        reviews_before = dict(Review.objects.values_list('id', 'updated'))
+        call_command('load_csv', delta=True, stdout=StringIO(), **options)
+        assert dict(Title.objects.values_list('id', 'updated')) == titles_before, (
+            'Проверьте, что `load_csv --delta` без изменений не меняет `updated` произведений'
+        )
+        assert dict(Review.objects.values_list('id', 'updated')) == reviews_before, (
+            'Проверьте, что `load_csv --delta` без изменений не меняет `updated` отзывов'
+        )
+        review_csv = data_dir / 'review.csv'
+        with open(review_csv, encoding='utf-8') as csv_file:
+            reviews = list(csv.DictReader(csv_file))
+        changed = reviews[0]
+        changed['score'] = '1' if changed['score'] != '1' else '2'
+        with open(review_csv, 'w', encoding='utf-8', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=reviews[0].keys())
+            writer.writeheader()
+            writer.writerows(reviews)
+        call_command('load_csv', delta=True, stdout=StringIO(), **options)
+        title = Title.objects.get(id=changed['title_id'])
+        scores = Review.objects.filter(title=title).values_list('score', flat=True)
+        assert (title.score_sum, title.score_count) == (sum(scores), len(scores)), (
+            'Проверьте, что `load_csv --delta` пересчитывает оценки произведений с изменёнными отзывами'
+        )
+        assert title.ranking.score == pytest.approx((5.5 * 10 + sum(scores)) / (10 + len(scores)))
+        titles_after = dict(Title.objects.values_list('id', 'updated'))
+        assert {
+            title_id for title_id, updated in titles_after.items() if updated != titles_before[title_id]
+        } == {title.id}, (
+            'Проверьте, что `load_csv --delta` пересчитывает только затронутые произведения'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_06_load_csv_fingerprints(self, tmp_path, monkeypatch):
+        options = {
+            'state_file': str(tmp_path / 'state.json'),
+            'reject_file': str(tmp_path / 'rejects.csv'),
+        }
+        call_command('load_csv', stdout=StringIO(), **options)
+        assert not ImportFingerprint.objects.exists(), (
+            'Проверьте, что `load_csv` без `--delta` и `--fingerprints` не пишет отпечатки строк'
+        )
+        out = StringIO()
+        call_command('load_csv', delta=True, stdout=out, **options)
+        reviews = Review.objects.count()
+        assert f'review.csv: добавлено 0, обновлено {reviews}' in out.getvalue(), (
+            'Проверьте, что дозагрузка без отпечатков считает существующие строки изменёнными'
+        )
+        monkeypatch.setattr(bulk, 'RECOUNT_CHUNK', 10)
+        out = StringIO()
+        with record_queries() as queries:
+            call_command('load_csv', delta=True, stdout=out, **options)
+        assert f'review.csv: добавлено 0, обновлено 0, без изменений {reviews}' in out.getvalue(), (
+            'Проверьте, что дозагрузка сохраняет отпечатки строк'
+        )
+        too_long = [
+            query.sql for query in queries
+            if ' IN (' in query.sql and len(query.params) > 11
+        ]
+        assert not too_long, (
+            'Проверьте, что `load_csv` передаёт id в условия IN пачками по `RECOUNT_CHUNK`: '
+            'SQLite ограничивает число параметров запроса'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_07_load_csv_crash_after_commit(self, tmp_path, monkeypatch):
+        options = {
+            'batch_size': 10, 'state_file': str(tmp_path / 'state.json'),
+            'reject_file': str(tmp_path / 'rejects.csv'),
+        }
+        reject = Command.reject
+
+        def crash(command, csv_f, rejected):
+            if csv_f == 'review.csv':
+                raise RuntimeError('сбой после фиксации пачки')
+            reject(command, csv_f, rejected)
+
+        monkeypatch.setattr(Command, 'reject', crash)
+        with pytest.raises(RuntimeError):
+            call_command('load_csv', stdout=StringIO(), **options)
+        assert Review.objects.count() == 10
+        monkeypatch.setattr(Command, 'reject', reject)
+        call_command('load_csv', stdout=StringIO(), **options)
+        assert Review.objects.count() == count_rows(os.path.join(DATA_DIR, 'review.csv')), (
+            'Проверьте, что `load_csv` продолжает загрузку после сбоя между фиксацией пачки '
+            'и записью файла состояния'
+        )
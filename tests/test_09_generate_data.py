@@ -0,0 +1,62 @@
+from io import StringIO
+from statistics import median
+
+import pytest
+from django.core.management import call_command
+from django.db.models import Count, F
+
+from reviews.models import Category, Comment, Genre, GenreTitle, Review, Title
+from users.models import User
+
+OPTIONS = {
+    'users': 200, 'categories': 4, 'genres': 10, 'titles': 50,
+    'reviews': 1000, 'comments': 500, 'batch_size': 100, 'seed': 7,
+}
+
+
+def snapshot():
+    return (
+        list(Title.objects.order_by('id').values_list('name', 'year', 'category__slug')),
+        list(Review.objects.order_by('id').values_list('title_id', 'author_id', 'score', 'pub_date')),
+        list(Comment.objects.order_by('id').values_list('review_id', 'author_id', 'pub_date')),
+    )
+
+
+class Test09GenerateData:
+
+    @pytest.mark.django_db
+    def test_01_generate_data(self):
+        call_command('generate_data', stdout=StringIO(), **OPTIONS)
+        assert User.objects.count() == OPTIONS['users']
+        assert Category.objects.count() == OPTIONS['categories']
+        assert Genre.objects.count() == OPTIONS['genres']
+        assert Title.objects.count() == OPTIONS['titles']
+        assert Comment.objects.count() == OPTIONS['comments']
+        assert 0 < Review.objects.count() <= OPTIONS['reviews']
+        assert not GenreTitle.objects.values('title').annotate(
+            genres=Count('genre')
+        ).filter(genres=0).exists()
+        reviews_per_title = sorted(
+            Title.objects.order_by().annotate(total=Count('reviews')).values_list('total', flat=True),
+            reverse=True,
+        )
+        assert reviews_per_title[0] >= 5 * max(median(reviews_per_title), 1), (
+            'Проверьте, что команда `generate_data` распределяет отзывы неравномерно'
+        )
+        assert not Review.objects.filter(score__gt=10).exists()
+        assert not Comment.objects.filter(pub_date__lt=F('review__pub_date')).exists()
+        title = Title.objects.filter(score_count__gt=0).first()
+        assert title.score_count == title.reviews.count(), (
+            'Проверьте, что после генерации пересчитываются оценки произведений'
+        )
+
+    @pytest.mark.django_db
+    def test_02_generate_data_seed(self):
+        call_command('generate_data', stdout=StringIO(), **OPTIONS)
+        first = snapshot()
+        for model in (User, Title, Genre, Category):
+            model.objects.all().delete()
+        call_command('generate_data', stdout=StringIO(), **OPTIONS)
+        assert snapshot() == first, (
+            'Проверьте, что команда `generate_data` с одним seed создаёт одинаковые данные'
+        )
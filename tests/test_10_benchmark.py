@@ -0,0 +1,65 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from api.management.commands.benchmark_api import api_routes, route_name
+
+
+class Test10Benchmark:
+
+    @pytest.mark.django_db
+    def test_01_benchmark_api(self, tmp_path):
+        call_command(
+            'generate_data', users=30, categories=2, genres=4, titles=10,
+            reviews=60, comments=60, seed=3, stdout=StringIO(),
+        )
+        output = tmp_path / 'benchmark.json'
+        out = StringIO()
+        call_command(
+            'benchmark_api', iterations=2, warmup=0, output=str(output), stdout=out,
+        )
+        assert 'Нет сценариев для маршрутов' not in out.getvalue(), (
+            'Проверьте, что `benchmark_api` замеряет все маршруты api'
+        )
+        report = json.loads(output.read_text(encoding='utf-8'))
+        results = report['results']
+        assert {route_name(result['path']) for result in results.values()} == set(api_routes())
+        assert sum(name.startswith('titles list') for name in results) == 69, (
+            'Проверьте, что `benchmark_api` замеряет все сочетания фильтров произведений'
+        )
+        for name in (
+            'titles list genre genre_mode=all', 'titles list genre__contains',
+            'titles list category__contains',
+        ):
+            assert name in results, (
+                f'Проверьте, что `benchmark_api` замеряет сценарий `{name}`'
+            )
+        for name, result in results.items():
+            assert result['status'] < 400, f'Сценарий `{name}` вернул {result["status"]}'
+            assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+            assert result['queries'] >= 0
+        assert results['title detail']['queries'] > 0
+        assert report['dataset']['title'] == 10, (
+            'Проверьте, что `benchmark_api` откатывает изменения в базе'
+        )
+
+    def test_02_compare_benchmarks(self, tmp_path):
+        result = {
+            'method': 'GET', 'path': '/api/v1/titles/', 'status': 200, 'queries': 3,
+            'mean_ms': 10, 'rps': 100, 'p50_ms': 10, 'p95_ms': 12, 'p99_ms': 15,
+        }
+        baseline = tmp_path / 'baseline.json'
+        baseline.write_text(json.dumps({'results': {'titles list': result}}))
+        current = tmp_path / 'current.json'
+        current.write_text(json.dumps({'results': {'titles list': dict(result, p95_ms=13)}}))
+        call_command('compare_benchmarks', str(baseline), str(current), stdout=StringIO())
+        current.write_text(json.dumps({'results': {'titles list': dict(result, p95_ms=30, queries=4)}}))
+        out = StringIO()
+        with pytest.raises(CommandError):
+            call_command('compare_benchmarks', str(baseline), str(current), stdout=out)
+        assert 'p95_ms 12.0 -> 30.0' in out.getvalue()
+        assert 'запросов к базе 3 -> 4' in out.getvalue(), (
+            'Проверьте, что `compare_benchmarks` отмечает рост числа запросов к базе'
+        )
@@ -0,0 +1,94 @@
+import pytest
+
+from api.v1.views import ReviewViewSet
+from reviews.models import Category, Comment, Genre, Review, Title
+from users.models import User
+
+from .n_plus_one import assert_no_n_plus_one
+
+
+def create_users(size):
+    for number in range(User.objects.count(), size):
+        User.objects.create(username=f'reader{number}', email=f'reader{number}@yamdb.fake')
+    return list(User.objects.order_by('id')[:size])
+
+
+def grow_titles(size):
+    category, _ = Category.objects.get_or_create(name='Фильм', slug='films')
+    genres = [
+        Genre.objects.get_or_create(name=name, slug=slug)[0]
+        for name, slug in (('Драма', 'drama'), ('Комедия', 'comedy'))
+    ]
+    for number in range(Title.objects.count(), size):
+        title = Title.objects.create(name=f'Фильм {number}', year=2000, category=category)
+        title.genre.set(genres)
+
+
+def grow_catalog(model):
+    def grow(size):
+        for number in range(model.objects.count(), size):
+            model.objects.create(name=f'Название {number}', slug=f'slug-{number}')
+    return grow
+
+
+def grow_reviews(title):
+    def grow(size):
+        for author in create_users(size)[title.reviews.count():]:
+            Review.objects.create(title=title, author=author, text='Отзыв', score=5)
+    return grow
+
+
+def grow_comments(review):
+    def grow(size):
+        authors = create_users(size)
+        for number in range(review.comments.count(), size):
+            Comment.objects.create(review=review, author=authors[number], text='Комментарий')
+    return grow
+
+
+@pytest.fixture
+def title():
+    category = Category.objects.create(name='Книга', slug='books')
+    return Title.objects.create(name='Книга', year=2001, category=category)
+
+
+class Test11NPlusOne:
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('query', ('', '?genre=drama&year=2000'))
+    def test_01_titles(self, client, query):
+        assert_no_n_plus_one(client, f'/api/v1/titles/{query}', grow_titles)
+
+    @pytest.mark.django_db
+    def test_02_genres_categories(self, client):
+        assert_no_n_plus_one(client, '/api/v1/genres/', grow_catalog(Genre))
+        assert_no_n_plus_one(client, '/api/v1/categories/', grow_catalog(Category))
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('query', ('', '?cursor='))
+    def test_03_reviews(self, client, title, query):
+        assert_no_n_plus_one(
+            client, f'/api/v1/titles/{title.id}/reviews/{query}', grow_reviews(title)
+        )
+
+    @pytest.mark.django_db
+    def test_04_comments(self, client, title):
+        review = Review.objects.create(
+            title=title, author=create_users(1)[0], text='Отзыв', score=5
+        )
+        assert_no_n_plus_one(
+            client, f'/api/v1/titles/{title.id}/reviews/{review.id}/comments/', grow_comments(review)
+        )
+
+    @pytest.mark.django_db
+    def test_05_users(self, admin_client):
+        assert_no_n_plus_one(admin_client, '/api/v1/users/', create_users)
+
+    @pytest.mark.django_db
+    def test_06_detector_reports_field(self, client, title, monkeypatch):
+        monkeypatch.setattr(ReviewViewSet, 'get_queryset', lambda view: view.title.reviews.all())
+        with pytest.raises(AssertionError) as error:
+            assert_no_n_plus_one(client, f'/api/v1/titles/{title.id}/reviews/', grow_reviews(title))
+        assert 'ReviewSerializer.author' in str(error.value), (
+            'Проверьте, что при N+1 указывается поле сериализатора, добавляющее запросы'
+        )
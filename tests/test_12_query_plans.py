@@ -0,0 +1,135 @@
+from itertools import combinations
+
+import pytest
+from django.db import connection
+
+from api.v1.views import ReviewViewSet
+from reviews.models import Category, Comment, Genre, Review, Title
+from users.models import User
+
+from .query_plan import SCAN, TEMP_B_TREE, assert_query_plans
+
+pytestmark = pytest.mark.skipif(
+    connection.vendor != 'sqlite', reason='EXPLAIN QUERY PLAN есть только в SQLite'
+)
+
+TITLE_FILTERS = {
+    'name': 'фил',
+    'name__startswith': 'фил',
+    'year': 2000,
+    'genre': 'drama',
+    'category': 'films',
+    'search': 'фильм',
+}
+# Допустимые нарушения с причинами. Для сочетаний фильтров
+# допустимы нарушения каждого из фильтров.
+TITLE_FILTERS_ALLOWED = {
+    # Поиск подстроки не использует индекс.
+    'name': {(SCAN, 'reviews_title')},
+    # Отбор по индексу name_search или year сортируется по name
+    # отдельно, план зависит от статистики.
+    'name__startswith': {(TEMP_B_TREE, 'reviews_title')},
+    'year': {(TEMP_B_TREE, 'reviews_title')},
+    # Произведения жанра выбираются по индексу (genre, title)
+    # и сортируются по name отдельно.
+    'genre': {(TEMP_B_TREE, 'reviews_title')},
+    # Сортировка по релевантности полнотекстового поиска.
+    'search': {(TEMP_B_TREE, 'reviews_title')},
+}
+# Ключи сортировки списка, у каждого есть индекс.
+TITLE_ORDERINGS = ('name', 'year', 'rating', 'reviews_count')
+# Порядок по id совпадает с rowid, LIMIT читает только страницу,
+# поиск подстроки в имени не использует индекс.
+USERS_ALLOWED = {(SCAN, 'users_user')}
+
+
+@pytest.fixture
+def catalog():
+    category = Category.objects.create(name='Фильм', slug='films')
+    genres = [
+        Genre.objects.create(name='Драма', slug='drama'),
+        Genre.objects.create(name='Комедия', slug='comedy'),
+    ]
+    users = [
+        User.objects.create(username=f'reader{number}', email=f'reader{number}@yamdb.fake')
+        for number in range(3)
+    ]
+    for number in range(3):
+        title = Title.objects.create(name=f'Фильм {number}', year=2000, category=category)
+        title.genre.set(genres)
+        for author in users:
+            review = Review.objects.create(title=title, author=author, text='Отзыв', score=5)
+            Comment.objects.create(review=review, author=author, text='Комментарий')
+    return title, review, review.comments.first(), users[0]
+
+
+def title_filter_queries():
+    for size in range(len(TITLE_FILTERS) + 1):
+        for names in combinations(TITLE_FILTERS, size):
+            allowed = set()
+            for name in names:
+                allowed |= TITLE_FILTERS_ALLOWED.get(name, set())
+            yield '&'.join(f'{name}={TITLE_FILTERS[name]}' for name in names), allowed
+
+
+class Test12QueryPlans:
+
+    @pytest.mark.django_db
+    def test_01_titles(self, client, catalog):
+        title = catalog[0]
+        for query, allowed in title_filter_queries():
+            assert_query_plans(client, f'/api/v1/titles/?{query}', allowed)
+        for ordering in TITLE_ORDERINGS:
+            assert_query_plans(client, f'/api/v1/titles/?ordering={ordering}')
+            assert_query_plans(client, f'/api/v1/titles/?ordering=-{ordering}')
+        assert_query_plans(client, f'/api/v1/titles/{title.id}/')
+
+    @pytest.mark.django_db
+    def test_02_reviews(self, client, catalog):
+        title, review, _, _ = catalog
+        url = f'/api/v1/titles/{title.id}/reviews/'
+        assert_query_plans(client, url)
+        assert_query_plans(client, f'{url}?cursor=')
+        assert_query_plans(client, f'{url}{review.id}/')
+
+    @pytest.mark.django_db
+    def test_03_comments(self, client, catalog):
+        title, review, comment, _ = catalog
+        url = f'/api/v1/titles/{title.id}/reviews/{review.id}/comments/'
+        assert_query_plans(client, url)
+        assert_query_plans(client, f'{url}?cursor=')
+        assert_query_plans(client, f'{url}{comment.id}/')
+
+    @pytest.mark.django_db
+    def test_04_users(self, admin_client, catalog):
+        user = catalog[3]
+        assert_query_plans(admin_client, '/api/v1/users/', USERS_ALLOWED)
+        assert_query_plans(admin_client, '/api/v1/users/?search=read', USERS_ALLOWED)
+        assert_query_plans(admin_client, f'/api/v1/users/{user.username}/')
+        assert_query_plans(admin_client, '/api/v1/users/me/')
+
+    @pytest.mark.django_db
+    def test_05_detector_reports_sort(self, client, catalog, monkeypatch):
+        title = catalog[0]
+        monkeypatch.setattr(
+            ReviewViewSet, 'get_queryset', lambda view: view.title.reviews.order_by('text')
+        )
+        with pytest.raises(AssertionError) as error:
+            assert_query_plans(client, f'/api/v1/titles/{title.id}/reviews/')
+        assert "('temp b-tree', 'reviews_review')" in str(error.value), (
+            'Проверьте, что сортировка без индекса отмечается как нарушение'
+        )
+
+    @pytest.mark.django_db
+    def test_06_prefix_search(self, client, admin_client, catalog):
+        # Найденные по диапазону индекса строки сортируются отдельно.
+        for api_client, url, table in (
+            (client, '/api/v1/genres/?name__startswith=Др', 'reviews_genre'),
+            (client, '/api/v1/categories/?name__startswith=Фи',
+             'reviews_category'),
+            (admin_client, '/api/v1/users/?username__startswith=READ',
+             'users_user'),
+        ):
+            assert_query_plans(
+                api_client, url, {(TEMP_B_TREE, table)}, tables=(table,)
+            )
@@ -0,0 +1,233 @@
+import threading
+
+import pytest
+from django.core.cache import cache
+from django.test.utils import override_settings
+
+from core.queries import record_queries
+from reviews import catalog_index as catalog_index_module
+from reviews.catalog_index import (CatalogIndex, catalog_index,
+                                   current_version, increment_version)
+from reviews.models import Category, Genre, Title
+
+from .common import create_titles
+
+TITLE_QUERIES = (
+    '',
+    'genre=drama',
+    'genre=drama,comedy',
+    'genre=drama,comedy&genre_mode=all',
+    'genre=unknown',
+    'category=films',
+    'category=films,books',
+    'year=2000',
+    'genre=comedy&category=books&year=2001',
+    'genre=comedy&page=2',
+    'page=3',
+)
+
+
+def create_catalog():
+    categories = [
+        Category.objects.create(name='Фильм', slug='films'),
+        Category.objects.create(name='Книги', slug='books'),
+    ]
+    genres = [
+        Genre.objects.create(name='Драма', slug='drama'),
+        Genre.objects.create(name='Комедия', slug='comedy'),
+        Genre.objects.create(name='Ужасы', slug='horror'),
+    ]
+    # Названия повторяются парами: порядок при равных названиях
+    # в индексе и в базе должен совпадать.
+    for number in range(14):
+        title = Title.objects.create(
+            name=f'Произведение {(number * 5) % 14 // 2:02}', year=2000 + number % 2,
+            category=categories[number % 3 % 2],
+        )
+        title.genre.set(genres[number % 3:number % 3 + 1 + number % 2])
+
+
+def get_results(client, query, clear=True):
+    if clear:
+        cache.clear()
+    response = client.get(f'/api/v1/titles/?{query}')
+    assert response.status_code == 200
+    return response.json()
+
+
+def title_ids(client, query):
+    return [title['id'] for title in get_results(client, query, clear=False)['results']]
+
+
+class Test13CatalogIndex:
+
+    @pytest.mark.django_db
+    def test_01_same_results_as_sql(self, client):
+        create_catalog()
+        for query in TITLE_QUERIES:
+            with override_settings(CATALOG_INDEX=False):
+                expected = get_results(client, query)
+            assert get_results(client, query) == expected, (
+                f'Проверьте, что список `/api/v1/titles/?{query}` из индекса каталога '
+                'совпадает со списком из базы'
+            )
+
+    @pytest.mark.django_db
+    def test_02_only_page_queries(self, client):
+        create_catalog()
+        cache.clear()
+        catalog_index.snapshot()
+        with record_queries() as queries:
+            response = client.get('/api/v1/titles/?genre=drama,comedy&category=films&year=2000')
+        assert response.status_code == 200
+        assert len(queries) == 2, (
+            'Проверьте, что список из индекса каталога читает из базы только страницу '
+            'произведений и их жанры'
+        )
+        assert 'reviews_genretitle' not in queries[0].sql, (
+            'Проверьте, что отбор по жанру через индекс каталога не соединяет таблицы'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_03_updated_by_signals(self, client, admin_client, monkeypatch):
+        titles, categories, genres = create_titles(admin_client)
+        assert title_ids(client, 'genre=comedy') == [titles[0]['id']]
+        loads = []
+        original_load = CatalogIndex.load
+        monkeypatch.setattr(
+            CatalogIndex, 'load', lambda index, version: loads.append(version) or original_load(index, version)
+        )
+        response = admin_client.post('/api/v1/titles/', data={
+            'name': 'Аэроплан', 'year': 2000, 'genre': [genres[1]['slug']],
+            'category': categories[1]['slug'],
+        })
+        new_id = response.json()['id']
+        assert catalog_index.version == current_version()
+        assert title_ids(client, 'genre=comedy') == [new_id, titles[0]['id']], (
+            'Проверьте, что новое произведение попадает в индекс каталога на своё место по названию'
+        )
+        admin_client.patch(f'/api/v1/titles/{titles[1]["id"]}/', data={
+            'genre': [genres[1]['slug']], 'year': 2000,
+        })
+        assert title_ids(client, 'genre=comedy&year=2000') == [new_id, titles[0]['id'], titles[1]['id']], (
+            'Проверьте, что изменение жанров и года обновляет индекс каталога'
+        )
+        assert title_ids(client, 'genre=drama') == []
+        admin_client.delete(f'/api/v1/titles/{titles[0]["id"]}/')
+        assert title_ids(client, 'genre=comedy') == [new_id, titles[1]['id']], (
+            'Проверьте, что удалённое произведение исчезает из индекса каталога'
+        )
+        admin_client.delete(f'/api/v1/genres/{genres[1]["slug"]}/')
+        assert title_ids(client, 'genre=comedy') == [], (
+            'Проверьте, что удалённый жанр исчезает из индекса каталога'
+        )
+        admin_client.post('/api/v1/genres/', data={'name': 'Мюзикл', 'slug': 'musical'})
+        assert title_ids(client, 'genre=musical') == []
+        assert catalog_index.version == current_version()
+        assert loads == [], (
+            'Проверьте, что изменения из этого процесса не перезагружают индекс каталога'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_04_reload_after_foreign_write(self, client, admin_client):
+        titles, _, _ = create_titles(admin_client)
+        assert title_ids(client, 'year=2020') == [titles[1]['id']]
+        Title.objects.filter(id=titles[1]['id']).update(year=2021)
+        increment_version()
+        snapshot = catalog_index.snapshot()
+        assert snapshot.year_bits(2020) == 0 and snapshot.year_bits(2021), (
+            'Проверьте, что индекс каталога перезагружается, когда версия в кэше '
+            'увеличена другим процессом'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_05_reload_by_age(self, client, admin_client):
+        titles, _, _ = create_titles(admin_client)
+        assert title_ids(client, 'year=2020') == [titles[1]['id']]
+        Title.objects.filter(id=titles[1]['id']).update(year=2021)
+        assert catalog_index.snapshot().year_bits(2020), (
+            'Проверьте, что без смены версии свежий индекс каталога не перезагружается'
+        )
+        with override_settings(CATALOG_INDEX_MAX_AGE=0):
+            snapshot = catalog_index.snapshot()
+        assert snapshot.year_bits(2020) == 0 and snapshot.year_bits(2021), (
+            'Проверьте, что индекс каталога старше `CATALOG_INDEX_MAX_AGE` секунд перезагружается: '
+            'изменения других процессов с LocMemCache иначе не видны'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_06_reload_in_background(self, client, admin_client, settings):
+        titles, _, _ = create_titles(admin_client)
+        catalog_index.snapshot(wait=True)
+        settings.CATALOG_INDEX_BACKGROUND = True
+        Title.objects.filter(id=titles[1]['id']).update(year=2021)
+        increment_version()
+        with record_queries() as queries:
+            assert catalog_index.snapshot() is None, (
+                'Проверьте, что при смене версии устаревший индекс каталога не используется'
+            )
+        assert queries == [], (
+            'Проверьте, что индекс каталога перезагружается не в запросе, а в фоновом потоке'
+        )
+        assert title_ids(client, 'year=2021') == [titles[1]['id']], (
+            'Проверьте, что пока индекс каталога загружается, список строится запросом к базе'
+        )
+        catalog_index.loader.join(timeout=10)
+        snapshot = catalog_index.snapshot()
+        assert snapshot is not None and snapshot.year_bits(2021), (
+            'Проверьте, что фоновая загрузка обновляет индекс каталога'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_07_rebuild_outside_lock(self, client, admin_client, monkeypatch):
+        titles, categories, genres = create_titles(admin_client)
+        catalog_index.snapshot(wait=True)
+        order = catalog_index.current.order
+        admin_client.patch(f'/api/v1/titles/{titles[1]["id"]}/', data={'year': 2000})
+        assert catalog_index.current.order is order, (
+            'Проверьте, что изменение года не копирует порядок произведений в индексе каталога'
+        )
+        lock_free = []
+        original_build = catalog_index_module.build_snapshot
+
+        def try_lock():
+            acquired = catalog_index.lock.acquire(blocking=False)
+            if acquired:
+                catalog_index.lock.release()
+            lock_free.append(acquired)
+
+        def build(*args):
+            reader = threading.Thread(target=try_lock)
+            reader.start()
+            reader.join()
+            return original_build(*args)
+
+        monkeypatch.setattr(catalog_index_module, 'build_snapshot', build)
+        response = admin_client.post('/api/v1/titles/', data={
+            'name': 'Аэроплан', 'year': 2000, 'genre': [genres[1]['slug']],
+            'category': categories[1]['slug'],
+        })
+        assert lock_free == [True], (
+            'Проверьте, что снимок индекса каталога после добавления произведения '
+            'строится без блокировки индекса'
+        )
+        assert title_ids(client, 'genre=comedy')[0] == response.json()['id']
+
+    @pytest.mark.django_db(transaction=True)
+    def test_08_rebuild_in_background(self, client, admin_client, settings):
+        titles, categories, genres = create_titles(admin_client)
+        catalog_index.snapshot(wait=True)
+        settings.CATALOG_INDEX_BACKGROUND = True
+        new_id = admin_client.post('/api/v1/titles/', data={
+            'name': 'Аэроплан', 'year': 2000, 'genre': [genres[1]['slug']],
+            'category': categories[1]['slug'],
+        }).json()['id']
+        assert title_ids(client, 'genre=comedy') == [new_id, titles[0]['id']], (
+            'Проверьте, что пока снимок индекса каталога строится, список строится запросом к базе'
+        )
+        catalog_index.loader.join(timeout=10)
+        snapshot = catalog_index.snapshot()
+        assert snapshot is not None and catalog_index.positions[new_id] == 0, (
+            'Проверьте, что фоновая перестройка ставит новое произведение на место по названию'
+        )
+        assert catalog_index.version == current_version()
@@ -0,0 +1,89 @@
+import pytest
+from django.core.cache import cache
+from django.test.utils import override_settings
+
+from core.queries import record_queries
+
+from .test_13_catalog_index import create_catalog
+
+FACET_QUERIES = (
+    '',
+    'genre=drama',
+    'genre=drama,comedy&genre_mode=all',
+    'genre=unknown',
+    'category=films',
+    'year=2000',
+    'genre=comedy&category=books&year=2001',
+    'genre__contains=com',
+    'genre__contains=o&year=2000',
+    'name=Произведение 0',
+)
+
+
+def get_facets(client, query):
+    cache.clear()
+    response = client.get(f'/api/v1/titles/facets/?{query}')
+    assert response.status_code == 200, (
+        f'Проверьте, что запрос `/api/v1/titles/facets/?{query}` возвращает статус 200'
+    )
+    return response.json()
+
+
+class Test14Facets:
+
+    @pytest.mark.django_db
+    def test_01_counts(self, client):
+        create_catalog()
+        facets = get_facets(client, 'genre=drama&year=2000')
+        assert facets['year'] == [{'year': 2000, 'count': 3}, {'year': 2001, 'count': 2}], (
+            'Проверьте, что количество по годам учитывает фильтр по жанру, но не по году'
+        )
+        assert facets['genre'] == [
+            {'slug': 'drama', 'name': 'Драма', 'count': 3},
+            {'slug': 'comedy', 'name': 'Комедия', 'count': 2},
+            {'slug': 'horror', 'name': 'Ужасы', 'count': 2},
+        ], (
+            'Проверьте, что количество по жанрам учитывает фильтр по году, но не по жанру, '
+            'и отсортировано по убыванию'
+        )
+        assert facets['category'] == [{'slug': 'films', 'name': 'Фильм', 'count': 3}], (
+            'Проверьте, что категории без произведений не выводятся'
+        )
+
+    @pytest.mark.django_db
+    def test_02_index_same_as_sql(self, client):
+        create_catalog()
+        for query in FACET_QUERIES:
+            with override_settings(CATALOG_INDEX=False):
+                expected = get_facets(client, query)
+            assert get_facets(client, query) == expected, (
+                f'Проверьте, что `/api/v1/titles/facets/?{query}` по индексу каталога '
+                'совпадает с подсчётом в базе'
+            )
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('index', (True, False))
+    def test_03_query_count(self, client, index):
+        create_catalog()
+        cache.clear()
+        with override_settings(CATALOG_INDEX=index):
+            if index:
+                client.get('/api/v1/titles/facets/')
+            cache.clear()
+            with record_queries() as queries:
+                response = client.get('/api/v1/titles/facets/?name=Произв&category=films')
+            assert response.status_code == 200
+            assert len(queries) <= 5, (
+                'Проверьте, что счётчики считаются одним запросом на измерение, '
+                'а не запросом на каждое значение'
+            )
+            with record_queries() as queries:
+                client.get('/api/v1/titles/facets/?name=Произв&category=films')
+            assert queries == [], 'Проверьте, что ответ с количеством произведений кэшируется'
+
+    @pytest.mark.django_db
+    def test_04_invalid_params(self, client):
+        response = client.get('/api/v1/titles/facets/?year=abc')
+        assert response.status_code == 400, (
+            'Проверьте, что неверные параметры фильтрации возвращают статус 400'
+        )
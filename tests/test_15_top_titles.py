@@ -0,0 +1,96 @@
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+
+from api.v1.views import TitleViewSet
+from core.queries import record_queries
+from reviews.models import TitleRanking
+
+from .common import auth_client, create_reviews
+
+
+def get_top(client, query=''):
+    response = client.get(f'/api/v1/titles/top/?{query}')
+    assert response.status_code == 200, (
+        f'Проверьте, что запрос `/api/v1/titles/top/?{query}` возвращает статус 200'
+    )
+    return [(title['id'], title['ranking_score']) for title in response.json()]
+
+
+class Test15TopTitles:
+
+    @pytest.mark.django_db(transaction=True)
+    def test_01_damped_ranking(self, client, admin_client, admin):
+        reviews, titles, user, moderator = create_reviews(admin_client, admin)
+        response = auth_client(user).post(
+            f'/api/v1/titles/{titles[1]["id"]}/reviews/', data={'text': 'Шедевр', 'score': 10}
+        )
+        assert response.status_code == 201
+        assert get_top(client) == [(titles[1]['id'], 5.91), (titles[0]['id'], 5.15)], (
+            'Проверьте, что `/api/v1/titles/top/` сортирует произведения по средней оценке, '
+            'сдвинутой к априорной: (5.5 * 10 + сумма оценок) / (10 + количество оценок)'
+        )
+        assert get_top(client, 'limit=1') == [(titles[1]['id'], 5.91)], (
+            'Проверьте, что параметр `limit` ограничивает количество произведений'
+        )
+        assert get_top(client, 'category=films') == [(titles[0]['id'], 5.15)], (
+            'Проверьте, что `/api/v1/titles/top/` фильтрует по категории'
+        )
+        assert get_top(client, 'genre=drama') == [(titles[1]['id'], 5.91)], (
+            'Проверьте, что `/api/v1/titles/top/` фильтрует по жанру'
+        )
+        assert get_top(client, 'year=2000') == [(titles[0]['id'], 5.15)], (
+            'Проверьте, что `/api/v1/titles/top/` фильтрует по году'
+        )
+        review_id = response.json()['id']
+        admin_client.delete(f'/api/v1/titles/{titles[1]["id"]}/reviews/{review_id}/')
+        admin_client.patch(
+            f'/api/v1/titles/{titles[0]["id"]}/reviews/{reviews[1]["id"]}/', data={'score': 9}
+        )
+        assert get_top(client) == [(titles[0]['id'], 5.62)], (
+            'Проверьте, что изменение и удаление отзывов обновляют рейтинг `/api/v1/titles/top/`'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_02_rebuild_command(self, client, admin_client, admin):
+        create_reviews(admin_client, admin)
+        expected = list(TitleRanking.objects.values_list('title_id', 'score'))
+        TitleRanking.objects.update(score=0)
+        call_command('rebuild_ranking', chunk_size=1)
+        assert list(TitleRanking.objects.values_list('title_id', 'score')) == expected, (
+            'Проверьте, что команда `rebuild_ranking` пересобирает таблицу взвешенного рейтинга'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_03_queries_and_validation(self, client, admin_client, admin):
+        create_reviews(admin_client, admin)
+        cache.clear()
+        with record_queries() as queries:
+            client.get('/api/v1/titles/top/')
+        assert len(queries) == 3, (
+            'Проверьте, что `/api/v1/titles/top/` читает порядок из таблицы рейтинга, '
+            'а произведения и их жанры - двумя запросами'
+        )
+        assert 'ORDER BY' not in queries[1].sql and not any('reviews_review' in query.sql for query in queries), (
+            'Проверьте, что `/api/v1/titles/top/` не считает средние оценки по отзывам'
+        )
+        for query in ('limit=0', 'limit=101', 'limit=abc', 'year=abc'):
+            response = client.get(f'/api/v1/titles/top/?{query}')
+            assert response.status_code == 400, (
+                f'Проверьте, что запрос `/api/v1/titles/top/?{query}` возвращает статус 400'
+            )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_04_title_deleted_after_ranking(self, client, admin_client, admin, monkeypatch):
+        create_reviews(admin_client, admin)
+        cache.clear()
+        top = get_top(client)
+        get_queryset = TitleViewSet.get_queryset
+        # Произведение удалено после чтения рейтинга, но до выборки произведений.
+        monkeypatch.setattr(
+            TitleViewSet, 'get_queryset', lambda view: get_queryset(view).exclude(id=top[0][0])
+        )
+        cache.clear()
+        assert get_top(client) == top[1:], (
+            'Проверьте, что `/api/v1/titles/top/` пропускает произведения, удалённые после чтения рейтинга'
+        )
@@ -0,0 +1,75 @@
+import pytest
+from django.test.utils import override_settings
+
+from core.queries import record_queries
+from users.authentication import user_snapshots
+
+from .common import auth_client
+
+
+def count_queries(request):
+    with record_queries() as queries:
+        response = request()
+    return response, queries
+
+
+class Test16UserSnapshots:
+
+    @pytest.mark.django_db
+    @override_settings(USER_SNAPSHOT_CACHE='default')
+    def test_01_no_user_queries(self, user_client, user):
+        assert user_client.get('/api/v1/users/me/').status_code == 200
+        response, queries = count_queries(lambda: user_client.get('/api/v1/users/me/'))
+        assert response.status_code == 200
+        assert response.json()['bio'] == user.bio
+        assert queries == [], (
+            'Проверьте, что пользователь токена берётся из кэша снимков без запросов к базе'
+        )
+        user_snapshots.clear()
+        _, queries = count_queries(lambda: user_client.get('/api/v1/users/me/'))
+        assert queries == [], (
+            'Проверьте, что снимок пользователя читается из общего кэша, '
+            'если его нет в памяти процесса'
+        )
+        with override_settings(USER_SNAPSHOT_CACHE=None):
+            user_snapshots.clear()
+            _, queries = count_queries(lambda: user_client.get('/api/v1/users/me/'))
+            assert len(queries) == 1
+
+    @pytest.mark.django_db(transaction=True)
+    def test_02_role_change(self, admin_client, user_client, user):
+        assert user_client.get('/api/v1/users/').status_code == 403
+        response = admin_client.patch(f'/api/v1/users/{user.username}/', data={'role': 'admin'})
+        assert response.status_code == 200
+        assert user_client.get('/api/v1/users/').status_code == 200, (
+            'Проверьте, что изменение роли через `/api/v1/users/{username}/` '
+            'сбрасывает снимок пользователя'
+        )
+        admin_client.patch(f'/api/v1/users/{user.username}/', data={'role': 'user'})
+        assert user_client.get('/api/v1/users/').status_code == 403, (
+            'Проверьте, что понижение роли сразу лишает пользователя прав'
+        )
+        admin_client.delete(f'/api/v1/users/{user.username}/')
+        assert user_client.get('/api/v1/users/me/').status_code == 401, (
+            'Проверьте, что удалённый пользователь не аутентифицируется из кэша снимков'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_03_me_patch(self, user_client, user):
+        user_client.get('/api/v1/users/me/')
+        response = user_client.patch('/api/v1/users/me/', data={'bio': 'Новая биография'})
+        assert response.status_code == 200
+        assert user_client.get('/api/v1/users/me/').json()['bio'] == 'Новая биография', (
+            'Проверьте, что изменение профиля через `/api/v1/users/me/` '
+            'сбрасывает снимок пользователя'
+        )
+
+    @pytest.mark.django_db
+    @override_settings(USER_SNAPSHOT_SIZE=2)
+    def test_04_bounded(self, admin, moderator, user):
+        for current in (admin, moderator, user):
+            assert auth_client(current).get('/api/v1/users/me/').status_code == 200
+        assert list(user_snapshots.entries) == [moderator.id, user.id], (
+            'Проверьте, что снимки в памяти процесса ограничены USER_SNAPSHOT_SIZE '
+            'и вытесняются в порядке давности использования'
+        )
@@ -0,0 +1,136 @@
+import csv
+import os
+import shutil
+from io import StringIO
+
+import pytest
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management import call_command
+from django.db.models import F
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.queries import record_queries
+from users.authentication import user_snapshots
+from users.models import User
+from users.tokens import UserRefreshToken
+
+from .common import create_titles
+
+
+def role_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {UserRefreshToken.for_user(user).access_token}')
+    return client
+
+
+class Test17TokenClaims:
+
+    @pytest.mark.django_db
+    def test_01_token_claims(self, client, user):
+        response = client.post('/api/v1/auth/token/', data={
+            'username': user.username,
+            'confirmation_code': default_token_generator.make_token(user),
+        })
+        assert response.status_code == 200
+        token = AccessToken(response.json()['access'])
+        assert (token['username'], token['role'], token['token_version']) == (
+            user.username, user.role, user.token_version
+        ), (
+            'Проверьте, что `/api/v1/auth/token/` выдаёт токен с утверждениями '
+            '`username`, `role` и `token_version`'
+        )
+
+    @pytest.mark.django_db
+    def test_02_reads_without_user(self, admin, monkeypatch):
+        client = role_client(admin)
+        assert client.get('/api/v1/users/').status_code == 200
+        loads = []
+        monkeypatch.setattr(user_snapshots, 'get', lambda user_id: loads.append(user_id))
+        with record_queries() as queries:
+            response = client.get('/api/v1/users/')
+        assert response.status_code == 200
+        assert loads == [] and not any('"users_user"."id" = ' in query.sql for query in queries), (
+            'Проверьте, что чтение с токеном с ролью проверяет разрешения по токену '
+            'без выборки пользователя'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_03_downgrade_revokes(self, admin_client, moderator):
+        client = role_client(moderator)
+        assert client.get('/api/v1/users/me/').status_code == 200
+        moderator.role = 'admin'
+        moderator.save()
+        promoted = role_client(moderator)
+        assert promoted.get('/api/v1/users/').status_code == 200
+        response = admin_client.patch(f'/api/v1/users/{moderator.username}/', data={'role': 'user'})
+        assert response.status_code == 200
+        response = promoted.get('/api/v1/users/')
+        assert response.status_code == 401 and response.json()['code'] == 'token_revoked', (
+            'Проверьте, что после понижения роли выданные раньше токены отклоняются'
+        )
+        moderator.refresh_from_db()
+        assert role_client(moderator).get('/api/v1/users/').status_code == 403
+        current = role_client(moderator)
+        current.patch('/api/v1/users/me/', data={'first_name': 'Имя'})
+        assert current.get('/api/v1/users/me/').status_code == 200, (
+            'Проверьте, что изменение профиля без полей токена не отзывает токены'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_04_writes(self, admin_client, user):
+        titles, _, _ = create_titles(admin_client)
+        client = role_client(user)
+        response = client.post(f'/api/v1/titles/{titles[0]["id"]}/reviews/', data={'text': 'Отзыв', 'score': 7})
+        assert response.status_code == 201 and response.json()['author'] == user.username, (
+            'Проверьте, что запись с токеном с ролью сохраняет автора'
+        )
+        review_id = response.json()['id']
+        assert client.get(f'/api/v1/titles/{titles[0]["id"]}/reviews/{review_id}/').status_code == 200
+        assert client.delete(f'/api/v1/titles/{titles[0]["id"]}/reviews/{review_id}/').status_code == 204
+
+    @pytest.mark.django_db
+    @override_settings(USER_SNAPSHOT_LOCAL_TIMEOUT=0)
+    def test_05_version_expires(self, admin):
+        client = role_client(admin)
+        assert client.get('/api/v1/users/').status_code == 200
+        User.objects.filter(id=admin.id).update(token_version=F('token_version') + 1)
+        assert client.get('/api/v1/users/').status_code == 401, (
+            'Проверьте, что версия токенов в кэше процесса устаревает через '
+            '`USER_SNAPSHOT_LOCAL_TIMEOUT` секунд и изменение в другом процессе '
+            'отзывает токены'
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_06_bulk_role_change(self, tmp_path):
+        data_dir = tmp_path / 'data'
+        shutil.copytree(os.path.join(settings.BASE_DIR, 'static', 'data'), data_dir)
+        options = {
+            'data_dir': str(data_dir), 'state_file': str(tmp_path / 'state.json'),
+            'reject_file': str(tmp_path / 'rejects.csv'),
+        }
+        call_command('load_csv', stdout=StringIO(), **options)
+        users_csv = data_dir / 'users.csv'
+        with open(users_csv, encoding='utf-8') as csv_file:
+            users = list(csv.DictReader(csv_file))
+        admin_row = next(row for row in users if row['role'] == 'admin')
+        admin = User.objects.get(id=admin_row['id'])
+        client = role_client(admin)
+        assert client.get('/api/v1/users/').status_code == 200
+        admin_row['role'] = 'user'
+        with open(users_csv, 'w', encoding='utf-8', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=users[0].keys())
+            writer.writeheader()
+            writer.writerows(users)
+        call_command('load_csv', delta=True, stdout=StringIO(), **options)
+        response = client.get('/api/v1/users/')
+        assert response.status_code == 401 and response.json()['code'] == 'token_revoked', (
+            'Проверьте, что смена роли через `load_csv --delta` отзывает токены пользователя'
+        )
+        assert role_client(User.objects.get(id=admin.id)).get('/api/v1/users/').status_code == 403
+        untouched = User.objects.exclude(id=admin.id).values_list('token_version', flat=True)
+        assert set(untouched) == {0}, (
+            'Проверьте, что `load_csv --delta` не отзывает токены пользователей без изменений'
+        )